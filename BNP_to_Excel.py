@@ -2,6 +2,7 @@ import streamlit as st
 import os
 from PIL import Image
 from src.Monthly_Summary import *
+from src.importer import read_workbook
 
 def process(pdf_path, destination_name):
     # Placeholder for the processing logic that uses functions from the src module
@@ -48,9 +49,11 @@ if st.button("Run"):
                 mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
             )
 
-        # Display the contents of the Excel file
-        df = pd.read_excel(excel_file_path)
-        st.dataframe(df)
+        # Display the contents of the Excel file, read back from the month sheets
+        for month in read_workbook(excel_file_path):
+            st.subheader(month.sheet.replace("_", " "))
+            st.write(f"Budget: {month.budget} €, remaining budget: {month.remaining_budget} €")
+            st.dataframe(month.operations)
 
     else:
         st.warning("Please upload a PDF file and provide a destination file name.")
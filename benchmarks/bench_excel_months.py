@@ -0,0 +1,66 @@
+###########################################################################################
+
+################## This package has been written by JB LBT (c) 2024 #######################
+################## Under the GNU GPL v3.0 Licence                   #######################
+
+###########################################################################################
+
+# Time of to_excel when a workbook is filled month after month with synthetic monthly summaries.
+# Usage: python benchmarks/bench_excel_months.py [--months 24] [--operations 80] [--file Output/bench_months.xlsx]
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+from src.Monthly_Summary import Monthly_Summary
+from src.utils import CATEGORY_LIST
+
+
+def make_summary(month, n_operations, rng):
+    """Build a monthly summary with random operations, without any PDF."""
+    start = pd.Timestamp("2020-01-01") + pd.DateOffset(months=month)
+    dates = start + pd.to_timedelta(np.sort(rng.integers(0, 28, n_operations)), unit="D")
+    operations = pd.DataFrame({"Date": dates,
+                               "Description": [f"CARTE X1234 OPERATION {i}" for i in range(n_operations)],
+                               "Operation Date": dates,
+                               "Debit (€)": np.round(rng.uniform(0, 100, n_operations), 2),
+                               "Credit (€)": np.where(np.arange(n_operations) == 0, 2000.0, 0.0),
+                               "Category": rng.choice(CATEGORY_LIST + ["Other"], n_operations)})
+    summary = Monthly_Summary("bench.pdf", start.month, start.year, operations, verbose=0, do_log=False, handle_errors=False, dedup=False)
+    summary.start_date, summary.end_date = start, start + pd.DateOffset(months=1)
+    summary.opening_balance = 1000.0
+    summary.add_monthly_budget(500)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the writing of many months in one workbook")
+    parser.add_argument("--months", type=int, default=24, help="Number of months written")
+    parser.add_argument("--operations", type=int, default=80, help="Number of operations per month")
+    parser.add_argument("--file", type=str, default="Output/bench_months.xlsx", help="The workbook to write (overwritten)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    summaries = [make_summary(m, args.operations, rng) for m in range(args.months)]
+    folder = os.path.dirname(args.file)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    if os.path.exists(args.file):
+        os.remove(args.file)
+
+    times = []
+    for summary in summaries:
+        start = time.perf_counter()
+        summary.to_excel(args.file)
+        times.append(time.perf_counter() - start)
+    print(f"{args.months} months of {args.operations} operations: {sum(times):.2f}s "
+          f"(first month {times[0]*1000:.0f} ms, last month {times[-1]*1000:.0f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+###########################################################################################
+
+################## This package has been written by JB LBT (c) 2024 #######################
+################## Under the GNU GPL v3.0 Licence                   #######################
+
+###########################################################################################
+
+# Batch extraction against a local fake backend injecting latency, errors and hung calls,
+# without and with the retry / timeout / rate-limit / circuit-breaker layer of the extraction engine.
+# Usage: python benchmarks/bench_extraction_resilience.py [--files 40] [--workers 8] [--failure 0.2] [--hang 0.05]
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.extraction import Extraction_Engine
+
+
+class Page:
+    """Extracted page, with the attributes of a LlamaParse Document used by the parser."""
+    def __init__(self, text, file_path):
+        self.text = text
+        self.metadata = {"file_path": file_path}
+
+
+def make_handler(latency, failure, hang, hang_seconds, seed):
+    rnd = random.Random(seed)
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            with lock:
+                draw, delay = rnd.random(), rnd.uniform(0, 2 * latency)
+            if draw < hang:
+                time.sleep(hang_seconds)
+            time.sleep(delay)
+            if hang <= draw < hang + failure:
+                self.send_response(503)
+                self.end_headers()
+                return
+            pages = [f"RELEVE DE COMPTE {body['document']} page {i}" for i in range(3)]
+            payload = json.dumps({"pages": pages}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def http_backend(url):
+    """Backend of the extraction engine calling the fake server."""
+    def backend(document, mode):
+        request = urllib.request.Request(url, data=json.dumps({"document": document, "mode": mode}).encode("utf-8"),
+                                         headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request) as response:
+            pages = json.loads(response.read())["pages"]
+        return [Page(text, document) for text in pages]
+    return backend
+
+
+def run(engine, files, workers):
+    def one(file):
+        try:
+            engine.extract(file)
+            return True
+        except Exception:
+            return False
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        ok = sum(pool.map(one, files))
+    return ok, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the extraction engine against a flaky local backend")
+    parser.add_argument("--files", type=int, default=40, help="Number of documents to extract")
+    parser.add_argument("--workers", type=int, default=8, help="Number of documents extracted in parallel")
+    parser.add_argument("--latency", type=float, default=0.05, help="Mean latency of the backend, in seconds")
+    parser.add_argument("--failure", type=float, default=0.2, help="Probability of a 503 error")
+    parser.add_argument("--hang", type=float, default=0.05, help="Probability of a hung call")
+    parser.add_argument("--hang_seconds", type=float, default=5.0, help="Duration of a hung call, in seconds")
+    parser.add_argument("--rate", type=float, default=50.0, help="Rate limit of the resilient engine, in calls per second")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(args.latency, args.failure, args.hang, args.hang_seconds, seed=0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/parse"
+    files = [f"statement_{i:03d}.pdf" for i in range(args.files)]
+    print(f"Fake backend on {url}: latency {args.latency}s, {args.failure:.0%} errors, {args.hang:.0%} hung calls of {args.hang_seconds}s")
+
+    naive = Extraction_Engine(backend=http_backend(url), retries=0, call_timeout=None, failure_threshold=10**9)
+    ok, elapsed = run(naive, files, args.workers)
+    print(f"Single call        : {ok}/{len(files)} documents in {elapsed:6.2f}s  {naive.stats}")
+
+    resilient = Extraction_Engine(backend=http_backend(url), retries=4, backoff=0.05, max_backoff=1.0,
+                                  call_timeout=10 * args.latency + 0.5, rate=args.rate, failure_threshold=20, reset_timeout=1.0)
+    ok, elapsed = run(resilient, files, args.workers)
+    print(f"Retry/timeout/rate : {ok}/{len(files)} documents in {elapsed:6.2f}s  {resilient.stats}")
+
+    resilient.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+###########################################################################################
+
+################## This package has been written by JB LBT (c) 2024 #######################
+################## Under the GNU GPL v3.0 Licence                   #######################
+
+###########################################################################################
+
+# Benchmark of the single-pass markdown scanner against the previous split-based parser.
+# Usage: python benchmarks/bench_markdown_parser.py [--pages 500] [--rows 40] [--repeat 5]
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+from src.scanner import scan_markdown_page
+
+
+HEADER = "|Date|Nature des opérations|Valeur|Débit|Crédit|\n|---|---|---|---|---|\n"
+LABELS = ["PRLV SEPA FREE MOBILE", "CARTE X1234 12/06 RATP", "VIR CPTE A CPTE EMIS", "CARTE X1234 13/06 LECLERC", "VIR SEPA RECU SALAIRE"]
+
+
+def make_page(n_rows, first = False, last = False, seed = 0):
+    """Build a synthetic markdown page similar to the LlamaParse output of a BNP statement."""
+    rnd = random.Random(seed)
+    text = ""
+    if first:
+        text += "# RELEVE DE COMPTE CHEQUES\n\ndu 21 juin 2024 au 22 juillet 2024\n\n"
+    text += "P. 1/2 RIB : 30004 00000 00000000000 00\n\n"
+    text += HEADER
+    if first:
+        text += "| |SOLDE CREDITEUR AU 21.06.2024| | |1 234,56|\n"
+    for _ in range(n_rows):
+        day = rnd.randint(1, 28)
+        amount = f"{rnd.randint(1, 999)},{rnd.randint(0, 99):02d}"
+        label = rnd.choice(LABELS)
+        if rnd.random() < 0.8:
+            text += f"|{day:02d}.06|{label}|{day:02d}.06|{amount}| |\n"
+        else:
+            text += f"|{day:02d}.06|{label}|{day:02d}.06| |{amount}|\n"
+    if last:
+        text += "|TOTAL DES OPERATIONS| | |10 000,00|12 000,00|\n"
+        text += "|SOLDE CREDITEUR AU 22.07.2024| | | |3 234,56|\n"
+    text += "\nBNP PARIBAS SA au capital de 2.499.597.122 €\n"
+    return text
+
+
+def legacy_parse(pages):
+    """Previous markdown path: split on the table separator and blank lines, rescan each page for the balance, trim df[:-2]."""
+    keys = ["Date", "Description", "Operation Date", "Debit (€)", "Credit (€)"]
+    df = pd.DataFrame(columns = keys)
+    for page in pages:
+        for line in page.split("\n"):
+            if "SOLDE CREDITEUR" in line:
+                break
+        info = page.split("|---|---|---|---|---|")[-1]
+        info = info.split("\n\n")[0]
+        data = []
+        for i in info.split("\n"):
+            d = i.split("|")[1:6]
+            if len(d) == 5 and d[0] != "":
+                data.append(dict(zip(keys, d)))
+        df = pd.concat([df, pd.DataFrame(data)], ignore_index=True)
+    df = df[:-2]
+    for column in ["Debit (€)", "Credit (€)"]:
+        df[column] = df[column].str.replace(" ", "").replace("", "0").str.replace(",", ".").astype(float)
+    return df
+
+
+def scanner_parse(pages):
+    """Current markdown path: one streaming scan per page emitting typed rows."""
+    rows = []
+    read_rows = True
+    for i, page in enumerate(pages):
+        scan = scan_markdown_page(page, rows = rows, read_rows = read_rows, first = i == 0)
+        if scan.closed:
+            read_rows = False
+    return pd.DataFrame(rows)
+
+
+def bench(func, pages, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(pages)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the markdown statement parsers")
+    parser.add_argument("--pages", type=int, default=500, help="Number of pages of the synthetic document")
+    parser.add_argument("--rows", type=int, default=40, help="Number of operations per page")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of runs, the best one is kept")
+    args = parser.parse_args()
+
+    pages = [make_page(args.rows, first = i == 0, last = i == args.pages - 1, seed = i) for i in range(args.pages)]
+    size = sum(len(p) for p in pages) / 1e6
+    print(f"Synthetic document: {args.pages} pages, {args.pages * args.rows} operations, {size:.1f} MB of markdown")
+
+    legacy_time, legacy_df = bench(legacy_parse, pages, args.repeat)
+    scanner_time, scanner_df = bench(scanner_parse, pages, args.repeat)
+
+    print(f"Legacy split parser : {legacy_time*1000:8.1f} ms ({len(legacy_df)} rows)")
+    print(f"Single-pass scanner : {scanner_time*1000:8.1f} ms ({len(scanner_df)} rows)")
+    print(f"Speed-up            : {legacy_time / scanner_time:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+###########################################################################################
+
+################## This package has been written by JB LBT (c) 2024 #######################
+################## Under the GNU GPL v3.0 Licence                   #######################
+
+###########################################################################################
+
+# Benchmark of the text mode parsing of a long statement, page by page in the main process against
+# a pool of page workers. The synthetic pages have descriptions continued at the top of the next page.
+# Usage: python benchmarks/bench_text_pages.py [--pages 2000] [--rows 45] [--workers 4]
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+from src.scanner import scan_text_page, scan_text_pages, get_page_pool
+
+HEADER = "Date     Nature des opérations          Valeur      Débit           Crédit"
+CHUNK = 64
+LABELS = ["PRLV SEPA FREE MOBILE", "CARTE X1234 12/06 RATP", "VIR CPTE A CPTE EMIS", "CARTE X1234 13/06 LECLERC", "VIR SEPA RECU SALAIRE"]
+
+
+def make_page(n_rows, first = False, last = False, seed = 0):
+    """Build a synthetic text page similar to the LlamaParse output of a BNP statement."""
+    rnd = random.Random(seed)
+    lines = []
+    if first:
+        lines += ["RELEVE DE COMPTE CHEQUES du 21 juin 2024 au 22 juillet 2024", "M JOHN DOE", "Monnaie du compte : Euro", HEADER,
+                  "         SOLDE CREDITEUR AU 21.06.2024                              1 234,56"]
+    else:
+        lines += [f"P. {seed + 1}", "RIB : 30004 00000", HEADER,
+                  # Description continued from the last operation of the previous page
+                  "         SUITE PAGE PRECEDENTE"]
+    for _ in range(n_rows):
+        day = rnd.randint(1, 28)
+        amount = f"{rnd.randint(1, 999)},{rnd.randint(0, 99):02d}"
+        label = rnd.choice(LABELS).ljust(30)
+        if rnd.random() < 0.8:
+            lines.append(f"{day:02d}.06    {label} {day:02d}.06       {amount}")
+        else:
+            lines.append(f"{day:02d}.06    {label} {day:02d}.06                       {amount}")
+        if rnd.random() < 0.2:
+            lines.append("         ECH/240624 ID EMETTEUR")
+    if last:
+        lines += ["         TOTAL DES OPERATIONS                       669,28          2 000,00",
+                  "         SOLDE CREDITEUR AU 22.07.2024                              2 565,28"]
+    lines += ["", "BNP PARIBAS SA"]
+    return "\n".join(lines)
+
+
+def merge(scans):
+    rows = []
+    for scan in scans:
+        if scan.continuation and rows:
+            rows[-1][1] += "".join(scan.continuation)
+        rows.extend(scan.rows)
+    return pd.DataFrame(rows, columns = ["Date", "Description", "Operation Date", "Debit (€)", "Credit (€)"])
+
+
+def serial(pages, workers):
+    return merge(scan_text_page(text, i == 0) for i, text in enumerate(pages))
+
+
+def parallel(pages, workers):
+    pool = get_page_pool(workers)
+    futures = [pool.submit(scan_text_pages, pages[i:i + CHUNK], i == 0) for i in range(0, len(pages), CHUNK)]
+    return merge(scan for f in futures for scan in f.result())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the text mode page parsing, serial against parallel")
+    parser.add_argument("--pages", type=int, default=2000, help="Number of pages of the synthetic document")
+    parser.add_argument("--rows", type=int, default=45, help="Number of operations per page")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of page workers")
+    args = parser.parse_args()
+
+    pages = [make_page(args.rows, first = i == 0, last = i == args.pages - 1, seed = i) for i in range(args.pages)]
+    print(f"Synthetic document: {args.pages} pages, {sum(len(p) for p in pages) / 1e6:.1f} MB of text")
+
+    start = time.perf_counter()
+    serial_df = serial(pages, 1)
+    serial_time = time.perf_counter() - start
+    start = time.perf_counter()
+    parallel(pages, args.workers)
+    cold_time = time.perf_counter() - start
+    # Second document: the shared pool is already started
+    start = time.perf_counter()
+    parallel_df = parallel(pages, args.workers)
+    parallel_time = time.perf_counter() - start
+
+    print(f"Serial              : {serial_time*1000:8.1f} ms ({len(serial_df)} rows)")
+    print(f"{args.workers} page workers{' ' * max(0, 6 - len(str(args.workers)))}: {parallel_time*1000:8.1f} ms ({len(parallel_df)} rows, {cold_time*1000:.1f} ms with the pool start)")
+    print(f"Same result         : {serial_df.equals(parallel_df)}")
+    print(f"Speed-up            : {serial_time / parallel_time:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,13 +10,27 @@
 import os
 import nest_asyncio
 import os
+import numpy as np
 import pandas as pd
 from functools import wraps
 from datetime import datetime
-from llama_parse import LlamaParse
-from pickle import dump, load
 #from dotenv import load_dotenv
 from src.utils import *
+from src.scanner import scan_markdown_page, scan_text_page, scan_text_pages, get_page_pool
+from src.reconcile import reconcile
+from src.extraction import get_engine
+from src.categories import get_memo
+from src.suggester import get_suggester
+from src.journal import Change_Journal
+from src.ledger import get_ledger
+from src.search import get_search_index, save_search_indexes
+from src.balance import daily_balance
+from src.charts import render_pie, category_chart
+from src.excel_template import new_month_sheet, add_month_charts, OPERATION_COLUMNS, HEADER_ROW, SUMMARY_COL, DEBIT_ROW, CREDIT_ROW, SAVING_ROW, BALANCE_ROW, HEADER_STYLE, ROW_STYLES, DATE_STYLES, TOTAL_STYLE
+from src.checkpoint import Checkpoint_Journal
+from src.dedup import Fingerprint_Index
+from src.overview import write_overview
+from src.batch import resolve_inputs, batch_main
 
 with open("llamaparse_key.txt", "r") as f:
     os.environ["LLAMA_CLOUD_API_KEY"] = f.read().strip()
@@ -31,7 +45,6 @@ months_mapping_inv = {v: k for k, v in months_mapping.items()}
 #ACCOUNT_ID = os.getenv("ACCOUNT_ID")
 ACCOUNT_ID = "JB_courant"
 CATEGORY_LIST = ["Transports", "Vie quotidienne", "Logement", "Loisirs", "Santé", "Impôts", "Banque", "Salaire", "Epargne", "Autre"]
-LOG_FOLDER = "logs"
 if not os.path.exists(LOG_FOLDER):
     os.makedirs(LOG_FOLDER)
 
@@ -98,6 +111,10 @@ class Statement_Parser:
             self.ask_rules = False
         if "handle_errors" not in kwargs and not hasattr(self, "handle_errors"):
             self.handle_errors = True
+        if "page_workers" not in kwargs and not hasattr(self, "page_workers"):
+            self.page_workers = 1
+        if "page_chunk" not in kwargs and not hasattr(self, "page_chunk"):
+            self.page_chunk = 64
 
         return None
     
@@ -110,18 +127,19 @@ class Statement_Parser:
                 self.logger.error("No data to format", title="ERROR when formatting parser data")
                 raise ValueError("No data to format")
             
-        try:            
-            # Fill the missing values and blanks " " with 0
-            self.data["Debit (€)"] = self.data["Debit (€)"].str.replace(" ", "")
-            self.data["Credit (€)"] = self.data["Credit (€)"].str.replace(" ", "")
-            
-            # Fill the empty values with 0
-            self.data["Debit (€)"] = self.data["Debit (€)"].replace("", "0")
-            self.data["Credit (€)"] = self.data["Credit (€)"].replace("", "0")
-            
-            # Convert the amounts to float
-            self.data["Debit (€)"] = self.data["Debit (€)"].str.replace(",", ".").astype(float)
-            self.data["Credit (€)"] = self.data["Credit (€)"].str.replace(",", ".").astype(float)
+        try:
+            for column in ["Debit (€)", "Credit (€)"]:
+                # The markdown scanner already emits typed amounts
+                if pd.api.types.is_numeric_dtype(self.data[column]):
+                    continue
+                # Fill the missing values and blanks " " with 0
+                self.data[column] = self.data[column].str.replace(" ", "")
+
+                # Fill the empty values with 0
+                self.data[column] = self.data[column].replace("", "0")
+
+                # Convert the amounts to float
+                self.data[column] = self.data[column].str.replace(",", ".").astype(float)
 
         except Exception as e:
             self.logger.error(f"Error while formatting the operations amounts: {e}", title = "Formatting error")
@@ -159,285 +177,179 @@ class Statement_Parser:
         return None
     
     def load_document(self):
-        """Load the PDF file and parse it to extract the operations."""
-        from llama_parse import LlamaParse
-        parser = LlamaParse( # can also be set in your env as LLAMA_CLOUD_API_KEY
-            result_type=self.mode,  # "markdown" and "text" are available
-            num_workers=4,  # if multiple files passed, split in `num_workers` API calls
-            verbose=False,
-            language="en",  # Optionally you can define a language, default=en
-        )
-
-        self.parsed_document = None
-
-        pickle_file = f"{self.document.split('.')[0]}_{self.mode}.pkl"
-        if os.path.exists(pickle_file):
-            try:
-                with open(pickle_file, "rb") as f:
-                    self.parsed_document = load(f)
-                    self.logger.log(f"Document {self.document} successfully loaded from pickle file {pickle_file}")
-                    return None
-            except Exception as e:
-                self.logger.error(f"Error while loading the pickle file: {e}", title = "Loading error")
-                self.logger.warning("Deleting the pickle file and parsing the document from scratch")
-                os.remove(pickle_file)
-                self.logger.warning("Parsing the document from scratch")
-
-        # sync
-        try:
-            documents = parser.load_data(self.document)
-        except Exception as e:
-            self.logger.error(f"Error while loading the document: {e}", title = "Loading error")
-            if not self.handle_errors:
-                raise e
-            
-        self.logger.log(f"Document successfully loaded in mode {self.mode}")
-        self.parsed_document = documents
-        dump(documents, open(pickle_file, "wb"))
-        self.logger.log(f"Document successfully saved to pickle file {pickle_file}")
+        """Load the PDF file and extract its pages with the shared extraction engine."""
+        engine = self.engine if getattr(self, "engine", None) is not None else get_engine()
+        self.parsed_document = engine.load(self.document, mode = self.mode, logger = self.logger, handle_errors = self.handle_errors)
         return None
     
-    def _check_operations(self, page):
-        if "Crédit" and "Débit" in page:
-            return True
-
-        return False
-    
-    def _strip_first_page(self, page):
-
-        try:
-            for i, line in enumerate(page.split("\n")):
-                if "RELEVE DE COMPTE" in line:
-                    break
-            line = line.split("du")[1].split("au")[0].strip()[-4:]
-            self.start_year = int(line)
-        except Exception as e:
-            self.logger.error(f"Error while getting the start year: {e}", title = "Parsing error")
-            self.start_year = 2000
-            if not self.handle_errors:
-                raise e
-            
-        try:
-            for i, line in enumerate(page.split("\n")):
-                if "SOLDE CREDITEUR AU" in line:
-                    break
-            line = line.split("AU")[1].strip()[:15].strip()
-            # Convert from dd.mm.yyyy to datetime
-            self.start_date = pd.to_datetime(line, format="%d.%m.%Y")
-        except Exception as e:
-            self.logger.error(f"Error while getting the start date: {e}", title = "Parsing error")
-
-            if not self.handle_errors:
-                raise e 
-
+    def _text_pages(self):
+        """Texts of the pages to scan in text mode, decoded lazily and up to the "TOTAL DES OPERATIONS" page."""
+        for doc in self.parsed_document:
+            yield doc.text
+            if "TOTAL DES OPERATIONS" in doc.text:
+                return
+
+    def _scan_text_pages(self):
+        """Scan the pages in text mode, in a process pool if page_workers > 1. The scans are yielded in page order."""
+        workers = self.page_workers or 1
+        if workers <= 1:
+            for i, text in enumerate(self._text_pages()):
+                yield scan_text_page(text, i == 0)
+            return
+
+        # The pool is shared by the documents of the process, starting it for each document costs more than the scan
+        pool = get_page_pool(workers)
+        # Submit the pages by chunks as they are decoded, the results are collected in page order
+        futures, chunk = [], []
+        for text in self._text_pages():
+            chunk.append(text)
+            if len(chunk) == self.page_chunk:
+                futures.append(pool.submit(scan_text_pages, chunk, len(futures) == 0))
+                chunk = []
+        if chunk:
+            futures.append(pool.submit(scan_text_pages, chunk, len(futures) == 0))
+        for future in futures:
+            yield from future.result()
 
-        if "TOTAL DES OPERATIONS" in page:
-            try:
-                for i in range(len(page.split("\n"))-1, 0, -1):
-                    line = page.split("\n")[i]
-                    if "SOLDE CREDITEUR AU" in line:
-                        break
-                line = line.split("AU")[1].strip()[:15].strip()
-                # Convert from dd.mm.yyyy to datetime
-                self.end_date = pd.to_datetime(line, format="%d.%m.%Y")
-            except Exception as e:
-                self.logger.error(f"Error while getting the end date: {e}", title = "Parsing error")
-
-                if not self.handle_errors:
-                    raise e 
-            page = page.split("TOTAL DES OPERATIONS")[0]
-        else:
-            page = page.split("BNP PARIBAS SA")[0]
-
-        page = page.split("Monnaie du compte : Euro")[1]
-        page_lines = page.split("\n")
-        page_lines = [line for line in page_lines if line]
-        return page_lines
-    
-    def _strip_reg_page(self, page):
-        if "TOTAL DES OPERATIONS" in page:
-            try:
-                for i in range(len(page.split("\n"))-1, 0, -1):
-                    line = page.split("\n")[i]
-                    if "SOLDE CREDITEUR AU" in line:
-                        break
-                line = line.split("AU")[1].strip()[:15].strip()
-                # Convert from dd.mm.yyyy to datetime
-                self.end_date = pd.to_datetime(line, format="%d.%m.%Y")
-            except Exception as e:
-                self.logger.error(f"Error while getting the end date: {e}", title = "Parsing error")
-
-                if not self.handle_errors:
-                    raise e 
-            page = page.split("TOTAL DES OPERATIONS")[0]
-        else:
-            page = page.split("\n\n")[-2]
-        page_lines = page.split("\n")
-        for i, l in enumerate(page_lines):
-            if "RIB" in l:
-                page_lines = page_lines[i+1:]
-                break
-
-        page_lines = [line for line in page_lines if line]
-        return page_lines
-    
-    def _parse_page_txt(self, page_lines):
-        data = []
-        keys = ["Date", "Description", "Operation Date", "Debit (€)", "Credit (€)"]
-        try:
-            headers = page_lines[0]
-            # find the index of "Nature des opérations"
-            desc_index = headers.index("Nature des opérations")
-            # find the index of "Valeur"
-            valeur_index = headers.index("Valeur")
-            # find the index of "Débit"
-            debit_index = headers.index("Débit")
-            # find the index of "Crédit"
-            credit_index = headers.index("Crédit")
-
-        except Exception as e:
-            self.logger.error(f"Error while parsing the headers of the operations: {e}", title = "Parsing error")
-            if not self.handle_errors:
-                raise e
-
-        page_lines = [p for p in page_lines if "SOLDE CREDITEUR" not in p]
-
-        for line in page_lines[1:]:
-
-            if len(line) <= valeur_index:
-                data[-1]["Description"] += line.strip()
-
-            else:
-                date = line[:desc_index-2].strip()
-                description = line[desc_index-2:valeur_index-2].strip()
-                valeur = line[valeur_index-2:valeur_index+10].strip()
-                if len(line) < credit_index-4:
-                    debit = line[valeur_index+10:].strip()
-                    debit = debit.replace(" ", "")
-                    credit = "0.0"
-                else:
-                    debit = "0.0"
-                    credit = line[valeur_index+10:].strip()
-                    credit = credit.replace(" ", "")
-
-                values = [date, description, valeur, debit, credit]
-                data.append(dict(zip(keys, values)))
-
-        # convert to dataframe
-        df = pd.DataFrame(data)
-        return df
-    
     def _parse_doc_txt(self):
-        df = pd.DataFrame()
-        self.logger.log("Parsing document in text mode")
-        for i in range(len(self.parsed_document)):
-            page = self.parsed_document[i].text
-            if self._check_operations(page):
-                if i == 0:
-                    page_lines = self._strip_first_page(page)
-                    self.logger.log(f"Stripping first page {i}")
-                else:
-                    page_lines = self._strip_reg_page(page)
-                    self.logger.log(f"Stripping regular page {i}")
+        """Parse the document in text mode, page by page, until the "TOTAL DES OPERATIONS" line.
 
-                page_df = self._parse_page_txt(page_lines)
-                self.logger.log(f"Page {i} successfully parsed, {len(page_df)} operations found")
-                df = pd.concat([df, page_df], axis=0)
-            else:
+        The pages are scanned independently (in parallel with page_workers > 1), then merged in page order:
+        the description lines at the top of a page are appended to the last operation of the previous page.
+        """
+        self.logger.log("Parsing document in text mode" + (f" with {self.page_workers} page workers" if (self.page_workers or 1) > 1 else ""))
+        self.start_year = None
+        self.page_balances = []
+        self.totals = None
+        rows = []
+        row_pages = []
+        for i, scan in enumerate(self._scan_text_pages()):
+            for message in scan.errors:
+                self.logger.error(message, title = "Parsing error")
+            if scan.errors and not self.handle_errors:
+                raise ValueError(scan.errors[0])
+
+            self.page_balances.extend((i, amount) for amount in scan.balances)
+            if scan.totals is not None and self.totals is None:
+                self.totals = scan.totals
+            if i == 0:
+                self.start_year = scan.year
+                if scan.start_date is not None:
+                    self.start_date = pd.to_datetime(scan.start_date, format="%d.%m.%Y")
+            if scan.end_date is not None:
+                self.end_date = pd.to_datetime(scan.end_date, format="%d.%m.%Y")
+
+            if not scan.has_operations:
                 self.logger.log(f"No operations found in page {i}")
+                continue
+            if scan.continuation and rows:
+                rows[-1][1] += "".join(scan.continuation)
+            rows.extend(scan.rows)
+            row_pages.extend([i] * len(scan.rows))
+            self.logger.log(f"Page {i} successfully parsed, {len(scan.rows)} operations found")
+            if scan.closed:
+                self.logger.log(f"End of the operations reached on page {i}, {len(self.parsed_document) - i - 1} page(s) skipped")
+
+        if self.start_year is None:
+            self.start_year = 2000
 
-        self.data = df
-        self.logger.log(f"Document successfully parsed, {len(df)} operations found")
+        self.data = pd.DataFrame(rows, columns = ["Date", "Description", "Operation Date", "Debit (€)", "Credit (€)"])
+        self.row_pages = np.array(row_pages, dtype=int)
+        self.logger.log(f"Document successfully parsed, {len(self.data)} operations found")
         return None
     
-    def _parse_operations_md(self, doc, page):
-        """Parse the operations from a parsed PDF document."""
-        d = doc.text
-        try:
-            info = d.split("|---|---|---|---|---|")[-1]
-            info = info.split("\n\n")[0]
-            infos = info.split("\n")
-        except Exception as e:
-            self.logger.error(f"Error parsing the PDF {self.document} on page {page}: {e}", title = "PDF parsing error")
-            if not self.handle_errors:
-                raise e
-
-        data = []
-        keys = ["Date", "Description", "Operation Date", "Debit (€)", "Credit (€)"]
-        for i in infos:
-            d = i.split("|")[1:6]
-            if len(d)==5 and d[0]!="":
-                data.append(dict(zip(keys, d)))
-
-        data = pd.DataFrame(data)
-        return data
-    
     def _parse_doc_md(self):
-
-        try:
-            chunks = self.parsed_document[0].text.split("\n")
-
-            # get the first chunk that contains "RELEVE DE COMPTE "
-            for date in chunks:
-                if "RELEVE DE COMPTE" in date:
-                    break
-            
-            date = date.split("du")[1].split("au")[0].strip()[-4:]
-            self.start_year = int(date)
-        except Exception as e:
-            self.logger.error(f"Error when getting the start year: {e}", title = "Parsing error")
-            self.start_year = 2000
-            if not self.handle_errors:
-                raise e
-            
-
-        df = pd.DataFrame(columns = ["Date", "Description", "Operation Date", "Debit (€)", "Credit (€)"])
+        """Parse the document in markdown mode, scanning each page once for balances, totals and operation rows."""
         self.logger.log("Parsing document in markdown mode")
+        self.start_year = None
+        self.page_balances = []
+        self.totals = None
+        rows = []
+        row_pages = []
+        balances = []
+        read_rows = True
         if self.parsed_document is not None:
             for page, doc in enumerate(self.parsed_document):
                 try:
-                    for line in doc.text.split("\n"):
-                        if "SOLDE CREDITEUR" in line:
-                            break
-
-                    line = line.split("AU")[1].strip()[:15].strip()
-                    # Convert from dd.mm.yyyy to datetime
-                    if page == 0:
-                        self.start_date = pd.to_datetime(line, format="%d.%m.%Y")
-                        # Set end date to start date + 1 month
-                        self.end_date = self.start_date + pd.DateOffset(months=1)
-                    else:
-                        self.end_date = pd.to_datetime(line, format="%d.%m.%Y")
-
-                    data = self._parse_operations_md(doc, page)
-                    self.logger.log(f"Operations from page {page} successfully parsed")
+                    scan = scan_markdown_page(doc.text, rows = rows, read_rows = read_rows, first = page == 0)
                 except Exception as e:
                     self.logger.error(f"Error parsing the PDF {self.document} on page {page}: {e}", title = "PDF parsing error")
                     if not self.handle_errors:
                         raise e
-                    else:
-                        continue
-
-                # Add the new data to the existing DataFrame
-                df = pd.concat([df, data], ignore_index=True)
+                    continue
+
+                if self.start_year is None and scan.year is not None:
+                    self.start_year = scan.year
+                balances.extend(scan.balances)
+                self.page_balances.extend((page, amount) for _, amount in scan.balances)
+                row_pages.extend([page] * (len(rows) - len(row_pages)))
+                if scan.totals is not None and self.totals is None:
+                    self.totals = scan.totals
+                self.logger.log(f"Page {page} scanned: {scan.tables} table(s), {len(scan.rows)} operations found")
+                if scan.closed:
+                    read_rows = False
+                if not read_rows and len(balances) > 1:
+                    # The operations and the closing balance were read, the following pages are not decoded
+                    self.logger.log(f"End of the operations reached on page {page}, {len(self.parsed_document) - page - 1} page(s) skipped")
+                    break
 
-                self.logger.log(f"Operations from page {page} successfully added")
+        if self.start_year is None:
+            self.logger.error("Error when getting the start year: no \"RELEVE DE COMPTE\" header found", title = "Parsing error")
+            self.start_year = 2000
+            if not self.handle_errors:
+                raise ValueError("No start year found")
 
+        try:
+            self.start_date = pd.to_datetime(balances[0][0], format="%d.%m.%Y")
+            if len(balances) > 1:
+                self.end_date = pd.to_datetime(balances[-1][0], format="%d.%m.%Y")
+            else:
+                # Set end date to start date + 1 month
+                self.end_date = self.start_date + pd.DateOffset(months=1)
+        except Exception as e:
+            self.logger.error(f"Error while getting the start and end dates: {e}", title = "Parsing error")
+            if not self.handle_errors:
+                raise e
 
-        # delete the last 2 lines of the DataFrame as they are not operations
-        self.data = df[:-2]
-        if len(self.data)>0 and "SOLDE CREDITEUR" in self.data.iloc[0]["Description"]:
-            self.data = self.data[1:]
+        self.data = pd.DataFrame(rows, columns = ["Date", "Description", "Operation Date", "Debit (€)", "Credit (€)"])
+        self.row_pages = np.array(row_pages, dtype=int)
+        self.logger.log(f"Document successfully parsed, {len(self.data)} operations found")
 
     def parse_document(self):
-        if self.mode == "text":
-            self._parse_doc_txt()
-        else:
-            self._parse_doc_md()
+        try:
+            if self.mode == "text":
+                self._parse_doc_txt()
+            else:
+                self._parse_doc_md()
+        finally:
+            # Unmap the page cache once parsed, an open mapping blocks the replacement or removal of the file on Windows
+            if hasattr(self.parsed_document, "close"):
+                self.parsed_document.close()
+
+        # The first printed balance is the opening balance, the last one the closing balance
+        amounts = [amount for _, amount in getattr(self, "page_balances", []) if amount is not None]
+        self.opening_balance = amounts[0] if amounts else None
+        self.closing_balance = amounts[-1] if len(amounts) > 1 else None
 
         self.format_dataframe()
         return self.data
 
+    def reconcile(self, tolerance = 0.005):
+        """Check the parsed operations against the opening, intermediate and closing balances and the totals printed on the statement.
+
+        Parameters:
+        -----------
+        tolerance : float, optional
+            The maximum absolute difference accepted, in euros.
+
+        Returns:
+        --------
+        reconciliation : Reconciliation
+            The pass/fail result, with the closing difference and the per-page discrepancies.
+        """
+        return reconcile(self.data, getattr(self, "page_balances", []), totals = getattr(self, "totals", None),
+                         pages = getattr(self, "row_pages", None), tolerance = tolerance)
+
 
 
 class Monthly_Summary:
@@ -454,6 +366,7 @@ class Monthly_Summary:
         
         - add_operations: load the PDF file, parse the operations and add them to the DataFrame
         - modify_operation: modify an operation in the DataFrame
+        - modify_operations: modify several operations at once, with a change journal
         - plot_categories: plot a pie chart of the categories
         - get_stats: get the statistics of the monthly summary
         - summary: print a summary of the monthly report
@@ -461,6 +374,7 @@ class Monthly_Summary:
         - compute_remaining_budget: compute the remaining budget
         - to_csv: save the monthly summary to a CSV file
         - to_excel: save the monthly summary to an Excel file
+        - category_totals: get the (cached) debit and credit totals of each category
 
 
         Attributes:
@@ -504,6 +418,12 @@ class Monthly_Summary:
         - end_date: datetime
             The end date of the operations.
 
+        - opening_balance: float
+            The balance printed at the start of the statement, None if it could not be read.
+
+        - closing_balance: float
+            The balance printed at the end of the statement, None if it could not be read.
+
         - budget: float
             The budget of the month.
 
@@ -532,7 +452,68 @@ class Monthly_Summary:
             
         **kwargs : dict
             Additional keyword arguments to pass to the class.
-            Examples: verbose (bool), do_log (bool, if True, logs will be saved to a file), formatting (bool, if True, logs will be formatted), rules_file (str, the path to the rules file), ask_rules (bool, if True, the user will be asked to provide rules for the categories), handle_errors (bool, if True, errors will be handled and logged)
+            The supported keyword arguments are:
+
+            verbose : bool, optional
+                If True, the logs are printed. Default is True.
+
+            do_log : bool, optional
+                If True, the logs are saved to a file. Default is True.
+
+            formatting : bool, optional
+                If True, the logs are formatted. Default is True.
+
+            rules_file : str, optional
+                The path to the rules file. Default is "ACCOUNT_ID_rules.txt".
+
+            ask_rules : bool, optional
+                If True, the user is asked to provide rules for the uncategorized operations. Default is False.
+
+            handle_errors : bool, optional
+                If True, the errors are logged instead of raised. Default is True.
+
+            engine : Extraction_Engine, optional
+                The extraction engine to use instead of the shared one.
+
+            use_memo : bool, optional
+                If True, the categories are memoized by normalized description across runs. Default is True.
+
+            memo_file : str, optional
+                The path to the category memo file. Default is in the cache folder.
+
+            suggester_file : str, optional
+                The path to the category suggester model, enables the suggestions for the uncategorized operations.
+
+            min_confidence : float, optional
+                The minimum confidence of a suggestion to replace "Other". Default is 0.6.
+
+            min_evidence : int, optional
+                The minimum number of informative tokens a description must share with the suggested category
+                for the suggestion to replace "Other". Default is 1.
+
+            journal_file : str, optional
+                The path to the change journal of the manual corrections, replayed when the operations are parsed again.
+
+            ledger_file : str, optional
+                The path to the SQLite ledger the operations are written to.
+
+            index_file : str, optional
+                The path to the search index the operations are added to.
+
+            page_workers : int, optional
+                The number of processes parsing the pages of a statement in text mode, for very long statements. Default is 1.
+
+            dedup : bool, optional
+                If True, to_excel leaves out the operations already written in another month of the workbook. Default is True.
+
+            static_totals : bool, optional
+                If True, to_excel writes the totals as values instead of formulas. Default is False.
+
+            checkpoint : Checkpoint_Journal, optional
+                The checkpoint journal recording the stages of the file (see process_files).
+
+            dest_file : str, optional
+                The workbook the summary is written to, the key of the file in the checkpoint journal.
             
         Returns:
         --------
@@ -583,6 +564,32 @@ class Monthly_Summary:
             self.ask_rules = False
         if "handle_errors" not in kwargs and not hasattr(self, "handle_errors"):
             self.handle_errors = True
+        if "use_memo" not in kwargs and not hasattr(self, "use_memo"):
+            self.use_memo = True
+        if "memo_file" not in kwargs and not hasattr(self, "memo_file"):
+            self.memo_file = None
+        if "static_totals" not in kwargs and not hasattr(self, "static_totals"):
+            self.static_totals = False
+        if "journal_file" not in kwargs and not hasattr(self, "journal_file"):
+            self.journal_file = None
+        if "suggester_file" not in kwargs and not hasattr(self, "suggester_file"):
+            self.suggester_file = None
+        if "min_confidence" not in kwargs and not hasattr(self, "min_confidence"):
+            self.min_confidence = 0.6
+        if "min_evidence" not in kwargs and not hasattr(self, "min_evidence"):
+            self.min_evidence = 1
+        if "ledger_file" not in kwargs and not hasattr(self, "ledger_file"):
+            self.ledger_file = None
+        if "index_file" not in kwargs and not hasattr(self, "index_file"):
+            self.index_file = None
+        if "page_workers" not in kwargs and not hasattr(self, "page_workers"):
+            self.page_workers = 1
+        if "dedup" not in kwargs and not hasattr(self, "dedup"):
+            self.dedup = True
+        if "checkpoint" not in kwargs and not hasattr(self, "checkpoint"):
+            self.checkpoint = None
+        if "dest_file" not in kwargs and not hasattr(self, "dest_file"):
+            self.dest_file = None
 
         return None
 
@@ -593,7 +600,8 @@ class Monthly_Summary:
         Parameters:
         -----------
         mode : str, optional
-            The mode to use to parse the PDF file. Can be "text" or "markdown". Default is "text".  
+            The mode to use to parse the PDF file. Can be "text", "markdown" or "auto" (text first, markdown only if the
+            operations do not reconcile with the printed balances). Default is "text".  
         **kwargs : dict
             Additional keyword arguments to pass to the class.
             Examples: verbose (bool), do_log (bool, if True, logs will be saved to a file), formatting (bool, if True, logs will be formatted), rules_file (str, the path to the rules file), ask_rules (bool, if True, the user will be asked to provide rules for the categories), handle_errors (bool, if True, errors will be handled and logged)
@@ -609,29 +617,87 @@ class Monthly_Summary:
         self.logger.formatting = self.formatting
 
 
-        self.parser = Statement_Parser(self.pdf, mode=mode, logger = self.logger, **kwargs)
-        self.parser.load_document()
-        
-        if self.parser.parsed_document is not None:
-            self.operations = self.parser.parse_document()
-            self.logger.log(f"Operations successfully added to the monthly summary for {self.month} {self.year}")
-
+        # Resume from the last stage checkpointed for this file, if any
+        self.reconciliation = None
+        checkpoint = self.checkpoint
+        stage = checkpoint.stage(self.pdf, self.dest_file) if checkpoint is not None else None
+        if stage in ["categorized", "written"]:
+            self.operations, info = checkpoint.load(self.pdf, "categorized")
+            self._restore_dates(info)
+            self.logger.log(f"{len(self.operations)} categorized operations of {self.pdf} restored from the checkpoint journal")
+        else:
+            if stage == "parsed":
+                self.operations, info = checkpoint.load(self.pdf, "parsed")
+                self._restore_dates(info)
+                self.logger.log(f"{len(self.operations)} parsed operations of {self.pdf} restored from the checkpoint journal")
+            else:
+                parsed = False
+                try:
+                    self._parse_statement(mode, kwargs)
+                    parsed = True
+                except Exception as e:
+                    self.logger.error(f"Error while parsing the operations of {self.pdf}: {e}", title = "Parsing error")
+                    if not self.handle_errors:
+                        raise e
+                if parsed and self.parser.parsed_document is not None:
+                    self.start_date = getattr(self.parser, "start_date", None)
+                    self.end_date = getattr(self.parser, "end_date", None)
+                    self.opening_balance = getattr(self.parser, "opening_balance", None)
+                    self.closing_balance = getattr(self.parser, "closing_balance", None)
+                    self.logger.log(f"Operations successfully added to the monthly summary for {self.month} {self.year}")
+                    if checkpoint is not None:
+                        checkpoint.mark(self.pdf, "parsed", self.operations, **self._checkpoint_dates())
 
-        try:
-            self.operations = self.add_category(self.operations, ask_rules = self.ask_rules, rules_file = self.rules_file)
-            self.logger.log(f"Categories added to the monthly summary for {self.month} {self.year}")
-        except Exception as e:
-            self.logger.error(f"Error adding categories to the monthly summary: {e}", title = "Category error")
-            if not self.handle_errors:
-                raise e
+            try:
+                self.operations = self.add_category(self.operations, ask_rules = self.ask_rules, rules_file = self.rules_file)
+                self.logger.log(f"Categories added to the monthly summary for {self.month} {self.year}")
+                if checkpoint is not None:
+                    checkpoint.mark(self.pdf, "categorized", self.operations)
+            except Exception as e:
+                self.logger.error(f"Error adding categories to the monthly summary: {e}", title = "Category error")
+                if not self.handle_errors:
+                    raise e
         
-        # sort the operations by date
-        self.operations = self.operations.sort_values(by="Date")
+        # sort the operations by date, the index is the position of the operation in the month
+        self.operations = self.operations.sort_values(by="Date", kind="stable").reset_index(drop=True)
+        self.fingerprints = operation_fingerprints(self.operations)
+
+        # Replay the manual corrections recorded for these operations
+        if self.journal_file is not None:
+            journal = Change_Journal(self.journal_file)
+            n = journal.replay(self.operations, self.fingerprints)
+            self.logger.log(f"{n} corrections replayed from the change journal {self.journal_file}")
+            if n and self.suggester_file is not None:
+                # The corrected categories replace the ones learnt from the rules
+                changes = journal.read()
+                corrected = self.fingerprints.isin(changes.loc[changes["col"] == "Category", "fp"]).values
+                if corrected.any():
+                    self._learn_categories(self.operations[corrected], self.fingerprints[corrected])
+
+        # Write the operations into the ledger, upserted on their fingerprint
+        if self.ledger_file is not None:
+            try:
+                n = get_ledger(self.ledger_file).add_operations(self.operations, self.fingerprints, source = self.pdf)
+                self.logger.log(f"{n} operations written to the ledger {self.ledger_file}")
+            except Exception as e:
+                self.logger.error(f"Error while writing the operations to the ledger: {e}", title = "Ledger error")
+                if not self.handle_errors:
+                    raise e
+
+        # Add the operations to the search index of the descriptions
+        if self.index_file is not None:
+            try:
+                # The index is saved at the end of the batch (save_search_indexes) or when the process exits
+                n = get_search_index(self.index_file).add_operations(self.operations, self.fingerprints, source = self.pdf)
+                self.logger.log(f"{n} operations added to the search index {self.index_file}")
+            except Exception as e:
+                self.logger.error(f"Error while adding the operations to the search index: {e}", title = "Search index error")
+                if not self.handle_errors:
+                    raise e
 
-        self.month = self.operations["Date"].iloc[0].month
-        self.year = self.operations["Date"].iloc[0].year
-        self.start_date = self.parser.start_date
-        self.end_date = self.parser.end_date
+        if len(self.operations):
+            self.month = self.operations["Date"].iloc[0].month
+            self.year = self.operations["Date"].iloc[0].year
 
             
         if hasattr(self, "budget"):
@@ -641,6 +707,61 @@ class Monthly_Summary:
         self.logger.log(f"Operations successfully processed. {len(self.operations)} operations found")
         return self.operations
 
+    def _parse_statement(self, mode, kwargs):
+        """Extract and parse the statement, and reconcile the operations with the printed balances.
+
+        In "auto" mode, the cheap text layout is parsed first, and the statement is only extracted and parsed
+        in markdown mode if the text parse does not reconcile. The parse with the smallest closing difference is kept.
+        """
+        # Share the extraction engine of the summary (or the process-wide one) with the parser
+        kwargs["engine"] = getattr(self, "engine", None)
+        kwargs.setdefault("page_workers", self.page_workers)
+        modes = ["text", "markdown"] if mode == "auto" else [mode]
+        best = None
+        for m in modes:
+            self.parser = Statement_Parser(self.pdf, mode=m, logger = self.logger, **kwargs)
+            try:
+                self.parser.load_document()
+                if self.parser.parsed_document is None:
+                    continue
+                if self.checkpoint is not None:
+                    self.checkpoint.mark(self.pdf, "extracted", mode = m)
+                operations = self.parser.parse_document()
+                reconciliation = self.parser.reconcile()
+            except Exception as e:
+                if mode != "auto" or (m == modes[-1] and best is None):
+                    raise e
+                self.logger.warning(f"Error while parsing {self.pdf} in {m} mode: {e}", title = "Parsing warning")
+                continue
+
+            self.logger.log(f"{reconciliation} ({m} mode)")
+            if best is None or reconciliation.error < best[2].error:
+                best = (self.parser, operations, reconciliation)
+            if reconciliation.ok:
+                break
+            if m != modes[-1]:
+                self.logger.warning(f"The {m} parse of {self.pdf} does not reconcile ({reconciliation.reason}), trying the {modes[modes.index(m) + 1]} mode", title = "Reconciliation warning")
+
+        if best is not None:
+            self.parser, self.operations, self.reconciliation = best
+            if not self.reconciliation.ok:
+                self.logger.warning(f"The operations of {self.pdf} do not reconcile with the printed balances: {self.reconciliation.reason}", title = "Reconciliation warning")
+        return None
+
+    def _checkpoint_dates(self):
+        """Start and end dates and balances of the statement, as saved in the checkpoint journal."""
+        info = {name: getattr(self, name).strftime("%Y-%m-%d") if getattr(self, name, None) is not None else None for name in ["start_date", "end_date"]}
+        info.update({name: getattr(self, name, None) for name in ["opening_balance", "closing_balance"]})
+        return info
+
+    def _restore_dates(self, info):
+        """Restore the start and end dates and balances of the statement from the checkpoint journal."""
+        for name in ["start_date", "end_date"]:
+            setattr(self, name, pd.to_datetime(info[name]) if info.get(name) else None)
+        for name in ["opening_balance", "closing_balance"]:
+            setattr(self, name, info.get(name))
+        return None
+
     def modify_operation(self, index, column, value):
         """Modify an operation in the DataFrame.
 
@@ -659,20 +780,117 @@ class Monthly_Summary:
         --------
         None    
         """
-        if self.operations is None:
-            self.logger.warning("No operations to modify", title = "Modification warning")
-            return None
-        if index >= len(self.operations):
-            self.logger.warning("Index out of range", title = "Modification warning")
-            return None
-        if column not in self.operations.columns:
-            self.logger.warning("Column not found", title = "Modification warning")
-            return None
-        self.operations.at[index, column] = value
-        self.logger.log(f"Operation {index} modified with value {value} in column {column}")
+        self.modify_operations(edits = [(index, column, value)])
         return None
 
-    def plot_categories(self, epargne = False):
+    def modify_operations(self, edits = None, mask = None, query = None, column = None, value = None):
+        """Modify several operations at once, column by column, and record the changes in the change journal.
+
+        The operations to modify are given either as a list of (index, column, value) triples, or as a
+        selection (a boolean mask or a DataFrame.query string) with the column and value to set. All the values
+        are converted to the dtype of their column first: if one of them is invalid (e.g. "12,5" for an amount),
+        no operation is modified.
+
+        Parameters:
+        -----------
+        edits : list, optional
+            The list of (index, column, value) triples to apply.
+
+        mask : Series or array, optional
+            The boolean mask of the operations to modify with column = value.
+
+        query : str, optional
+            A DataFrame.query expression selecting the operations to modify with column = value,
+            e.g. 'Description.str.contains("SNCF")'.
+
+        column : str, optional
+            The column to modify, with mask or query.
+
+        value : str or float, optional
+            The value to set, with mask or query.
+
+        Returns:
+        --------
+        n : int
+            The number of modified cells.
+        """
+        if self.operations is None or len(self.operations) == 0:
+            self.logger.warning("No operations to modify", title = "Modification warning")
+            return 0
+
+        # Normalize the requests to {column: (index labels, values)}
+        changes = {}
+        if edits is not None:
+            for index, col, val in edits:
+                if index not in self.operations.index:
+                    self.logger.warning(f"Index {index} out of range", title = "Modification warning")
+                    continue
+                changes.setdefault(col, ([], []))
+                changes[col][0].append(index)
+                changes[col][1].append(val)
+        if mask is not None or query is not None:
+            if column is None:
+                self.logger.warning("No column given for the selection", title = "Modification warning")
+                return 0
+            try:
+                selection = self.operations.query(query, engine="python") if query is not None else self.operations[mask]
+            except Exception as e:
+                self.logger.error(f"Error while selecting the operations to modify: {e}", title = "Modification error")
+                if not self.handle_errors:
+                    raise e
+                return 0
+            changes.setdefault(column, ([], []))
+            changes[column][0].extend(selection.index)
+            changes[column][1].extend([value] * len(selection))
+
+        if not hasattr(self, "fingerprints") or len(self.fingerprints) != len(self.operations):
+            self.fingerprints = operation_fingerprints(self.operations)
+        journal = Change_Journal(self.journal_file) if self.journal_file is not None else None
+
+        # Convert all the values before modifying anything, so an invalid value leaves the operations untouched
+        for col in list(changes):
+            if col not in self.operations.columns:
+                self.logger.warning(f"Column {col} not found", title = "Modification warning")
+                del changes[col]
+            elif not changes[col][0]:
+                del changes[col]
+        try:
+            for col, (indexes, values) in changes.items():
+                dtype = self.operations[col].dtype
+                if pd.api.types.is_datetime64_any_dtype(dtype):
+                    values = list(pd.to_datetime(pd.Series(values)))
+                elif pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype):
+                    values = pd.to_numeric(pd.Series(values)).astype(dtype).tolist()
+                changes[col] = (indexes, values)
+        except (ValueError, TypeError) as e:
+            self.logger.error(f"Invalid value for column {col}, no operation modified: {e}", title = "Modification error")
+            if not self.handle_errors:
+                raise e
+            return 0
+
+        n = 0
+        for col, (indexes, values) in changes.items():
+            self.operations.loc[indexes, col] = values
+            if journal is not None:
+                journal.record(self.fingerprints.loc[indexes], col, values)
+            n += len(indexes)
+            self.logger.log(f"{len(indexes)} operation(s) modified in column {col}")
+
+        modified = sorted(set().union(*(indexes for indexes, _ in changes.values()))) if n else []
+        if n and self.ledger_file is not None:
+            get_ledger(self.ledger_file).add_operations(self.operations.loc[modified], self.fingerprints.loc[modified], source = self.pdf, replace = False)
+        if n and self.index_file is not None:
+            get_search_index(self.index_file).add_operations(self.operations.loc[modified], self.fingerprints.loc[modified], source = self.pdf, replace = False)
+        if n and self.suggester_file is not None and "Category" in changes and "Category" in self.operations.columns:
+            # The corrected categories replace the ones learnt by the suggester
+            corrected = sorted(set(changes["Category"][0]))
+            self._learn_categories(self.operations.loc[corrected], self.fingerprints.loc[corrected])
+
+        if n and hasattr(self, "budget"):
+            self.compute_remaining_budget(print_budget = False)
+        return n
+
+    def plot_categories(self, epargne = False, show = True, fmt = None, file = None):
         """Plot a pie chart of the expenses by categories.
 
         Parameters:
@@ -680,27 +898,41 @@ class Monthly_Summary:
         epargne : bool, optional
             If True, the "Epargne" category will be included in the pie chart. If False, it will be excluded.
 
+        show : bool, optional
+            If True and no format is given, the chart is shown in a matplotlib window.
+
+        fmt : str, optional
+            "png" or "svg" to render the chart headlessly (Agg backend) and return its bytes instead of showing it.
+            The images are cached by the hash of the category totals, so an unchanged month is not drawn again.
+
+        file : str, optional
+            The file to write the image to (the format is taken from its extension if fmt is not given).
+
         Returns:
         --------
-        None
+        image : bytes or None
+            The image of the chart if it was rendered headlessly, None otherwise.
         """
-        import matplotlib.pyplot as plt
-        import numpy as np
-
         if len(self.operations) == 0:
             self.logger.warning("No operations to plot", title = "Plotting warning")
             return None
-        
-        # store the categories and their total amount
-        categories = self.operations[["Category", "Debit (€)"]].groupby("Category").sum()
-        if not epargne:
-            categories = categories[categories.index != "Epargne"]
-        categories = categories.sort_values(by="Debit (€)", ascending=False)
-        categories = categories.reset_index()
+
+        if file is not None and fmt is None:
+            fmt = os.path.splitext(file)[1].lstrip(".").lower() or "png"
+        if fmt is not None or not show:
+            image = render_pie(*category_chart(self, epargne), fmt = fmt or "png")
+            if file is not None:
+                with open(file, "wb") as f:
+                    f.write(image)
+                self.logger.log(f"Chart of the categories saved to {file}")
+            return image
+
+        import matplotlib.pyplot as plt
 
         # plot the pie chart
+        labels, values, title = category_chart(self, epargne)
         fig, ax = plt.subplots()
-        ax.pie(categories["Debit (€)"], labels=categories["Category"], autopct='%1.1f%%')
+        ax.pie(values, labels=labels, autopct='%1.1f%%')
         ax.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
 
         plt.show()
@@ -780,7 +1012,7 @@ class Monthly_Summary:
         if budget is None:
             self.logger.warning("No budget provided, using automatic budget", title = "Budget warning")
             # automatic budget is 150 + 5*number of days in the month
-            if hasattr(self, "start_date") and hasattr(self, "end_date"):
+            if getattr(self, "start_date", None) is not None and getattr(self, "end_date", None) is not None:
                 budget = 150 + 5*((self.end_date - self.start_date).days)
             else:
                 self.logger.error("No start and end dates found, cannot compute automatic budget", title = "Budget error")
@@ -839,217 +1071,242 @@ class Monthly_Summary:
 
         return None
     
-    def to_excel(self, file = None):
+    def category_totals(self):
+        """Get the debit and credit totals of each category, cached until the operations change.
+
+        Returns:
+        --------
+        totals : DataFrame
+            The "Debit (€)" and "Credit (€)" totals, indexed by the categories of CATEGORY_LIST followed by "Other".
+            The operations of a category outside of CATEGORY_LIST (e.g. set with modify_operations) count in "Other".
+        """
+        columns = ["Category", "Debit (€)", "Credit (€)"]
+        key = int(pd.util.hash_pandas_object(self.operations[columns], index=False).sum()) if len(self.operations) else 0
+        if getattr(self, "_category_totals", None) is None or self._category_totals[0] != key:
+            operations = self.operations[columns]
+            operations = operations.assign(Category = operations["Category"].where(operations["Category"].isin(CATEGORY_LIST), "Other"))
+            totals = operations.groupby("Category").sum()
+            totals = totals.reindex(CATEGORY_LIST + ["Other"], fill_value=0.0)
+            self._category_totals = (key, totals)
+        return self._category_totals[1]
+
+    def balance_series(self, opening = None):
+        """Get the balance at the end of each day of the statement, cached until the operations change.
+
+        Parameters:
+        -----------
+        opening : float, optional
+            The balance before the first operation, default is the opening balance printed on the statement.
+
+        Returns:
+        --------
+        balance : Series
+            The end of day balance from the start to the end date of the statement, named "Balance (€)". Empty if
+            the opening balance is unknown.
+        """
+        if opening is None:
+            opening = getattr(self, "opening_balance", None)
+        if opening is None:
+            return pd.Series([], index=pd.DatetimeIndex([]), dtype=float, name="Balance (€)")
+        start, end = getattr(self, "start_date", None), getattr(self, "end_date", None)
+        columns = ["Date", "Debit (€)", "Credit (€)"]
+        key = (int(pd.util.hash_pandas_object(self.operations[columns], index=False).sum()) if len(self.operations) else 0, opening, start, end)
+        if getattr(self, "_balance_series", None) is None or self._balance_series[0] != key:
+            self._balance_series = (key, daily_balance(self.operations, opening, start, end))
+        return self._balance_series[1]
+
+    def to_excel(self, file = None, static_totals = None):
         """Save the monthly summary to an Excel file, and format the data. Also add a pie chart of the categories.
 
+        The sheet is written in a copy of the workbook, renamed over it once complete, so an error (or an
+        interrupted run) never leaves a half-written workbook. With dedup, the operations already written in
+        another month of the workbook are left out of the sheet, the summary itself keeps them.
+
         Parameters:
         -----------
         file : str, optional
             The path to the Excel file. If not provided, the file will be named "ACCOUNT_ID_month_year.xlsx".
 
+        static_totals : bool, optional
+            If True, the totals are written as values computed with pandas instead of SUM/SUMIF formulas,
+            so large workbooks open and recalculate fast. Default is the static_totals attribute (False).
+
         Returns:
         --------
-        None
+        file : str or None
+            The path to the Excel file, None if it could not be written.
         """
-        import openpyxl
-        from openpyxl import load_workbook
-        from openpyxl.chart import PieChart, Reference
-        from openpyxl.utils.dataframe import dataframe_to_rows
-        from openpyxl.styles import Font, PatternFill
-        from openpyxl.formatting.rule import CellIsRule
+        import shutil
 
         if file is None:
             file = f"{ACCOUNT_ID}_{self.month}_{self.year}.xlsx"
-        
-        number_to_month = {1: "Janvier", 2: "Février", 3: "Mars", 4: "Avril", 5: "Mai", 6: "Juin", 7: "Juillet", 8: "Août", 9: "Septembre", 10: "Octobre", 11: "Novembre", 12: "Décembre"}
+        if static_totals is None:
+            static_totals = self.static_totals
 
-        sheet_name = f"{number_to_month[self.month]}_{self.year}"
+        # Nothing to write for a statement that could not be parsed
+        if self.month is None or len(self.operations) == 0:
+            self.logger.warning(f"No operations{'' if self.month is not None else ' and no month'} for {self.pdf}, nothing written to {file}", title = "Excel warning")
+            return None
 
-        if not os.path.exists(file):
-            # Create the Excel file with the first sheet
-            try:
-                with pd.ExcelWriter(file, engine='openpyxl') as writer:
-                    writer.book.create_sheet(sheet_name, 0)
-                    writer.sheets[sheet_name].title = "Sheet_0"
-                    self.logger.log(f"Excel file {file} created")
-            except Exception as e:
-                self.logger.error(f"Error while creating the Excel file: {e}", title = "Excel creation error")
-                if not self.handle_errors:
-                    raise e
-                return None
+        # Leave out the operations already written in another month of the workbook (overlapping statements)
+        index = Fingerprint_Index.for_workbook(file) if self.dedup else None
+        summary = self.without_overlaps(index) if index is not None else self
+        if len(summary.operations) == 0:
+            self.logger.warning(f"All the operations are already in {file}, nothing written", title = "Excel warning")
+            return None
+
+        root, ext = os.path.splitext(file)
+        tmp_file = f"{root}.tmp{ext}"
+        written = False
+        try:
+            if os.path.exists(file):
+                shutil.copy2(file, tmp_file)
+            elif os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            # The balance of the statement is computed on all its operations, from the printed opening balance
+            if summary._write_excel(tmp_file, static_totals, balance = self.balance_series()):
+                os.replace(tmp_file, file)
+                written = True
+                self.logger.log(f"Excel file {file} saved")
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+        if written:
+            # The month as written in the sheet, for the overview
+            self.excel_summary = summary
+        if written and index is not None:
+            index.replace(f"{number_to_month[self.month]}_{self.year}", summary.fingerprints)
+            index.save()
+        return file if written else None
+
+    def without_overlaps(self, index):
+        """Copy of the summary without the operations already written in another sheet of a workbook, e.g. when two
+        statements overlap. The summary itself keeps all its operations (for the ledger, the CSV export...).
+
+        Parameters:
+        -----------
+        index : Fingerprint_Index
+            The fingerprint index of the workbook.
+
+        Returns:
+        --------
+        summary : Monthly_Summary
+            A copy of the summary with the overlapping operations left out, or the summary itself if there are none.
+        """
+        import copy
+
+        if not hasattr(self, "fingerprints") or len(self.fingerprints) != len(self.operations):
+            self.fingerprints = operation_fingerprints(self.operations)
+        mask = index.overlap(self.fingerprints, f"{number_to_month[self.month]}_{self.year}")
+        n = int(mask.sum())
+        if n == 0:
+            return self
+        owners = index.owners(self.fingerprints[mask]).value_counts()
+        self.logger.warning(f"{n} operation(s) already written in {', '.join(f'{sheet} ({count})' for sheet, count in owners.items())} left out", title = "Overlap warning")
+        keep = ~mask.to_numpy()
+        summary = copy.copy(self)
+        summary.operations = self.operations[keep].reset_index(drop=True)
+        summary.fingerprints = self.fingerprints[keep].reset_index(drop=True)
+        if hasattr(self, "budget"):
+            summary.compute_remaining_budget(print_budget = False)
+        return summary
+
+    def _write_excel(self, file, static_totals, balance = None):
+        """Write the sheet of the month in an Excel file. Returns True if the file was completely written.
+
+        The sheet is a copy of the template sheet of the workbook (built once, with the labels, the named styles,
+        the column widths and the frames), only the values, the styles of the operation rows and the charts are
+        written for the month. The workbook is loaded and saved once. The daily balance written next to the
+        operations is the given one, default is the balance series of the summary.
+        """
+        from openpyxl import Workbook, load_workbook
+
+        totals = self.category_totals() if static_totals else None
+        
+        sheet_name = f"{number_to_month[self.month]}_{self.year}"
 
         if not hasattr(self, "budget"):
             self.logger.warning("No budget provided, computing automatic budget", title = "Budget warning")
             self.add_monthly_budget()
 
         try:
-            with pd.ExcelWriter(file, engine='openpyxl', mode="a") as writer:
-                # Write first an introductory phrase: "Comptes pour le mois de {month} {year}"
-                # Skip a line, Then writes "Budget: {budget} €" and next cell "Remaining budget: {remaining_budget} €"
-                # Skip a line, Then writes the operations DataFrame
-
-                writer.book.create_sheet(sheet_name, 0)
-                writer.sheets[sheet_name].title = sheet_name
-                title_cell = writer.sheets[sheet_name].cell(row=1, column=1)
-                title_cell.value = f"Comptes pour le mois de {number_to_month[self.month]} {self.year} (du {self.start_date.date()} au {self.end_date.date()})"
-                title_cell.font = Font(bold=True, size=20)
-                      
-                # Adjust the height of the row
-                writer.sheets[sheet_name].row_dimensions[1].height = 30
-
-                budget_cell = writer.sheets[sheet_name].cell(row=2, column=1)
-                budget_cell.value = "Budget:"
-                budget_cell.font = Font(bold=True)
-                writer.sheets[sheet_name].cell(row=2, column=2, value=self.budget)
-
-                remaining_budget_cell = writer.sheets[sheet_name].cell(row=3, column=1)
-                remaining_budget_cell.value = "Remaining budget:"
-                remaining_budget_cell.font = Font(bold=True)
-                remaining_budget_cell = writer.sheets[sheet_name].cell(row=3, column=2, value=self.remaining_budget)
-                # set some conditional formatting to have red if remaining budget is negative and green if positive
-                red_fill = PatternFill(start_color="FF0000", end_color="FF0000", fill_type="solid")
-                green_fill = PatternFill(start_color="00FF00", end_color="00FF00", fill_type="solid")
-                writer.sheets[sheet_name].conditional_formatting.add(f"B3:B3", CellIsRule(operator='lessThan', formula=['0'], fill=red_fill))
-                writer.sheets[sheet_name].conditional_formatting.add(f"B3:B3", CellIsRule(operator='greaterThan', formula=['0'], fill=green_fill))
-
-                #self.operations.to_excel(writer, sheet_name=sheet_name, index=False)
-
-                # Write the column names in bold
-                for c_idx, value in enumerate(self.operations.columns, start=1):
-                    writer.sheets[sheet_name].cell(row=5, column=c_idx, value=value)
-                    writer.sheets[sheet_name].cell(row=5, column=c_idx).font = Font(bold=True, size=16, color="FFFFFF")
-                    # Color the cell in black and the font in white
-                    writer.sheets[sheet_name].cell(row=5, column=c_idx).fill = PatternFill(start_color="000000", end_color="000000", fill_type="solid")
-
-                # Set the right row height for the header row
-                writer.sheets[sheet_name].row_dimensions[5].height = 18
-
-                for r_idx, r in enumerate(dataframe_to_rows(self.operations, index=False, header=False), start=6):
-                    for c_idx, value in enumerate(r, start=1):
-                        # Format the date to dd/mm/yyyy
-                        if c_idx in [1, 3]:
-                            writer.sheets[sheet_name].cell(row=r_idx, column=c_idx, value=value).number_format = 'dd/mm/yyyy'
-                        else:
-                            writer.sheets[sheet_name].cell(row=r_idx, column=c_idx, value=value)
-
-                # Add a "" | "Total" row at the end of the operations rows
-                writer.sheets[sheet_name].cell(row=len(self.operations) + 6, column=2, value="Total")
-                writer.sheets[sheet_name].cell(row=len(self.operations) + 6, column=2).font = Font(bold=True, color="FFFFFF")
-                writer.sheets[sheet_name].cell(row=len(self.operations) + 6, column=4, value=f"=SUM(D6:D{len(self.operations) + 5})")
-                writer.sheets[sheet_name].cell(row=len(self.operations) + 6, column=4).font = Font(bold=True, color="FFFFFF")
-                writer.sheets[sheet_name].cell(row=len(self.operations) + 6, column=5, value=f"=SUM(E6:E{len(self.operations) + 5})")
-                writer.sheets[sheet_name].cell(row=len(self.operations) + 6, column=5).font = Font(bold=True, color="FFFFFF")
-                for c_idx in [0, 1, 2, 3, 4, 5]:
-                    writer.sheets[sheet_name].cell(row=len(self.operations) + 6, column=c_idx + 1).fill = PatternFill(start_color="000000", end_color="000000", fill_type="solid")
-
-
-                # Set the right column width
-                for col, w in {0: 17, 1: 30, 2: 20, 3:15, 4:15, 5:15}.items():
-                    writer.sheets[sheet_name].column_dimensions[chr(65 + col)].width = w
-
-                # Add frame lines around the data
-                for r in writer.sheets[sheet_name].iter_rows(min_row=5, max_row=len(self.operations) + 5, min_col=1, max_col=len(self.operations.columns)):
-                    for cell in r:
-                        cell.border = openpyxl.styles.Border(left=openpyxl.styles.Side(style='thin'), right=openpyxl.styles.Side(style='thin'), top=openpyxl.styles.Side(style='thin'), bottom=openpyxl.styles.Side(style='thin'))
-
-                # Colour each row alternatively in very light blue and gray
-                for r_idx in range(6, len(self.operations) + 6):
-                    fill = PatternFill(start_color="F0F0F0", end_color="F0F0F0", fill_type="solid")
-                    if r_idx % 2 == 0:
-                        fill = PatternFill(start_color="D3D3D3", end_color="D3D3D3", fill_type="solid")
-                    for c_idx in range(1, len(self.operations.columns) + 1):
-                        writer.sheets[sheet_name].cell(row=r_idx, column=c_idx).fill = fill
-            self.logger.log(f"Excel file {file} created")
-
-        except Exception as e:
-            self.logger.error(f"Error while writing the Excel file: {e}", title = "Excel writing error")
-            if not self.handle_errors:
-                raise e
-            return None
-        
-        try:
-            # Load the workbook and select the active worksheet
-            wb = load_workbook(file)
-            ws = wb[sheet_name]
-
-            # Create a summary DataFrame for the pie chart
-            categories = self.operations[["Category", "Debit (€)"]].groupby("Category").sum()
-            categories = categories.sort_values(by="Debit (€)", ascending=False)
-            categories = categories.reset_index()
-
-            # Determine the starting column for the summary data
-            start_col = len(self.operations.columns) + 2  # Two columns to the right of the initial table
-            start_row = 1
-            categories_list = CATEGORY_LIST
-
-            # Add category labels and sum formulas for debits
-            for idx, category in enumerate(categories_list):
-                category_cell = ws.cell(row=start_row + idx + 1, column=start_col, value=f"Débit {category} (€)")
-                formula_cell = ws.cell(row=start_row + idx + 1, column=start_col + 1)
-                formula_cell.value = f"=SUMIF(F:F, \"{category}\", D:D)"  # Sum of debits for each category
+            if os.path.exists(file):
+                wb = load_workbook(file)
+            else:
+                wb = Workbook()
+                wb.remove(wb.active)
+                self.logger.log(f"Excel file {file} created")
+
+            # Re-ingesting a month replaces its sheet, at the same position
+            position = 0
+            if sheet_name in wb.sheetnames:
+                position = wb.sheetnames.index(sheet_name)
+                del wb[sheet_name]
+                self.logger.log(f"Sheet {sheet_name} replaced")
+            ws = new_month_sheet(wb, sheet_name, position)
+            wb.active = ws
+
+            # "Comptes pour le mois de {month} {year}", then the budget and the remaining budget, then the operations
+            ws.cell(row=1, column=1, value=f"Comptes pour le mois de {number_to_month[self.month]} {self.year} (du {self.start_date.date()} au {self.end_date.date()})")
+            ws.cell(row=2, column=2, value=self.budget)
+            ws.cell(row=3, column=2, value=self.remaining_budget)
+
+            columns = list(self.operations.columns)
+            if columns != OPERATION_COLUMNS:
+                for c_idx, value in enumerate(columns, start=1):
+                    ws.cell(row=HEADER_ROW, column=c_idx, value=value).style = HEADER_STYLE
+
+            # Operation rows, alternatively light and dark, the dates formatted as dd/mm/yyyy
+            date_columns = [c_idx for c_idx, col in enumerate(columns, start=1) if col in ["Date", "Operation Date"]]
+            for r_idx, row in enumerate(self.operations.itertuples(index=False, name=None), start=HEADER_ROW + 1):
+                row_style, date_style = ROW_STYLES[(r_idx + 1) % 2], DATE_STYLES[(r_idx + 1) % 2]
+                for c_idx, value in enumerate(row, start=1):
+                    if isinstance(value, pd.Timestamp):
+                        value = value.to_pydatetime()
+                    elif isinstance(value, float) and np.isnan(value):
+                        value = None
+                    ws.cell(row=r_idx, column=c_idx, value=value).style = date_style if c_idx in date_columns else row_style
+
+            # Add a "" | "Total" row at the end of the operations rows
+            total_row = len(self.operations) + HEADER_ROW + 1
+            ws.cell(row=total_row, column=2, value="Total")
+            ws.cell(row=total_row, column=4, value=self.operations["Debit (€)"].sum() if static_totals else f"=SUM(D6:D{total_row - 1})")
+            ws.cell(row=total_row, column=5, value=self.operations["Credit (€)"].sum() if static_totals else f"=SUM(E6:E{total_row - 1})")
+            for c_idx in range(1, 7):
+                ws.cell(row=total_row, column=c_idx).style = TOTAL_STYLE
+
+            # Debit and credit totals of each category, next to the operations
+            for idx, category in enumerate(CATEGORY_LIST):
+                debit_cell = ws.cell(row=DEBIT_ROW + idx, column=SUMMARY_COL + 1)
+                debit_cell.value = totals.at[category, "Debit (€)"] if static_totals else f"=SUMIF(F:F, \"{category}\", D:D)"
                 if category == "Epargne":
-                    formula_cell.value = 0
-                    ws.cell(row=start_row + idx + 1, column=start_col + 2, value = f"=SUMIF(F:F, \"{category}\", D:D)")
-
-            # Add a frame around the summary data
-            for r in ws.iter_rows(min_row=start_row+1, max_row=start_row + len(categories_list), min_col=start_col, max_col=start_col + 1):
-                for cell in r:
-                    cell.border = openpyxl.styles.Border(left=openpyxl.styles.Side(style='thin'), right=openpyxl.styles.Side(style='thin'), top=openpyxl.styles.Side(style='thin'), bottom=openpyxl.styles.Side(style='thin'))
-
-            # Create a PieChart for debits
-            pie_debit = PieChart()
-            labels_debit = Reference(ws, min_col=start_col, min_row=start_row+1, max_row=start_row + len(categories_list))
-            data_debit = Reference(ws, min_col=start_col + 1, min_row=start_row, max_row=start_row + len(categories_list))
-            pie_debit.add_data(data_debit, titles_from_data=True)
-            pie_debit.set_categories(labels_debit)
-            pie_debit.title = "Debit (€) by Category"
-
-            # Add the pie chart to the worksheet
-            ws.add_chart(pie_debit, f'{chr(65 + start_col + 4)}2')  # Position the chart a few columns to the right of the summary data
-
-            # Add category labels and sum formulas for credits 10 rows below the debit section
-            credit_start_row = start_row + len(categories_list) + 3
-            for idx, category in enumerate(categories_list):
-                category_cell = ws.cell(row=credit_start_row + idx + 1, column=start_col, value=f"Crédit {category} (€)")
-                formula_cell = ws.cell(row=credit_start_row + idx + 1, column=start_col + 1)
-                formula_cell.value = f"=SUMIF(F:F, \"{category}\", E:E)"  # Sum of credits for each category
-
-            # Add a frame around the summary data
-            for r in ws.iter_rows(min_row=credit_start_row+1, max_row=credit_start_row + len(categories_list), min_col=start_col, max_col=start_col + 1):
-                for cell in r:
-                    cell.border = openpyxl.styles.Border(left=openpyxl.styles.Side(style='thin'), right=openpyxl.styles.Side(style='thin'), top=openpyxl.styles.Side(style='thin'), bottom=openpyxl.styles.Side(style='thin'))
-
-            # Set the right column width for col H width 20
-            ws.column_dimensions['H'].width = 20
-
-            # Create a PieChart for credits
-            pie_credit = PieChart()
-            labels_credit = Reference(ws, min_col=start_col, min_row=credit_start_row+1, max_row=credit_start_row + len(categories_list))
-            data_credit = Reference(ws, min_col=start_col+1, min_row=credit_start_row, max_row=credit_start_row + len(categories_list))
-            pie_credit.add_data(data_credit, titles_from_data=True)
-            pie_credit.set_categories(labels_credit)
-            pie_credit.title = "Credit (€) by Category"
-
-            # Add the pie chart to the worksheet
-            ws.add_chart(pie_credit, f'{chr(65 + start_col + 4)}{credit_start_row + 4}')  # Position the chart a few columns to the right of the summary data
+                    # The savings are not an expense, their total is on the side
+                    debit_cell.value = 0
+                    ws.cell(row=DEBIT_ROW + idx, column=SUMMARY_COL + 2, value = totals.at[category, "Debit (€)"] if static_totals else f"=SUMIF(F:F, \"{category}\", D:D)")
+                ws.cell(row=CREDIT_ROW + idx, column=SUMMARY_COL + 1).value = totals.at[category, "Credit (€)"] if static_totals else f"=SUMIF(F:F, \"{category}\", E:E)"
 
             # add the saving rate
-            sav_rate_cell = ws.cell(row=credit_start_row + len(categories_list) + 3, column=start_col, value="Saving rate")
-            sav_rate_formula = ws.cell(row=credit_start_row + len(categories_list) + 3, column=start_col + 1)
-            sav_rate_formula.value = self.get_stats(print_stats = False)["Saving rate"]
+            ws.cell(row=SAVING_ROW, column=SUMMARY_COL + 1, value=self.get_stats(print_stats = False)["Saving rate"])
 
-            # Save the workbook
-            wb.save(file)
+            # Daily balance of the statement, when the opening balance is known
+            if balance is None:
+                balance = self.balance_series()
+            for r_idx, (day, amount) in enumerate(balance.items(), start=BALANCE_ROW + 1):
+                ws.cell(row=r_idx, column=SUMMARY_COL, value=day.date()).number_format = 'dd/mm/yyyy'
+                ws.cell(row=r_idx, column=SUMMARY_COL + 1, value=float(amount)).number_format = '#,##0.00'
 
-            self.logger.log(f"Summary data and pie chart added to the Excel file")
+            add_month_charts(ws, len(balance))
+            wb.save(file)
+            self.logger.log(f"Summary data and charts added to the Excel file")
 
         except Exception as e:
-            self.logger.error(f"Error while adding the summary data and pie chart to the Excel file: {e}", title = "Excel chart error")
+            self.logger.error(f"Error while writing the Excel file: {e}", title = "Excel writing error")
             if not self.handle_errors:
                 raise e
             return None
 
-        return None
+        return True
     
     @classmethod
     def build_rules(self, rules_file = None):
@@ -1068,53 +1325,114 @@ class Monthly_Summary:
 
         return rules, rules_file
 
-    def _parse_operations(self, doc, page):
-        """Parse the operations from a parsed PDF document."""
-        d = doc.text
-        try:
-            info = d.split("|---|---|---|---|---|")[-1]
-            info = info.split("\n\n")[0]
-            infos = info.split("\n")
-        except Exception as e:
-            self.logger.error(f"Error parsing the PDF {self.pdf} on page {page}: {e}", title = "PDF parsing error")
-            if not self.handle_errors:
-                raise e
-
-        data = []
-        keys = ["Date", "Description", "Operation Date", "Debit (€)", "Credit (€)"]
-        for i in infos:
-            d = i.split("|")[1:6]
-            if len(d)==5 and d[0]!="":
-                data.append(dict(zip(keys, d)))
-
-        data = pd.DataFrame(data)
-        return data
-
-    def _add_category(self, label, debit, credit, rules, ask_rules, rules_file):
-        """Add a category to a transaction based on the label and the amount."""
+    @staticmethod
+    def _match_rules(label, rules):
+        """Return the category of the first rule matching the label, or None."""
         for rule in rules:
             for key in rule.keys():
                 if key in label:
                     return rule[key]
+        return None
 
-        if ask_rules:
-            print(f"Label: {label}, Debit: {debit}, Credit: {credit}")
-            print("Please enter the category for this transaction among the following:")
-            print(CATEGORY_LIST)
-            category = input()
-            print("Please enter the label to recognize it:")
-            label = input()
-
-            if category not in CATEGORY_LIST:
-                category = "Other"
-            elif label != "":
-                rules.append({label: category})
-                with open(rules_file, "a") as f:
-                    f.write(f"{label}:{category}\n")
-
-            return category
-            
-        return "Other"
+    def _ask_category(self, label, count, debit, credit):
+        """Ask the user the category of an uncategorized description, and the label of the rule to recognize it.
+
+        Returns:
+        --------
+        category, rule_label : str, str
+            The category ("Other" if the answer is not in CATEGORY_LIST) and the rule label ("" for no rule).
+        """
+        print(f"Label: {label} ({count} operation(s)), Debit: {debit}, Credit: {credit}")
+        print("Please enter the category for this transaction among the following:")
+        print(CATEGORY_LIST)
+        category = input().strip()
+        if category not in CATEGORY_LIST:
+            return "Other", ""
+        print("Please enter the label to recognize it:")
+        rule_label = input().strip()
+        return category, rule_label
+
+    def _ask_rules(self, data, keys, rules, rules_file, memo = None):
+        """Second phase of the categorization: ask once per distinct uncategorized description, then apply and save the new rules in one batch.
+
+        Parameters:
+        -----------
+        data : DataFrame
+            The operations, already categorized with the existing rules.
+
+        keys : Series
+            The normalized descriptions of the operations. The descriptions that normalize to "" (only digits, dates
+            or references) are not grouped, each one is asked with its raw label.
+
+        rules : list
+            The existing rules, the new rules are appended to it.
+
+        rules_file : str
+            The path to the rules file the new rules are appended to.
+
+        memo : Category_Memo, optional
+            The category memo to keep in sync with the new rules.
+
+        Returns:
+        --------
+        data : DataFrame
+            The operations with the new categories.
+        """
+        others = (data["Category"] == "Other").values
+        if not others.any():
+            return data
+
+        # Labels without words all normalize to "", they are unrelated and keep their raw label as key
+        keys = keys.where(keys != "", data["Description"].astype(str))
+
+        # One question per distinct normalized description, with its number of operations and amounts
+        pending = data[others].assign(_key = keys[others].values)
+        groups = pending.groupby("_key", sort=False).agg(label=("Description", "first"), count=("Description", "size"), debit=("Debit (€)", "sum"), credit=("Credit (€)", "sum"))
+        self.logger.log(f"{len(groups)} distinct uncategorized descriptions to ask for ({others.sum()} operations)")
+
+        answers = {}
+        new_rules = []
+        for key, group in groups.iterrows():
+            # A rule given for a previous description may already cover this one
+            category = Monthly_Summary._match_rules(group["label"], new_rules)
+            if category is not None:
+                answers[key] = category
+                continue
+            category, rule_label = self._ask_category(group["label"], group["count"], group["debit"], group["credit"])
+            if category == "Other":
+                continue
+            answers[key] = category
+            if rule_label != "":
+                new_rules.append({rule_label: category})
+
+        # Apply the answers, then the new rules to the remaining operations, column-wise
+        categories = data["Category"].values.copy()
+        answered = keys.map(answers).values
+        mask = others & pd.notna(answered)
+        categories[mask] = answered[mask]
+        for rule in new_rules:
+            for rule_label, category in rule.items():
+                mask = (categories == "Other") & data["Description"].str.contains(rule_label, regex=False).values
+                categories[mask] = category
+        data["Category"] = categories
+
+        if new_rules:
+            rules.extend(new_rules)
+            with open(rules_file, "a") as f:
+                f.writelines(f"{k}:{v}\n" for rule in new_rules for k, v in rule.items())
+            self.logger.log(f"{len(new_rules)} new rules added to {rules_file}")
+            if memo is not None:
+                # The new rules are appended, they can only change the operations that were uncategorized. Only the
+                # categories the rules file now gives are memoized: an answer without a rule label (or given for a whole
+                # group of descriptions) cannot be reproduced from the rules, and is asked again on the next run
+                memo.extend_rules()
+                ruled = {}
+                for label in pd.unique(data["Description"].astype(str).values[others]):
+                    category = Monthly_Summary._match_rules(label, new_rules)
+                    ruled[label] = "Other" if category is None else category
+                memo.update(ruled)
+                memo.save()
+        return data
 
     def add_category(self, data, ask_rules = None, rules_file = None):
         """Add a category to the operations based on the rules file."""
@@ -1127,22 +1445,84 @@ class Monthly_Summary:
         else:
             self.ask_rules = ask_rules
         rules, rules_file = Monthly_Summary.build_rules(rules_file=rules_file)
-        data["Category"] = data.apply(lambda x: self._add_category(x["Description"], x["Debit (€)"], x["Credit (€)"], rules, ask_rules, rules_file), axis=1)
+        if len(data) == 0:
+            data["Category"] = []
+            return data
+
+        # Run the rules once per distinct description, the memo answers for the normalized descriptions already seen
+        memo = get_memo(rules_file, self.memo_file) if self.use_memo else None
+        labels = data["Description"].astype(str)
+        categories = {}
+        for label in pd.unique(labels):
+            category = memo.get(label) if memo is not None else None
+            if category is None:
+                category = Monthly_Summary._match_rules(label, rules)
+                category = "Other" if category is None else category
+            categories[label] = category
+        data["Category"] = labels.map(categories).values
+
+        if memo is not None:
+            memo.update(categories)
+            memo.save()
+            self.logger.log(f"{len(categories)} distinct descriptions categorized, {len(memo)} entries in the category memo")
+
+        suggested = None
+        if self.suggester_file is not None:
+            suggested = self._suggest_categories(data)
+
+        if ask_rules:
+            data = self._ask_rules(data, normalize_descriptions(data["Description"]), rules, rules_file, memo)
+
+        if self.suggester_file is not None:
+            # Learn from the rule-based and user categories only, never from the suggestions
+            self._learn_categories(data[~suggested], operation_fingerprints(data)[~suggested])
         return data
 
+    def _learn_categories(self, operations, fingerprints):
+        """Teach the categories of operations to the category suggester, once per fingerprint (a changed category
+        replaces the learnt one), and save it."""
+        suggester = get_suggester(self.suggester_file)
+        learnt = suggester.update(operations["Description"], operations["Category"], fingerprints)
+        if learnt:
+            suggester.save(self.suggester_file)
+        self.logger.log(f"{learnt} operations learnt by the category suggester {self.suggester_file}")
+        return learnt
+
+    def _suggest_categories(self, data):
+        """Replace the "Other" categories by the suggestion of the category suggester when it is confident enough.
+
+        The ranked suggestions of all the uncategorized operations are stored in self.suggestions.
+
+        Returns:
+        --------
+        suggested : ndarray
+            The boolean mask of the operations whose category was suggested.
+        """
+        suggested = np.zeros(len(data), dtype=bool)
+        others = (data["Category"] == "Other").values
+        if not others.any():
+            self.suggestions = pd.DataFrame(columns = ["Description", "Suggestion", "Confidence", "Evidence", "Ranking"])
+            return suggested
+
+        suggester = get_suggester(self.suggester_file)
+        suggestions = suggester.predict(data["Description"][others])
+        suggestions.index = data.index[others]
+        suggestions.insert(0, "Description", data["Description"][others].values)
+        self.suggestions = suggestions
+
+        confident = (suggestions["Suggestion"].notna() & (suggestions["Confidence"] >= self.min_confidence)
+                     & (suggestions["Evidence"] >= self.min_evidence)).values
+        suggested[np.flatnonzero(others)[confident]] = True
+        categories = data["Category"].values.copy()
+        categories[suggested] = suggestions["Suggestion"].values[confident]
+        data["Category"] = categories
+        self.logger.log(f"{confident.sum()} of {others.sum()} uncategorized operations categorized by the suggester")
+        return suggested
+
     def _load_pdf(self):
-        """Load the PDF file and parse it to extract the operations."""
-        from llama_parse import LlamaParse
-        parser = LlamaParse( # can also be set in your env as LLAMA_CLOUD_API_KEY
-            result_type="markdown",  # "markdown" and "text" are available
-            num_workers=4,  # if multiple files passed, split in `num_workers` API calls
-            verbose=True,
-            language="en",  # Optionally you can define a language, default=en
-        )
-
-        # sync
-        documents = parser.load_data(self.pdf)
-        return documents
+        """Load the PDF file and extract its pages in markdown mode."""
+        engine = self.engine if getattr(self, "engine", None) is not None else get_engine()
+        return engine.extract(self.pdf, mode = "markdown")
 
     def __str__(self):
         return f"{self.month} {self.year} ; {self.operations}"
@@ -1154,7 +1534,7 @@ class Monthly_Summary:
 
 ############################################################################################
 
-def file_to_excel(file, excel_file, **kwargs):
+def file_to_excel(file, excel_file = None, **kwargs):
     """Process a PDF file and save the monthly summary to an Excel file.
     
     Parameters:
@@ -1162,22 +1542,31 @@ def file_to_excel(file, excel_file, **kwargs):
     file : str
         The path to the PDF file to process.
         
-    excel_file : str
-        The path to the Excel file to save the monthly summary to.
+    excel_file : str, optional
+        The path to the Excel file to save the monthly summary to. If not provided, the file will be named "ACCOUNT_ID_month_year.xlsx".
 
     **kwargs : dict
         Additional keyword arguments to pass to the Monthly_Summary class.
         Examples: verbose (bool), do_log (bool, if True, logs will be saved to a file), formatting (bool, if True, logs will be formatted), rules_file (str, the path to the rules file), ask_rules (bool, if True, the user will be asked to provide rules for the categories), handle_errors (bool, if True, errors will be handled and logged)
+
+    Returns:
+    --------
+    ms : Monthly_Summary
+        The monthly summary of the file.
     """
     ms = Monthly_Summary(file, **kwargs)
     ms.add_operations()
     ms.add_monthly_budget()
     ms.to_excel(excel_file)
-    return None
+    return ms
 
-def process_files(files, dest_file = None, **kwargs):
+def process_files(files, dest_file = None, overview = False, checkpoint_file = None, resume = True, **kwargs):
     """Process a list of PDF files and save the monthly summaries to an Excel file.
 
+    The stage reached by each file (extracted, parsed, categorized, written) is recorded in a checkpoint
+    journal: if the run is interrupted, running it again skips the files already written and resumes the
+    others from their last completed stage.
+
     Parameters:
     -----------
     files : list or str
@@ -1186,25 +1575,64 @@ def process_files(files, dest_file = None, **kwargs):
     dest_file : str, optional
         The path to the Excel file to save the monthly summaries to. If not provided, the file will be named "ACCOUNT_ID_month_year.xlsx".
 
+    overview : bool, optional
+        If True, an overview sheet with the month-by-category totals and trend charts is written to dest_file.
+
+    checkpoint_file : str, optional
+        The path to the checkpoint journal. Default is "cache/checkpoint_<dest_file name>.json".
+
+    resume : bool, optional
+        If True (default), resume from the checkpoint journal. If False, the journal is cleared and all the files are processed again.
+
     **kwargs : dict
         Additional keyword arguments to pass to the Monthly_Summary class.
 
     Returns:
     --------
-    None
+    summaries : list
+        The monthly summaries written to dest_file (in this run or, with overview, in a resumed one).
     """
     if isinstance(files, str):
         files = [files]
-
+    if checkpoint_file is None:
+        name = os.path.splitext(os.path.basename(dest_file))[0] if dest_file is not None else ACCOUNT_ID
+        checkpoint_file = os.path.join(CACHE_FOLDER, f"checkpoint_{name}.json")
+    checkpoint = Checkpoint_Journal(checkpoint_file)
+    if not resume:
+        checkpoint.clear()
+
+    summaries = []
     for i, file in enumerate(files):
-        print(f"Processing file {i+1}/{len(files)}")
-        if dest_file is None:
-            file_to_excel(file, **kwargs)
-        else:
-            file_to_excel(file, dest_file, **kwargs)
+        stage = checkpoint.stage(file, dest_file)
+        if stage == "written":
+            print(f"File {i+1}/{len(files)} already written, skipped")
+            if overview:
+                # The overview needs the summary of every month, rebuilt from the checkpointed operations
+                ms = Monthly_Summary(file, checkpoint = checkpoint, dest_file = dest_file, **kwargs)
+                ms.add_operations()
+                ms.add_monthly_budget()
+                if ms.month is not None and len(ms.operations) > 0:
+                    # The month as written in its sheet, without the operations left out as already in another month
+                    index = Fingerprint_Index.for_workbook(dest_file) if ms.dedup and dest_file is not None else None
+                    ms.excel_summary = ms.without_overlaps(index) if index is not None else ms
+                    summaries.append(ms)
+            continue
+        print(f"Processing file {i+1}/{len(files)}" + (f" (resuming after stage {stage})" if stage is not None else ""))
+        ms = Monthly_Summary(file, checkpoint = checkpoint, dest_file = dest_file, **kwargs)
+        ms.add_operations()
+        ms.add_monthly_budget()
+        if ms.to_excel(dest_file) is not None:
+            checkpoint.mark(file, "written", dest_file = dest_file)
+            summaries.append(ms)
+
+    if overview and dest_file is not None:
+        write_overview(dest_file, summaries)
+    elif overview and summaries:
+        summaries[-1].logger.warning("No dest_file given, the months are written to separate workbooks and the overview sheet is not written", title = "Overview warning")
+    save_search_indexes()
 
     print("All files processed")
-    return None
+    return summaries
 
 def process_folder(folder = "Data", dest_file = None, **kwargs):
     """Process all the PDF files in a folder and save the monthly summaries to an Excel file.
@@ -1225,9 +1653,9 @@ def process_folder(folder = "Data", dest_file = None, **kwargs):
     --------
     None
     """
-    if "/" in dest_file:
-        os.makedirs("/".join(dest_file.split("/")[:-1]), exist_ok=True)
-    files = [os.path.join(folder, f) for f in os.listdir(folder) if f.endswith(".pdf")]
+    if dest_file is not None and os.path.dirname(dest_file):
+        os.makedirs(os.path.dirname(dest_file), exist_ok=True)
+    files = resolve_inputs(folder)
     process_files(files, dest_file, **kwargs)
     return None
 
@@ -1239,12 +1667,34 @@ def process_folder(folder = "Data", dest_file = None, **kwargs):
 
 ############################################################################################
 
-def main():
+def main(argv = None):
+    import sys
     import argparse
-    parser = argparse.ArgumentParser(description="Process a PDF bank statement to extract the operations and categorize them")
+    argv = sys.argv[1:] if argv is None else argv
+    # Subcommands
+    if argv and argv[0] == "batch":
+        return batch_main(argv[1:])
+    if argv and argv[0] == "watch":
+        from src.watcher import watcher_main
+        return watcher_main(argv[1:])
+    if argv and argv[0] == "search":
+        from src.search import search_main
+        return search_main(argv[1:])
+    if argv and argv[0] == "recurring":
+        from src.recurring import recurring_main
+        return recurring_main(argv[1:])
+    if argv and argv[0] == "import":
+        from src.importer import import_main
+        return import_main(argv[1:])
+    if argv and argv[0] == "serve":
+        from src.server import serve_main
+        return serve_main(argv[1:])
+
+    parser = argparse.ArgumentParser(description="Process a PDF bank statement to extract the operations and categorize them. Use \"batch\" as first argument to process several files, \"watch\" to watch a folder, \"search\" to search the operations of a search index, \"recurring\" to list the recurring operations of a ledger, \"import\" to read back the month sheets of generated workbooks, or \"serve\" to run the local HTTP service (see batch --help, watch --help, search --help, recurring --help, import --help and serve --help)")
     parser.add_argument("file", type=str, help="The PDF file to process")
     parser.add_argument("--excel", type=str, help="The Excel file to save the data to")
     parser.add_argument("--budget", type=float, help="The monthly budget to set")
+    parser.add_argument("--mode", type=str, default="text", choices=["text", "markdown", "auto"], help="The parsing mode")
     parser.add_argument("--rules", type=str, help="The file containing the rules to categorize the operations")
     parser.add_argument("--ask_rules", action="store_true", help="Ask for the category of each operation")
     parser.add_argument("--handle_errors", action="store_false", help="Handle errors in the code")
@@ -1252,18 +1702,18 @@ def main():
     parser.add_argument("--do_log", action="store_true", help="Log the messages")
     parser.add_argument("--formatting", action="store_true", help="Format the log messages")
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     ms = Monthly_Summary(args.file, verbose = args.verbose, do_log = args.do_log, formatting = args.formatting, rules_file = args.rules, ask_rules = args.ask_rules, handle_errors = args.handle_errors)
-    ms.add_operations()
+    ms.add_operations(mode = args.mode)
     if args.budget is not None:
         ms.add_monthly_budget(args.budget)
     if args.excel is not None:
         ms.to_excel(args.excel)
-    return None
+    return 0
 
 if __name__ == "__main__":
-    main()
+    raise SystemExit(main())
 
 ############################################################################################
 
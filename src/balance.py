@@ -0,0 +1,100 @@
+###########################################################################################
+
+################## This package has been written by JB LBT (c) 2024 #######################
+################## Under the GNU GPL v3.0 Licence                   #######################
+
+###########################################################################################
+
+# Importing the necessary libraries
+import numpy as np
+import pandas as pd
+
+############################################################################################
+
+##################################### RUNNING BALANCE ######################################
+
+############################################################################################
+
+
+def daily_balance(operations, opening = 0.0, start = None, end = None):
+    """Balance at the end of each day, from an opening balance and the operations.
+
+    The net amount of each day is summed with a single bincount over the day offsets of the operations, and
+    the balances are its cumulative sum: the cost is one pass over the operations, whatever the number of days.
+
+    Parameters:
+    -----------
+    operations : DataFrame
+        The operations, with the "Date", "Debit (€)" and "Credit (€)" columns.
+
+    opening : float, optional
+        The balance before the first day.
+
+    start, end : str or datetime, optional
+        The first and last days of the series, default is the first and last dates of the operations. The
+        operations outside of the range are counted on its first or last day.
+
+    Returns:
+    --------
+    balance : Series
+        The end of day balance, indexed by all the days of the range, named "Balance (€)".
+    """
+    dates = pd.to_datetime(operations["Date"]).to_numpy().astype("datetime64[D]")
+    if start is None and end is None and len(dates) == 0:
+        return pd.Series([], index=pd.DatetimeIndex([]), dtype=float, name="Balance (€)")
+    first = np.datetime64(pd.Timestamp(start).date(), "D") if start is not None else dates.min()
+    last = np.datetime64(pd.Timestamp(end).date(), "D") if end is not None else dates.max()
+    if len(dates) and start is None:
+        first = min(first, dates.min())
+    if len(dates) and end is None:
+        last = max(last, dates.max())
+    n_days = max(int((last - first).astype(int)) + 1, 1)
+
+    net = (pd.to_numeric(operations["Credit (€)"], errors="coerce").fillna(0.0).to_numpy(dtype=float)
+           - pd.to_numeric(operations["Debit (€)"], errors="coerce").fillna(0.0).to_numpy(dtype=float))
+    offsets = np.clip((dates - first).astype(np.int64), 0, n_days - 1)
+    balance = opening + np.cumsum(np.bincount(offsets, weights=net, minlength=n_days))
+    return pd.Series(np.round(balance, 2), index=pd.date_range(pd.Timestamp(first), periods=n_days, freq="D"), name="Balance (€)")
+
+def balance_history(summaries, logger = None, tolerance = 0.005):
+    """Daily balance over several months, stitched from the cached series of each monthly summary.
+
+    The months are taken in chronological order. A month without a printed opening balance starts from the
+    closing balance of the previous month. When two statements overlap, the days of the later one are kept,
+    and the days between two statements keep the last known balance.
+
+    Parameters:
+    -----------
+    summaries : list
+        The Monthly_Summary objects, with their operations already added.
+
+    logger : Logger, optional
+        The logger warned when the opening balance of a month differs from the closing balance of the previous one.
+
+    tolerance : float, optional
+        The maximum absolute difference accepted between a closing and the next opening balance, in euros.
+
+    Returns:
+    --------
+    balance : Series
+        The end of day balance, indexed by all the days from the first to the last statement.
+    """
+    summaries = sorted(summaries, key=lambda s: (getattr(s, "start_date", None) or pd.Timestamp.max, s.year or 0, s.month or 0))
+    parts = []
+    previous = None
+    for summary in summaries:
+        opening = getattr(summary, "opening_balance", None)
+        if opening is None and previous is not None:
+            opening = float(previous.iloc[-1])
+        elif opening is not None and previous is not None and abs(opening - previous.iloc[-1]) > tolerance and logger is not None:
+            logger.warning(f"Opening balance of {summary.month}/{summary.year} ({opening:.2f}) differs from the previous closing balance ({previous.iloc[-1]:.2f})", title = "Balance warning")
+        series = summary.balance_series(opening = opening)
+        if len(series):
+            parts.append(series)
+            previous = series
+    if not parts:
+        return pd.Series([], index=pd.DatetimeIndex([]), dtype=float, name="Balance (€)")
+
+    history = pd.concat(parts)
+    history = history[~history.index.duplicated(keep="last")].sort_index()
+    return history.reindex(pd.date_range(history.index[0], history.index[-1], freq="D")).ffill().rename("Balance (€)")
@@ -0,0 +1,292 @@
+###########################################################################################
+
+################## This package has been written by JB LBT (c) 2024 #######################
+################## Under the GNU GPL v3.0 Licence                   #######################
+
+###########################################################################################
+
+# Importing the necessary libraries
+import os
+import glob
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import pandas as pd
+from src.utils import *
+from src.search import save_search_indexes
+
+############################################################################################
+
+##################################### BATCH PROCESSING #####################################
+
+############################################################################################
+
+
+def resolve_inputs(inputs):
+    """Expand a list of PDF files, folders and glob patterns into the sorted list of the PDF files.
+
+    Parameters:
+    -----------
+    inputs : list or str
+        Files, folders (all their PDF files are taken) or glob patterns (e.g. "Data/2023*.pdf").
+
+    Returns:
+    --------
+    files : list
+        The sorted, deduplicated list of the PDF files.
+    """
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            files += [os.path.join(item, f) for f in os.listdir(item) if f.lower().endswith(".pdf")]
+        elif any(c in item for c in "*?["):
+            files += [f for f in glob.glob(item, recursive=True) if f.lower().endswith(".pdf")]
+        elif os.path.exists(item):
+            files.append(item)
+    return sorted(set(files))
+
+
+class Batch_Result:
+    """Result of the processing of one file in a batch.
+
+    Attributes:
+    -----------
+    - file: str
+        The PDF file.
+    - summary: Monthly_Summary or None
+        The monthly summary, None if the processing failed.
+    - error: str or None
+        The error message if the processing failed.
+    - seconds: float
+        The processing time of the file.
+    - written: list
+        The outputs the summary was written to.
+    """
+    def __init__(self, file, summary = None, error = None, seconds = 0.0):
+        self.file = file
+        self.summary = summary
+        self.error = error
+        self.seconds = seconds
+        self.written = []
+
+    @property
+    def ok(self):
+        return self.error is None and self.summary is not None
+
+    def __str__(self):
+        if self.ok:
+            return f"OK     {self.file}: {len(self.summary.operations)} operations ({self.summary.month}/{self.summary.year}) in {self.seconds:.1f}s" + ("" if getattr(self.summary, "reconciliation", None) is None or self.summary.reconciliation.ok else " (balances do not reconcile)")
+        return f"FAILED {self.file}: {self.error}"
+
+
+def process_one(file, mode = "text", budget = None, **kwargs):
+    """Extract, parse and categorize one PDF file. Does not write anything.
+
+    Parameters:
+    -----------
+    file : str
+        The path to the PDF file.
+
+    mode : str, optional
+        The parsing mode, "text", "markdown" or "auto".
+
+    budget : float, optional
+        The monthly budget. If not provided, the automatic budget is used.
+
+    **kwargs : dict
+        Additional keyword arguments to pass to the Monthly_Summary class.
+
+    Returns:
+    --------
+    result : Batch_Result
+        The result of the processing.
+    """
+    from src.Monthly_Summary import Monthly_Summary
+    start = time.perf_counter()
+    try:
+        ms = Monthly_Summary(file, **kwargs)
+        ms.add_operations(mode = mode)
+        if len(ms.operations) == 0:
+            raise ValueError("No operations found")
+        ms.add_monthly_budget(budget)
+        return Batch_Result(file, summary = ms, seconds = time.perf_counter() - start)
+    except Exception as e:
+        return Batch_Result(file, error = f"{type(e).__name__}: {e}", seconds = time.perf_counter() - start)
+
+
+def run_batch(files, workers = 1, mode = "text", budget = None, progress = True, **kwargs):
+    """Process PDF files on a pool of workers, in parallel.
+
+    The extraction is dominated by the LlamaParse API calls, so the workers are threads sharing the
+    extraction engine and its clients.
+
+    Parameters:
+    -----------
+    files : list
+        The PDF files to process.
+
+    workers : int, optional
+        The number of files processed in parallel.
+
+    mode : str, optional
+        The parsing mode, "text", "markdown" or "auto".
+
+    budget : float, optional
+        The monthly budget of every summary. If not provided, the automatic budget is used.
+
+    progress : bool, optional
+        If True, print a line each time a file is done.
+
+    **kwargs : dict
+        Additional keyword arguments to pass to the Monthly_Summary class.
+
+    Returns:
+    --------
+    results : list
+        The Batch_Result of each file, in the order of the files.
+    """
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(process_one, file, mode, budget, **kwargs): file for file in files}
+        for done, future in enumerate(as_completed(futures), start=1):
+            result = future.result()
+            results[result.file] = result
+            if progress:
+                print(f"[{done}/{len(files)}] {result}")
+    save_search_indexes()
+    return [results[file] for file in files]
+
+
+def write_outputs(results, excel = None, csv_dir = None, columnar = None, overview = False):
+    """Write the summaries of a batch, in chronological order, to the requested outputs.
+
+    Parameters:
+    -----------
+    results : list
+        The Batch_Result of the batch, only the successful ones are written.
+
+    excel : str, optional
+        The Excel workbook the months are added to.
+
+    csv_dir : str, optional
+        The folder where one CSV file per month is written.
+
+    columnar : str, optional
+        A .parquet (or .feather) file where all the operations of the batch are written in one table,
+        with a "Source" column. Requires pyarrow.
+
+    overview : bool, optional
+        If True, the overview sheet of the Excel workbook is updated.
+
+    Returns:
+    --------
+    errors : list
+        The (output, error message) of the writes that failed.
+    """
+    ok = [r for r in results if r.ok]
+    ok.sort(key=lambda r: (r.summary.year, r.summary.month))
+    errors = []
+
+    if excel is not None:
+        folder = os.path.dirname(excel)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        for r in ok:
+            try:
+                r.summary.handle_errors = False
+                r.summary.to_excel(excel)
+                r.written.append(excel)
+            except Exception as e:
+                errors.append((excel, f"{r.file}: {e}"))
+        if overview and ok:
+            from src.overview import write_overview
+            try:
+                write_overview(excel, [r.summary for r in ok if excel in r.written])
+            except Exception as e:
+                errors.append((excel, f"overview: {e}"))
+
+    if csv_dir is not None:
+        os.makedirs(csv_dir, exist_ok=True)
+        for r in ok:
+            csv_file = os.path.join(csv_dir, f"{ACCOUNT_ID}_{r.summary.year}_{r.summary.month:02d}.csv")
+            try:
+                r.summary.handle_errors = False
+                r.summary.to_csv(csv_file)
+                r.written.append(csv_file)
+            except Exception as e:
+                errors.append((csv_file, f"{r.file}: {e}"))
+
+    if columnar is not None and ok:
+        try:
+            frames = [r.summary.operations.assign(Source=os.path.basename(r.file)) for r in ok]
+            table = pd.concat(frames, ignore_index=True)
+            folder = os.path.dirname(columnar)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            if columnar.endswith(".feather"):
+                table.to_feather(columnar)
+            else:
+                table.to_parquet(columnar, index=False)
+            for r in ok:
+                r.written.append(columnar)
+        except ImportError as e:
+            errors.append((columnar, f"pyarrow is required for columnar outputs ({e})"))
+        except Exception as e:
+            errors.append((columnar, str(e)))
+
+    return errors
+
+
+def batch_main(argv = None):
+    """Command line entry point of the batch mode: python -m src.Monthly_Summary batch <inputs> [options]."""
+    import argparse
+    parser = argparse.ArgumentParser(prog="batch", description="Process several PDF bank statements (files, folders or glob patterns) in parallel")
+    parser.add_argument("inputs", nargs="+", help="PDF files, folders or glob patterns to process")
+    parser.add_argument("--workers", type=int, default=4, help="The number of files processed in parallel")
+    parser.add_argument("--mode", type=str, default="text", choices=["text", "markdown", "auto"], help="The parsing mode (auto: text, then markdown if the balances do not reconcile)")
+    parser.add_argument("--excel", type=str, help="The Excel workbook to add the months to")
+    parser.add_argument("--csv_dir", type=str, help="The folder to write one CSV file per month to")
+    parser.add_argument("--columnar", type=str, help="The .parquet/.feather file to write all the operations to")
+    parser.add_argument("--overview", action="store_true", help="Write the overview sheet of the Excel workbook")
+    parser.add_argument("--static_totals", action="store_true", help="Write the totals as values instead of formulas")
+    parser.add_argument("--budget", type=float, help="The monthly budget to set")
+    parser.add_argument("--rules", type=str, help="The file containing the rules to categorize the operations")
+    parser.add_argument("--ledger", type=str, help="The SQLite ledger to write the operations to")
+    parser.add_argument("--index", type=str, help="The search index (.npz) to add the operations to")
+    parser.add_argument("--timeout", type=float, default=300, help="The timeout of an extraction call, in seconds")
+    parser.add_argument("--retries", type=int, default=3, help="The number of retries of a failed extraction call")
+    parser.add_argument("--rate", type=float, help="The maximum number of extraction calls per second")
+    parser.add_argument("--verbose", action="store_true", help="Print verbose messages")
+    parser.add_argument("--do_log", action="store_true", help="Log the messages")
+    args = parser.parse_args(argv)
+
+    from src.extraction import get_engine
+    engine = get_engine(call_timeout = args.timeout, retries = args.retries, rate = args.rate)
+
+    start = time.perf_counter()
+    files = resolve_inputs(args.inputs)
+    if not files:
+        print("No PDF file found")
+        return 1
+    if args.excel is None and args.csv_dir is None and args.columnar is None:
+        print("No output given (--excel, --csv_dir or --columnar), the files are only parsed")
+
+    print(f"Processing {len(files)} file(s) with {args.workers} worker(s)")
+    results = run_batch(files, workers = args.workers, mode = args.mode, budget = args.budget,
+                        verbose = 3 if args.verbose else 1, do_log = args.do_log, rules_file = args.rules,
+                        static_totals = args.static_totals, ledger_file = args.ledger, index_file = args.index)
+    parsed = time.perf_counter()
+    errors = write_outputs(results, excel = args.excel, csv_dir = args.csv_dir, columnar = args.columnar, overview = args.overview)
+    end = time.perf_counter()
+
+    print("\nSummary:")
+    for r in results:
+        print(f"  {r}")
+    for output, error in errors:
+        print(f"  WRITE FAILED {output}: {error}")
+    n_ok = sum(r.ok for r in results)
+    print(f"\n{n_ok}/{len(results)} file(s) processed, {len(errors)} write error(s)")
+    print(f"Timing: {parsed - start:.1f}s processing, {end - parsed:.1f}s writing, {end - start:.1f}s total")
+    print(f"Extraction: {engine.stats['calls']} call(s), {engine.stats['retries']} retry(ies), {engine.stats['timeouts']} timeout(s), circuit {engine.breaker.state}")
+    return 0 if n_ok == len(results) and not errors else 1
@@ -0,0 +1,188 @@
+###########################################################################################
+
+################## This package has been written by JB LBT (c) 2024 #######################
+################## Under the GNU GPL v3.0 Licence                   #######################
+
+###########################################################################################
+
+# Importing the necessary libraries
+import os
+import json
+import hashlib
+import threading
+from src.utils import *
+
+############################################################################################
+
+#################################### CATEGORY MEMO #########################################
+
+############################################################################################
+
+
+# Version of the memo files, the memos written by another version are not loaded
+MEMO_VERSION = 3
+
+
+def rules_hash(rules_file):
+    """Hash of the content of a rules file, used to invalidate the memos built with older rules."""
+    with open(rules_file, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+class Category_Memo:
+    """
+        Category_Memo
+        =============
+
+        Persistent {normalized description: category} table, so that the operations of an already seen
+        description are categorized with one lookup instead of running every rule, whatever their card number,
+        date or reference. As the rules match the raw labels, a key is only reused while all the labels seen for
+        it got the same category: a key whose labels got different categories is marked ambiguous (None) and its
+        labels always go through the rules. The labels normalized to an empty key (digits, dates and references
+        only) are never memoized. The memo is tied to the content of the rules file: it is emptied as soon as
+        the rules change.
+
+        Methods:
+        --------
+        - get: get the category of a description, or None
+        - update: add the categories of labels
+        - refresh: empty the memo if the rules file changed since it was built
+        - extend_rules: keep the memo in sync with rules appended to the rules file
+        - save: write the memo to its file
+    """
+    def __init__(self, rules_file, memo_file = None):
+        """Initialize the memo and load it from its file if it was built with the current rules.
+
+        Parameters:
+        -----------
+        rules_file : str
+            The path to the rules file the categories are computed from.
+
+        memo_file : str, optional
+            The path to the memo file. If not provided, the memo is stored in the cache folder.
+        """
+        self.rules_file = rules_file
+        if memo_file is None:
+            memo_file = os.path.join(CACHE_FOLDER, f"categories_{os.path.basename(rules_file).split('.')[0]}.json")
+        self.memo_file = memo_file
+        self.rules_hash = rules_hash(rules_file)
+        self.table = {}
+        self.modified = False
+        self._lock = threading.Lock()
+
+        if os.path.exists(self.memo_file):
+            try:
+                with open(self.memo_file, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("version") == MEMO_VERSION and data.get("rules_hash") == self.rules_hash:
+                    self.table = data.get("table", {})
+            except (OSError, ValueError):
+                self.table = {}
+
+    def refresh(self):
+        """Empty the memo if the rules file changed since the memo was built."""
+        current = rules_hash(self.rules_file)
+        with self._lock:
+            if current != self.rules_hash:
+                self.rules_hash = current
+                self.table = {}
+                self.modified = True
+        return None
+
+    def extend_rules(self, category = "Other"):
+        """Follow rules appended at the end of the rules file: only the entries of the fallback category can change, drop them and keep the others."""
+        current = rules_hash(self.rules_file)
+        with self._lock:
+            self.rules_hash = current
+            # The ambiguous keys are dropped too, the new rules may give their labels the same category
+            self.table = {k: v for k, v in self.table.items() if v is not None and v != category}
+            self.modified = True
+        return None
+
+    def get(self, label):
+        """Get the category of a label from its normalized description, or None if it is not in the memo or ambiguous."""
+        return self.table.get(normalize_description(label))
+
+    def update(self, mapping):
+        """Add the categories of labels to the memo.
+
+        Parameters:
+        -----------
+        mapping : dict
+            The {label: category} of the labels categorized with the current rules. The labels are grouped by
+            normalized description: a key is memoized if all its labels (and its current entry) have the same
+            category, marked ambiguous otherwise.
+
+        Returns:
+        --------
+        n : int
+            The number of keys added or marked ambiguous.
+        """
+        keys = {}
+        for label, category in mapping.items():
+            key = normalize_description(label)
+            if key:
+                keys.setdefault(key, set()).add(category)
+        n = 0
+        with self._lock:
+            for key, categories in keys.items():
+                if key in self.table and self.table[key] is None:
+                    continue
+                if key in self.table:
+                    categories = categories | {self.table[key]}
+                value = next(iter(categories)) if len(categories) == 1 else None
+                if self.table.get(key, "") != value:
+                    self.table[key] = value
+                    n += 1
+            if n:
+                self.modified = True
+        return n
+
+    def save(self):
+        """Write the memo to its file (through a temporary file, so a crash never leaves a corrupted memo)."""
+        with self._lock:
+            if not self.modified:
+                return None
+            folder = os.path.dirname(self.memo_file)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            tmp_file = f"{self.memo_file}.tmp"
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump({"version": MEMO_VERSION, "rules_hash": self.rules_hash, "table": self.table}, f, ensure_ascii=False)
+            os.replace(tmp_file, self.memo_file)
+            self.modified = False
+        return None
+
+    def __len__(self):
+        return sum(v is not None for v in self.table.values())
+
+    def __str__(self):
+        return f"Category memo {self.memo_file} with {len(self.table)} entries"
+
+
+_MEMOS = {}
+_MEMOS_LOCK = threading.Lock()
+
+def get_memo(rules_file, memo_file = None):
+    """Get the memo of a rules file, shared by all the summaries of the process.
+
+    Parameters:
+    -----------
+    rules_file : str
+        The path to the rules file.
+
+    memo_file : str, optional
+        The path to the memo file. If not provided, the memo is stored in the cache folder.
+
+    Returns:
+    --------
+    memo : Category_Memo
+        The memo, emptied if the rules file changed since it was built.
+    """
+    with _MEMOS_LOCK:
+        key = (os.path.abspath(rules_file), memo_file)
+        if key not in _MEMOS:
+            _MEMOS[key] = Category_Memo(rules_file, memo_file)
+        memo = _MEMOS[key]
+    memo.refresh()
+    return memo
@@ -0,0 +1,204 @@
+###########################################################################################
+
+################## This package has been written by JB LBT (c) 2024 #######################
+################## Under the GNU GPL v3.0 Licence                   #######################
+
+###########################################################################################
+
+# Importing the necessary libraries
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from src.utils import *
+
+############################################################################################
+
+################################## HEADLESS CHART RENDERING ################################
+
+############################################################################################
+
+
+CHART_FORMATS = ["png", "svg"]
+CHART_CACHE_FOLDER = os.path.join(CACHE_FOLDER, "charts")
+CHART_CACHE_SIZE = 256
+
+_CACHE = OrderedDict()
+_CACHE_LOCK = threading.Lock()
+
+
+def chart_key(labels, values, title = None, fmt = "png", dpi = 100):
+    """Hash of the data of a pie chart: two charts with the same key are identical."""
+    payload = json.dumps([list(map(str, labels)), [round(float(v), 2) for v in values], title, fmt, dpi])
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:20]
+
+def _render_pie(labels, values, title = None, fmt = "png", dpi = 100):
+    """Draw a pie chart on an Agg canvas (no display, no pyplot global state) and return the image bytes."""
+    import io
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure(figsize=(6, 6), dpi=dpi)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.pie(values, labels=labels, autopct='%1.1f%%')
+    ax.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
+    if title is not None:
+        ax.set_title(title)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=fmt, bbox_inches="tight")
+    return buffer.getvalue()
+
+def _cache_get(key, fmt, folder):
+    with _CACHE_LOCK:
+        if key in _CACHE:
+            _CACHE.move_to_end(key)
+            return _CACHE[key]
+    if folder is not None:
+        path = os.path.join(folder, f"{key}.{fmt}")
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                data = f.read()
+            _cache_put(key, fmt, data, None)
+            return data
+    return None
+
+def _cache_put(key, fmt, data, folder):
+    with _CACHE_LOCK:
+        _CACHE[key] = data
+        _CACHE.move_to_end(key)
+        while len(_CACHE) > CHART_CACHE_SIZE:
+            _CACHE.popitem(last=False)
+    if folder is not None:
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"{key}.{fmt}")
+        tmp_file = f"{path}.tmp"
+        with open(tmp_file, "wb") as f:
+            f.write(data)
+        os.replace(tmp_file, path)
+    return None
+
+def render_pie(labels, values, title = None, fmt = "png", dpi = 100, cache_folder = CHART_CACHE_FOLDER):
+    """Render a pie chart headlessly to PNG or SVG bytes, cached by the hash of its data.
+
+    Parameters:
+    -----------
+    labels : list
+        The labels of the slices.
+
+    values : list
+        The values of the slices.
+
+    title : str, optional
+        The title of the chart.
+
+    fmt : str, optional
+        The image format, "png" or "svg".
+
+    dpi : int, optional
+        The resolution of the PNG images.
+
+    cache_folder : str, optional
+        The folder the images are also cached to, shared by the processes and the runs. None to only keep them in memory.
+
+    Returns:
+    --------
+    image : bytes
+        The image of the chart.
+    """
+    if fmt not in CHART_FORMATS:
+        raise ValueError(f"Unknown chart format {fmt}, expected one of {CHART_FORMATS}")
+    key = chart_key(labels, values, title, fmt, dpi)
+    data = _cache_get(key, fmt, cache_folder)
+    if data is None:
+        data = _render_pie(list(labels), list(values), title, fmt, dpi)
+        _cache_put(key, fmt, data, cache_folder)
+    return data
+
+def render_pies(charts, fmt = "png", dpi = 100, workers = None, cache_folder = CHART_CACHE_FOLDER):
+    """Render many pie charts, the ones not cached yet in a pool of processes.
+
+    Parameters:
+    -----------
+    charts : list
+        The (labels, values, title) of each chart.
+
+    fmt : str, optional
+        The image format, "png" or "svg".
+
+    dpi : int, optional
+        The resolution of the PNG images.
+
+    workers : int, optional
+        The number of rendering processes, default is the number of CPUs. 1 renders in the current process.
+
+    cache_folder : str, optional
+        The folder the images are also cached to. None to only keep them in memory.
+
+    Returns:
+    --------
+    images : list
+        The image bytes of each chart, in the order of the charts.
+    """
+    if fmt not in CHART_FORMATS:
+        raise ValueError(f"Unknown chart format {fmt}, expected one of {CHART_FORMATS}")
+    charts = [(list(labels), list(values), title) for labels, values, title in charts]
+    keys = [chart_key(labels, values, title, fmt, dpi) for labels, values, title in charts]
+    images = [_cache_get(key, fmt, cache_folder) for key in keys]
+
+    # Render each missing chart once, even if it is requested several times
+    missing = {}
+    for i, key in enumerate(keys):
+        if images[i] is None:
+            missing.setdefault(key, i)
+    workers = workers or os.cpu_count() or 1
+    if len(missing) > 1 and workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=min(workers, len(missing))) as pool:
+            futures = {key: pool.submit(_render_pie, *charts[i], fmt, dpi) for key, i in missing.items()}
+            rendered = {key: future.result() for key, future in futures.items()}
+    else:
+        rendered = {key: _render_pie(*charts[i], fmt, dpi) for key, i in missing.items()}
+
+    for key, data in rendered.items():
+        _cache_put(key, fmt, data, cache_folder)
+    return [images[i] if images[i] is not None else rendered[key] for i, key in enumerate(keys)]
+
+def category_chart(summary, epargne = False):
+    """Labels, values and title of the pie chart of the debits by category of a monthly summary, from its cached totals."""
+    totals = summary.category_totals()["Debit (€)"]
+    if not epargne:
+        totals = totals[totals.index != "Epargne"]
+    totals = totals[totals > 0].sort_values(ascending=False, kind="stable")
+    title = f"{number_to_month[summary.month]} {summary.year}" if summary.month in number_to_month else None
+    return list(totals.index), totals.tolist(), title
+
+def plot_months(summaries, fmt = "png", epargne = False, workers = None, cache_folder = CHART_CACHE_FOLDER):
+    """Render the category pie charts of several months, in parallel and cached.
+
+    Parameters:
+    -----------
+    summaries : list
+        The Monthly_Summary objects, with their operations already added.
+
+    fmt : str, optional
+        The image format, "png" or "svg".
+
+    epargne : bool, optional
+        If True, the "Epargne" category is included.
+
+    workers : int, optional
+        The number of rendering processes.
+
+    cache_folder : str, optional
+        The folder the images are also cached to. None to only keep them in memory.
+
+    Returns:
+    --------
+    images : dict
+        The image bytes of each month, by sheet name ("Juin_2024").
+    """
+    summaries = [s for s in summaries if len(s.operations)]
+    images = render_pies([category_chart(s, epargne) for s in summaries], fmt=fmt, workers=workers, cache_folder=cache_folder)
+    return {f"{number_to_month[s.month]}_{s.year}": image for s, image in zip(summaries, images)}
@@ -0,0 +1,199 @@
+###########################################################################################
+
+################## This package has been written by JB LBT (c) 2024 #######################
+################## Under the GNU GPL v3.0 Licence                   #######################
+
+###########################################################################################
+
+# Importing the necessary libraries
+import io
+import os
+import json
+import hashlib
+import time
+import threading
+import pandas as pd
+from src.utils import *
+
+############################################################################################
+
+################################### CHECKPOINT JOURNAL #####################################
+
+############################################################################################
+
+
+STAGES = ["extracted", "parsed", "categorized", "written"]
+
+
+class Checkpoint_Journal:
+    """
+        Checkpoint_Journal
+        ==================
+
+        Journal of the stage reached by each PDF file of a batch run ("extracted", "parsed", "categorized",
+        "written"), so that an interrupted run resumes each file from its last completed stage.
+        The parsed and categorized operations are saved next to the journal, and a file is started again
+        from scratch if it changed since it was checkpointed.
+
+        Methods:
+        --------
+        - stage: the last completed stage of a file
+        - mark: record that a file reached a stage
+        - load: the operations and information saved at a stage
+        - clear: forget the checkpoints of a file (or of all the files)
+    """
+    def __init__(self, file):
+        """Load the journal, if it exists.
+
+        Parameters:
+        -----------
+        file : str
+            The path to the JSON journal. The operations are saved in the "<file>_data" folder.
+        """
+        self.file = file
+        self.data_folder = f"{os.path.splitext(file)[0]}_data"
+        self._lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(file):
+            try:
+                with open(file, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                self.entries = {}
+
+    @staticmethod
+    def _key(pdf):
+        return os.path.abspath(pdf)
+
+    @staticmethod
+    def _signature(pdf):
+        try:
+            stat = os.stat(pdf)
+            return [stat.st_mtime, stat.st_size]
+        except OSError:
+            return None
+
+    def _data_file(self, pdf, stage):
+        name = os.path.splitext(os.path.basename(pdf))[0]
+        key = hashlib.sha1(self._key(pdf).encode("utf-8")).hexdigest()[:8]
+        return os.path.join(self.data_folder, f"{name}_{key}_{stage}.json")
+
+    def _save(self):
+        folder = os.path.dirname(self.file)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp_file = f"{self.file}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, indent=1)
+        os.replace(tmp_file, self.file)
+        return None
+
+    def stage(self, pdf, dest_file = None):
+        """Last completed stage of a file, None if the file was not checkpointed or changed since.
+
+        Parameters:
+        -----------
+        pdf : str
+            The path to the PDF file.
+
+        dest_file : str, optional
+            The workbook of the run. The "written" stage only counts for the same workbook.
+
+        Returns:
+        --------
+        stage : str or None
+            One of STAGES, or None.
+        """
+        entry = self.entries.get(self._key(pdf))
+        if entry is None or entry.get("signature") != self._signature(pdf):
+            return None
+        stage = entry["stage"]
+        if stage == "written" and entry.get("dest") != (os.path.abspath(dest_file) if dest_file else None):
+            return "categorized"
+        if stage in ["parsed", "categorized", "written"] and not os.path.exists(self._data_file(pdf, "categorized" if stage == "written" else stage)):
+            return "extracted"
+        return stage
+
+    def mark(self, pdf, stage, operations = None, dest_file = None, **info):
+        """Record that a file reached a stage.
+
+        Parameters:
+        -----------
+        pdf : str
+            The path to the PDF file.
+
+        stage : str
+            One of STAGES.
+
+        operations : DataFrame, optional
+            The operations at this stage, saved to resume from it.
+
+        dest_file : str, optional
+            The workbook the file was written to (for the "written" stage).
+
+        **info : dict
+            Additional JSON-serializable information to keep with the stage (e.g. the start and end dates).
+
+        Returns:
+        --------
+        None
+        """
+        with self._lock:
+            if operations is not None:
+                os.makedirs(self.data_folder, exist_ok=True)
+                data_file = self._data_file(pdf, stage)
+                tmp_file = f"{data_file}.tmp"
+                # JSON with its table schema keeps the dtypes (dates, amounts), and unlike a pickle loading it runs no code
+                operations.to_json(tmp_file, orient="table", date_format="iso", force_ascii=False)
+                os.replace(tmp_file, data_file)
+            key = self._key(pdf)
+            entry = self.entries.get(key, {}) if stage != STAGES[0] else {}
+            entry.update(info)
+            entry.update({"stage": stage, "signature": self._signature(pdf), "t": round(time.time(), 3)})
+            if dest_file is not None:
+                entry["dest"] = os.path.abspath(dest_file)
+            self.entries[key] = entry
+            self._save()
+        return None
+
+    def load(self, pdf, stage):
+        """Operations and information saved when a file reached a stage.
+
+        Parameters:
+        -----------
+        pdf : str
+            The path to the PDF file.
+
+        stage : str
+            "parsed" or "categorized".
+
+        Returns:
+        --------
+        operations : DataFrame
+            The saved operations.
+
+        info : dict
+            The information recorded with the stages of the file.
+        """
+        with open(self._data_file(pdf, stage), "r", encoding="utf-8") as f:
+            operations = pd.read_json(io.StringIO(f.read()), orient="table")
+        return operations, dict(self.entries.get(self._key(pdf), {}))
+
+    def clear(self, pdf = None):
+        """Forget the checkpoints of a file, or of all the files if pdf is None."""
+        with self._lock:
+            pdfs = [pdf] if pdf is not None else list(self.entries)
+            for p in pdfs:
+                self.entries.pop(self._key(p), None)
+                for stage in ["parsed", "categorized"]:
+                    if os.path.exists(self._data_file(p, stage)):
+                        os.remove(self._data_file(p, stage))
+            self._save()
+        return None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __str__(self):
+        counts = {s: sum(e["stage"] == s for e in self.entries.values()) for s in STAGES}
+        return f"Checkpoint journal {self.file}: " + ", ".join(f"{n} {s}" for s, n in counts.items())
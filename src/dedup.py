@@ -0,0 +1,145 @@
+###########################################################################################
+
+################## This package has been written by JB LBT (c) 2024 #######################
+################## Under the GNU GPL v3.0 Licence                   #######################
+
+###########################################################################################
+
+# Importing the necessary libraries
+import os
+import json
+import threading
+import pandas as pd
+
+############################################################################################
+
+#################################### FINGERPRINT INDEX #####################################
+
+############################################################################################
+
+
+class Fingerprint_Index:
+    """
+        Fingerprint_Index
+        =================
+
+        Index of the fingerprints of the operations written in each sheet of a workbook, kept in a JSON file
+        next to it ("<workbook>.fingerprints.json"). A hash map from fingerprint to sheet gives, in O(n) for
+        n operations, the operations of a statement already written in another month (overlapping statements).
+
+        Methods:
+        --------
+        - overlap: mask of the operations already written in another sheet
+        - replace: set the fingerprints of a sheet
+        - remove: forget a sheet
+        - retain: forget the sheets that are no longer in the workbook
+        - save: write the index
+    """
+    def __init__(self, file):
+        """Load the index, if it exists.
+
+        Parameters:
+        -----------
+        file : str
+            The path to the JSON index.
+        """
+        self.file = file
+        self._lock = threading.Lock()
+        self.sheets = {}
+        if os.path.exists(file):
+            try:
+                with open(file, "r", encoding="utf-8") as f:
+                    self.sheets = json.load(f).get("sheets", {})
+            except (OSError, ValueError):
+                self.sheets = {}
+        self.owner = {fp: sheet for sheet, fps in self.sheets.items() for fp in fps}
+
+    @classmethod
+    def for_workbook(cls, workbook):
+        """Index of a workbook, stored next to it. The sheets deleted or renamed in the workbook since the index
+        was saved (or all of them, if the workbook was deleted) are ignored."""
+        index = cls(f"{os.path.splitext(workbook)[0]}.fingerprints.json")
+        if index.sheets:
+            sheetnames = []
+            if os.path.exists(workbook):
+                from openpyxl import load_workbook
+
+                # Read-only: only the list of the sheets is read, not their cells
+                wb = load_workbook(workbook, read_only=True)
+                sheetnames = wb.sheetnames
+                wb.close()
+            index.retain(sheetnames)
+        return index
+
+    def overlap(self, fingerprints, sheet):
+        """Mask of the operations already written in another sheet than the given one.
+
+        Parameters:
+        -----------
+        fingerprints : Series
+            The fingerprints of the operations.
+
+        sheet : str
+            The sheet the operations are written to. Its own fingerprints are not overlaps (the sheet is replaced).
+
+        Returns:
+        --------
+        mask : Series
+            True for the operations already written in another sheet.
+        """
+        owners = fingerprints.map(self.owner)
+        return owners.notna() & (owners != sheet)
+
+    def owners(self, fingerprints):
+        """Sheet each operation was written to, NaN if it was not written yet."""
+        return fingerprints.map(self.owner)
+
+    def replace(self, sheet, fingerprints):
+        """Set the fingerprints of a sheet, replacing the previous ones."""
+        with self._lock:
+            self._remove(sheet)
+            fps = [fp for fp in fingerprints]
+            self.sheets[sheet] = fps
+            self.owner.update(dict.fromkeys(fps, sheet))
+        return None
+
+    def _remove(self, sheet):
+        for fp in self.sheets.pop(sheet, []):
+            if self.owner.get(fp) == sheet:
+                del self.owner[fp]
+        return None
+
+    def remove(self, sheet):
+        """Forget the fingerprints of a sheet."""
+        with self._lock:
+            self._remove(sheet)
+        return None
+
+    def retain(self, sheets):
+        """Forget the fingerprints of the sheets that are not in the given list.
+
+        Returns:
+        --------
+        removed : list
+            The sheets forgotten.
+        """
+        with self._lock:
+            removed = [sheet for sheet in self.sheets if sheet not in sheets]
+            for sheet in removed:
+                self._remove(sheet)
+        return removed
+
+    def save(self):
+        """Write the index atomically."""
+        with self._lock:
+            tmp_file = f"{self.file}.tmp"
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump({"sheets": self.sheets}, f)
+            os.replace(tmp_file, self.file)
+        return None
+
+    def __len__(self):
+        return len(self.owner)
+
+    def __str__(self):
+        return f"Fingerprint index {self.file}: {len(self.owner)} operations in {len(self.sheets)} sheet(s)"
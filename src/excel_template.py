@@ -0,0 +1,182 @@
+###########################################################################################
+
+################## This package has been written by JB LBT (c) 2024 #######################
+################## Under the GNU GPL v3.0 Licence                   #######################
+
+###########################################################################################
+
+# Importing the necessary libraries
+from src.utils import *
+
+############################################################################################
+
+################################### MONTH SHEET TEMPLATE ###################################
+
+############################################################################################
+
+
+# Layout of a month sheet
+OPERATION_COLUMNS = ["Date", "Description", "Operation Date", "Debit (€)", "Credit (€)", "Category"]
+HEADER_ROW = 5                                              # the operations start on the next row
+SUMMARY_COL = len(OPERATION_COLUMNS) + 2                    # labels of the category totals, their values are on the next column
+DEBIT_ROW = 2                                               # first row of the debit totals
+CREDIT_ROW = DEBIT_ROW + len(CATEGORY_LIST) + 3             # first row of the credit totals
+SAVING_ROW = CREDIT_ROW + len(CATEGORY_LIST) + 2
+BALANCE_ROW = CREDIT_ROW + len(CATEGORY_LIST) + 5           # header of the daily balance, the days are on the next rows
+CHART_COL = SUMMARY_COL + 5
+COLUMN_WIDTHS = {"A": 17, "B": 30, "C": 20, "D": 15, "E": 15, "F": 15, "H": 20}
+
+# The template sheet is hidden in the workbook, its version is part of its name so an outdated one is rebuilt
+TEMPLATE_VERSION = 1
+TEMPLATE_PREFIX = "_template"
+TEMPLATE_SHEET = f"{TEMPLATE_PREFIX}_v{TEMPLATE_VERSION}"
+
+# Named styles of the month sheets, registered once per workbook
+TITLE_STYLE = "BNP title"
+LABEL_STYLE = "BNP label"
+HEADER_STYLE = "BNP header"
+ROW_STYLES = ("BNP row", "BNP row alt")                    # odd and even operation rows
+DATE_STYLES = ("BNP date", "BNP date alt")
+TOTAL_STYLE = "BNP total"
+FRAME_STYLE = "BNP frame"
+
+
+def _named_styles():
+    """The named styles of the month sheets."""
+    from copy import copy
+    from openpyxl.styles import NamedStyle, Font, PatternFill, Border, Side
+    from openpyxl.styles.fonts import DEFAULT_FONT
+
+    thin = Side(style='thin')
+    frame = Border(left=thin, right=thin, top=thin, bottom=thin)
+    light = PatternFill(start_color="F0F0F0", end_color="F0F0F0", fill_type="solid")
+    gray = PatternFill(start_color="D3D3D3", end_color="D3D3D3", fill_type="solid")
+    black = PatternFill(start_color="000000", end_color="000000", fill_type="solid")
+    return [
+        NamedStyle(name=TITLE_STYLE, font=Font(bold=True, size=20)),
+        NamedStyle(name=LABEL_STYLE, font=Font(bold=True)),
+        NamedStyle(name=HEADER_STYLE, font=Font(bold=True, size=16, color="FFFFFF"), fill=black, border=frame),
+        NamedStyle(name=ROW_STYLES[0], font=copy(DEFAULT_FONT), fill=light, border=frame),
+        NamedStyle(name=ROW_STYLES[1], font=copy(DEFAULT_FONT), fill=gray, border=frame),
+        NamedStyle(name=DATE_STYLES[0], font=copy(DEFAULT_FONT), fill=light, border=frame, number_format='dd/mm/yyyy'),
+        NamedStyle(name=DATE_STYLES[1], font=copy(DEFAULT_FONT), fill=gray, border=frame, number_format='dd/mm/yyyy'),
+        NamedStyle(name=TOTAL_STYLE, font=Font(bold=True, color="FFFFFF"), fill=black),
+        NamedStyle(name=FRAME_STYLE, font=copy(DEFAULT_FONT), border=frame),
+    ]
+
+def register_styles(wb):
+    """Add the named styles of the month sheets to a workbook, if they are not there yet."""
+    for style in _named_styles():
+        if style.name not in wb.named_styles:
+            wb.add_named_style(style)
+    return None
+
+def get_template(wb):
+    """Get the template sheet of a workbook, building it if it is missing or outdated.
+
+    The template holds everything a month sheet has that does not depend on the month: the labels, the header
+    of the operations, the frames of the category totals, the column widths and the row heights. Its cells
+    already carry their named styles, so a month sheet only copies it and fills the values.
+    """
+    for name in list(wb.sheetnames):
+        if name.startswith(TEMPLATE_PREFIX) and name != TEMPLATE_SHEET:
+            del wb[name]
+    if TEMPLATE_SHEET in wb.sheetnames:
+        return wb[TEMPLATE_SHEET]
+
+    register_styles(wb)
+    ws = wb.create_sheet(TEMPLATE_SHEET)
+    ws.sheet_state = "hidden"
+
+    ws.cell(row=1, column=1).style = TITLE_STYLE
+    ws.row_dimensions[1].height = 30
+    ws.cell(row=2, column=1, value="Budget:").style = LABEL_STYLE
+    ws.cell(row=3, column=1, value="Remaining budget:").style = LABEL_STYLE
+
+    for c_idx, value in enumerate(OPERATION_COLUMNS, start=1):
+        ws.cell(row=HEADER_ROW, column=c_idx, value=value).style = HEADER_STYLE
+    ws.row_dimensions[HEADER_ROW].height = 18
+    for col, width in COLUMN_WIDTHS.items():
+        ws.column_dimensions[col].width = width
+
+    for idx, category in enumerate(CATEGORY_LIST):
+        for row, label in [(DEBIT_ROW + idx, f"Débit {category} (€)"), (CREDIT_ROW + idx, f"Crédit {category} (€)")]:
+            ws.cell(row=row, column=SUMMARY_COL, value=label).style = FRAME_STYLE
+            ws.cell(row=row, column=SUMMARY_COL + 1).style = FRAME_STYLE
+    ws.cell(row=SAVING_ROW, column=SUMMARY_COL, value="Saving rate")
+    for c_idx, value in enumerate(["Date", "Solde (€)"]):
+        ws.cell(row=BALANCE_ROW, column=SUMMARY_COL + c_idx, value=value).style = LABEL_STYLE
+    return ws
+
+def new_month_sheet(wb, sheet_name, position = 0):
+    """Create a month sheet as a copy of the template of the workbook.
+
+    Parameters:
+    -----------
+    wb : Workbook
+        The workbook, its template is built if needed.
+
+    sheet_name : str
+        The name of the sheet ("Juin_2024").
+
+    position : int, optional
+        The position of the sheet in the workbook.
+
+    Returns:
+    --------
+    ws : Worksheet
+        The month sheet, with its static cells, styles, conditional formats and dimensions, without data nor charts.
+    """
+    from openpyxl.styles import PatternFill
+    from openpyxl.formatting.rule import CellIsRule
+
+    ws = wb.copy_worksheet(get_template(wb))
+    ws.title = sheet_name
+    ws.sheet_state = "visible"
+    wb.move_sheet(ws, offset=position - wb.index(ws))
+
+    # The conditional formats are not copied with the sheet: red if the remaining budget is negative and green if positive
+    red_fill = PatternFill(start_color="FF0000", end_color="FF0000", fill_type="solid")
+    green_fill = PatternFill(start_color="00FF00", end_color="00FF00", fill_type="solid")
+    ws.conditional_formatting.add("B3:B3", CellIsRule(operator='lessThan', formula=['0'], fill=red_fill))
+    ws.conditional_formatting.add("B3:B3", CellIsRule(operator='greaterThan', formula=['0'], fill=green_fill))
+    return ws
+
+def add_month_charts(ws, balance_days = 0):
+    """Add the charts of a month sheet: the pie charts of the debit and credit totals by category, and the line
+    chart of the daily balance if the sheet has one. The charts only reference the fixed ranges of the layout.
+
+    Parameters:
+    -----------
+    ws : Worksheet
+        The month sheet, with its values filled.
+
+    balance_days : int, optional
+        The number of days of the daily balance, 0 if the sheet has none.
+
+    Returns:
+    --------
+    None
+    """
+    from openpyxl.chart import PieChart, LineChart, Reference
+    from openpyxl.utils import get_column_letter
+
+    n = len(CATEGORY_LIST)
+    chart_col = get_column_letter(CHART_COL)
+    for first_row, title, anchor in [(DEBIT_ROW, "Debit (€) by Category", DEBIT_ROW), (CREDIT_ROW, "Credit (€) by Category", CREDIT_ROW + 3)]:
+        pie = PieChart()
+        pie.add_data(Reference(ws, min_col=SUMMARY_COL + 1, min_row=first_row - 1, max_row=first_row + n - 1), titles_from_data=True)
+        pie.set_categories(Reference(ws, min_col=SUMMARY_COL, min_row=first_row, max_row=first_row + n - 1))
+        pie.title = title
+        ws.add_chart(pie, f"{chart_col}{anchor}")
+
+    if balance_days:
+        line = LineChart()
+        line.title = "Balance (€)"
+        line.add_data(Reference(ws, min_col=SUMMARY_COL + 1, min_row=BALANCE_ROW, max_row=BALANCE_ROW + balance_days), titles_from_data=True)
+        line.set_categories(Reference(ws, min_col=SUMMARY_COL, min_row=BALANCE_ROW + 1, max_row=BALANCE_ROW + balance_days))
+        line.x_axis.number_format = 'dd/mm'
+        line.legend = None
+        line.width, line.height = 18, 8
+        ws.add_chart(line, f"{chart_col}{BALANCE_ROW}")
+    return None
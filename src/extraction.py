@@ -0,0 +1,460 @@
+###########################################################################################
+
+################## This package has been written by JB LBT (c) 2024 #######################
+################## Under the GNU GPL v3.0 Licence                   #######################
+
+###########################################################################################
+
+# Importing the necessary libraries
+import os
+import time
+import random
+import threading
+from src.page_cache import Page_Cache, write_pages
+
+############################################################################################
+
+##################################### EXTRACTION ENGINE ####################################
+
+############################################################################################
+
+
+class Extraction_Error(Exception):
+    """Error of the extraction backend, after the retries."""
+
+class Extraction_Timeout(Extraction_Error):
+    """An extraction call did not complete within its timeout."""
+
+class Circuit_Open_Error(Extraction_Error):
+    """The circuit breaker is open, the backend is not called."""
+
+
+class Token_Bucket:
+    """Thread-safe token bucket limiting the rate of the calls to the backend, shared by all the workers.
+
+    Parameters:
+    -----------
+    rate : float
+        The number of tokens added per second (the sustained number of calls per second).
+
+    capacity : int, optional
+        The maximum number of tokens (the burst size). Default is max(1, rate).
+    """
+    def __init__(self, rate, capacity = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens = 1.0):
+        """Take tokens from the bucket, waiting until they are available. Returns the time waited, in seconds."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return waited
+                delay = (tokens - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class Circuit_Breaker:
+    """Circuit breaker of the backend: after failure_threshold consecutive failures the circuit opens and the calls
+    fail fast for reset_timeout seconds, then a single trial call is let through (half-open) to close it again.
+
+    Parameters:
+    -----------
+    failure_threshold : int, optional
+        The number of consecutive failures opening the circuit.
+
+    reset_timeout : float, optional
+        The number of seconds the circuit stays open before a trial call.
+    """
+    def __init__(self, failure_threshold = 5, reset_timeout = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        """Raise Circuit_Open_Error if the backend must not be called."""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return None
+            if state == "half-open" and not self.trial:
+                self.trial = True
+                return None
+            retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+            raise Circuit_Open_Error(f"Extraction backend unavailable after {self.failures} consecutive failures, next trial in {retry_in:.0f}s")
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+        return None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.trial = False
+        return None
+
+    def release(self):
+        """End a call that neither succeeded nor failed on the backend side (e.g. a missing file), so a trial call
+        of the half-open state does not block the following ones."""
+        with self._lock:
+            self.trial = False
+        return None
+
+
+# Errors that will not be fixed by calling the backend again
+PERMANENT_ERRORS = (FileNotFoundError, PermissionError, IsADirectoryError, ImportError)
+
+
+class Extraction_Engine:
+    """
+        Extraction_Engine
+        =================
+
+        Single entry point to extract the pages of a PDF statement with LlamaParse.
+        The LlamaParse clients (one per result type) are created once and reused for every document, so
+        batch runs do not pay the client construction for each statement. The clients do not share an HTTP
+        connection pool: each call runs on its own event loop (in a thread of its own), and an async
+        connection pool cannot be reused across event loops.
+
+        Every call to the backend has a timeout, is retried with an exponential backoff and jitter, goes
+        through a token bucket shared by all the workers and through a circuit breaker, so a slow or failing
+        backend does not stall or kill a batch. The backend can be replaced (e.g. by a local fake server)
+        with the backend argument.
+
+        Methods:
+        --------
+        - get_parser: get the (cached) LlamaParse client for a mode
+        - extract: extract the pages of a document, without cache
+        - load: extract the pages of a document, using the on-disk cache if available
+        - close: forget the clients
+    """
+    def __init__(self, num_workers = 4, language = "en", verbose = False, max_connections = 10,
+                 call_timeout = 300, retries = 3, backoff = 2.0, max_backoff = 60.0, rate = None, burst = None,
+                 failure_threshold = 5, reset_timeout = 60.0, max_hung_calls = None, backend = None, **parser_kwargs):
+        """Initialize the engine. The clients are only created on the first extraction.
+
+        Parameters:
+        -----------
+        num_workers : int, optional
+            The number of API calls LlamaParse can run in parallel when several files are passed.
+
+        language : str, optional
+            The language of the documents, default is "en".
+
+        verbose : bool, optional
+            The verbosity of the LlamaParse clients.
+
+        max_connections : int, optional
+            The maximum number of calls to the backend running at the same time.
+
+        call_timeout : float, optional
+            The timeout of a whole extraction call (upload, parsing and download), in seconds. None for no timeout.
+            A timed out call can not be interrupted: its thread is left running, counted as hung until it returns.
+
+        retries : int, optional
+            The number of retries of a failed or timed out call.
+
+        backoff : float, optional
+            The base delay of the exponential backoff, in seconds. The n-th retry waits a random delay
+            between 0 and min(max_backoff, backoff * 2**n) (full jitter).
+
+        max_backoff : float, optional
+            The maximum delay between two retries, in seconds.
+
+        rate : float, optional
+            The maximum number of calls per second to the backend, shared by all the threads. None for no limit.
+
+        burst : int, optional
+            The number of calls allowed in a burst by the rate limiter. Default is max(1, rate).
+
+        failure_threshold : int, optional
+            The number of consecutive failed calls opening the circuit breaker.
+
+        reset_timeout : float, optional
+            The number of seconds the circuit breaker stays open before a trial call.
+
+        max_hung_calls : int, optional
+            The maximum number of timed out calls still running. Beyond it, the calls fail without starting a new
+            thread until some of them return. Default is max_connections.
+
+        backend : callable, optional
+            A function (document, mode) -> list of pages replacing LlamaParse (e.g. a client of a local fake server).
+
+        **parser_kwargs : dict
+            Additional keyword arguments passed to every LlamaParse client (e.g. base_url).
+        """
+        self.num_workers = num_workers
+        self.language = language
+        self.verbose = verbose
+        self.max_connections = max_connections
+        self.call_timeout = call_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.bucket = Token_Bucket(rate, burst) if rate else None
+        self.breaker = Circuit_Breaker(failure_threshold, reset_timeout)
+        self.backend = backend
+        self.parser_kwargs = parser_kwargs
+        self.parsers = {}
+        self.max_hung_calls = max_hung_calls if max_hung_calls is not None else max_connections
+        self.hung_calls = 0
+        self.stats = {"calls": 0, "retries": 0, "timeouts": 0, "failures": 0, "rejected": 0, "throttled_seconds": 0.0}
+        self._slots = threading.BoundedSemaphore(max(max_connections, num_workers))
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key, value = 1):
+        with self._stats_lock:
+            self.stats[key] += value
+        return None
+
+    def get_parser(self, mode = "text"):
+        """Get the LlamaParse client for a result type, creating it on the first call.
+
+        Parameters:
+        -----------
+        mode : str, optional
+            The result type, "markdown" or "text".
+
+        Returns:
+        --------
+        parser : LlamaParse
+            The client, shared by all the documents extracted in this mode.
+        """
+        with self._lock:
+            if mode not in self.parsers:
+                from llama_parse import LlamaParse
+                kwargs = dict(
+                    result_type=mode,  # "markdown" and "text" are available
+                    num_workers=self.num_workers,  # if multiple files passed, split in `num_workers` API calls
+                    verbose=self.verbose,
+                    language=self.language,  # Optionally you can define a language, default=en
+                )
+                kwargs.update(self.parser_kwargs)
+                self.parsers[mode] = LlamaParse(**kwargs)  # can also be set in your env as LLAMA_CLOUD_API_KEY
+            return self.parsers[mode]
+
+    def _call(self, document, mode):
+        """Call the backend once, with the call timeout.
+
+        The call runs in a daemon thread of its own: a call that never returns keeps its thread but frees its
+        connection slot when it times out, and the number of such hung calls is capped by max_hung_calls.
+        """
+        if self.backend is not None:
+            target, args = self.backend, (document, mode)
+        else:
+            target, args = self.get_parser(mode).load_data, (document,)
+        if self.call_timeout is None:
+            return target(*args)
+        with self._lock:
+            if self.hung_calls >= self.max_hung_calls:
+                raise Extraction_Error(f"{self.hung_calls} timed out extraction calls are still running, {document} is not extracted")
+
+        call = {"done": False, "hung": False}
+        done = threading.Event()
+
+        def run():
+            try:
+                call["result"] = target(*args)
+            except BaseException as e:
+                call["error"] = e
+            finally:
+                with self._lock:
+                    call["done"] = True
+                    if call["hung"]:
+                        self.hung_calls -= 1
+                done.set()
+
+        with self._slots:
+            threading.Thread(target=run, name="extraction-call", daemon=True).start()
+            done.wait(self.call_timeout)
+            with self._lock:
+                if not call["done"]:
+                    # The call cannot be interrupted, its result is ignored
+                    call["hung"] = True
+                    self.hung_calls += 1
+        if call["hung"]:
+            raise Extraction_Timeout(f"Extraction of {document} did not complete in {self.call_timeout}s")
+        if "error" in call:
+            raise call["error"]
+        return call["result"]
+
+    def extract(self, document, mode = "text", logger = None):
+        """Extract the pages of a PDF document, without using the cache.
+
+        The call is retried with an exponential backoff and jitter on errors, timeouts and empty results,
+        rate limited by the shared token bucket and rejected when the circuit breaker is open.
+
+        Parameters:
+        -----------
+        document : str
+            The path to the PDF file.
+
+        mode : str, optional
+            The result type, "markdown" or "text".
+
+        logger : Logger, optional
+            The logger to report the retries to.
+
+        Returns:
+        --------
+        documents : list
+            The list of the extracted pages (one LlamaParse Document per page).
+        """
+        attempt = 0
+        while True:
+            try:
+                self.breaker.allow()
+            except Circuit_Open_Error:
+                self._count("rejected")
+                raise
+            if self.bucket is not None:
+                self._count("throttled_seconds", self.bucket.acquire())
+            self._count("calls")
+            try:
+                documents = self._call(document, mode)
+                if not documents:
+                    raise Extraction_Error(f"No page extracted from {document}")
+            except PERMANENT_ERRORS:
+                # Not a failure of the backend, but a half-open trial must not stay pending
+                self.breaker.release()
+                raise
+            except Exception as e:
+                self._count("timeouts" if isinstance(e, Extraction_Timeout) else "failures")
+                self.breaker.record_failure()
+                if attempt >= self.retries:
+                    raise e
+                delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+                attempt += 1
+                self._count("retries")
+                if logger:
+                    logger.warning(f"Extraction attempt {attempt} of {document} failed ({type(e).__name__}: {e}), retrying in {delay:.1f}s", title = "Extraction warning")
+                time.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return documents
+
+    @staticmethod
+    def cache_file(document, mode):
+        """Path of the cache file of a document for a mode."""
+        return f"{os.path.splitext(document)[0]}_{mode}.pages"
+
+    def load(self, document, mode = "text", logger = None, handle_errors = True):
+        """Extract the pages of a PDF document, using the on-disk cache if the document was already extracted.
+
+        Only the text of the pages is cached, compressed, in a versioned page cache file (see src.page_cache).
+        The pickles of LlamaParse Documents written by previous versions are not loaded.
+
+        Parameters:
+        -----------
+        document : str
+            The path to the PDF file.
+
+        mode : str, optional
+            The result type, "markdown" or "text".
+
+        logger : Logger, optional
+            The logger to report to.
+
+        handle_errors : bool, optional
+            If True, extraction errors are logged and None is returned. If False, they are raised.
+
+        Returns:
+        --------
+        documents : Page_Cache, list or None
+            The sequence of the extracted pages, decoded when accessed, or None if the extraction failed. The
+            list of the extracted pages if they could not be written to the cache.
+        """
+        cache_file = self.cache_file(document, mode)
+        # A cache older than the document (e.g. a statement replaced in a watched folder) is stale
+        if os.path.exists(cache_file) and os.path.exists(document) and os.path.getmtime(cache_file) < os.path.getmtime(document):
+            if logger:
+                logger.log(f"Cache file {cache_file} is older than {document}, extracting it again")
+            os.remove(cache_file)
+        if os.path.exists(cache_file):
+            try:
+                documents = Page_Cache(cache_file)
+                if logger:
+                    logger.log(f"Document {document} successfully loaded from cache file {cache_file}")
+                return documents
+            except Exception as e:
+                if logger:
+                    logger.error(f"Error while loading the cache file: {e}", title = "Loading error")
+                    logger.warning("Deleting the cache file and parsing the document from scratch")
+                os.remove(cache_file)
+
+        try:
+            documents = self.extract(document, mode, logger = logger)
+        except Exception as e:
+            if logger:
+                logger.error(f"Error while loading the document: {e}", title = "Loading error")
+            if not handle_errors:
+                raise e
+            return None
+
+        if logger:
+            logger.log(f"Document successfully loaded in mode {mode}")
+        try:
+            write_pages(cache_file, documents, document = document, mode = mode)
+            documents = Page_Cache(cache_file)
+            if logger:
+                logger.log(f"Document successfully saved to cache file {cache_file}")
+        except Exception as e:
+            # The extracted pages are still used, the document is extracted again next time
+            if logger:
+                logger.error(f"Error while saving the cache file {cache_file}: {e}", title = "Cache error")
+        return documents
+
+    def close(self):
+        """Forget the clients. The timed out calls still running are not interrupted."""
+        with self._lock:
+            self.parsers = {}
+        return None
+
+
+_ENGINE = None
+_ENGINE_LOCK = threading.Lock()
+
+def get_engine(**kwargs):
+    """Get the extraction engine shared by the whole process, creating it on the first call.
+
+    Parameters:
+    -----------
+    **kwargs : dict
+        Keyword arguments passed to Extraction_Engine when it is created. Ignored afterwards.
+
+    Returns:
+    --------
+    engine : Extraction_Engine
+        The shared engine.
+    """
+    global _ENGINE
+    with _ENGINE_LOCK:
+        if _ENGINE is None:
+            _ENGINE = Extraction_Engine(**kwargs)
+        return _ENGINE
@@ -0,0 +1,210 @@
+###########################################################################################
+
+################## This package has been written by JB LBT (c) 2024 #######################
+################## Under the GNU GPL v3.0 Licence                   #######################
+
+###########################################################################################
+
+# Importing the necessary libraries
+import os
+import re
+import pandas as pd
+from src.utils import *
+from src.excel_template import OPERATION_COLUMNS, HEADER_ROW
+
+############################################################################################
+
+################################### WORKBOOK IMPORTER ######################################
+
+############################################################################################
+
+
+# Title of a month sheet written by to_excel: "Comptes pour le mois de Juin 2024 (du 2024-06-21 au 2024-07-22)"
+TITLE_PREFIX = "Comptes pour le mois de"
+_TITLE_REGEX = re.compile(r"Comptes pour le mois de (\S+) (\d{4})(?: \(du (\d{4}-\d{2}-\d{2}) au (\d{4}-\d{2}-\d{2})\))?")
+
+month_to_number = {v: k for k, v in number_to_month.items()}
+
+
+class Imported_Month:
+    """Month sheet read back from a workbook written by to_excel.
+
+    Attributes:
+    -----------
+    - sheet: str
+        The name of the sheet.
+    - month, year: int
+        The month and year of the sheet.
+    - start_date, end_date: datetime or None
+        The dates of the statement, from the title of the sheet.
+    - budget, remaining_budget: float or None
+        The budget and remaining budget of the month.
+    - operations: DataFrame
+        The operations, with the columns of the sheet ("Date", "Description", "Operation Date", "Debit (€)",
+        "Credit (€)", "Category").
+    """
+    def __init__(self, sheet, month, year, start_date, end_date, budget, remaining_budget, operations):
+        self.sheet = sheet
+        self.month = month
+        self.year = year
+        self.start_date = start_date
+        self.end_date = end_date
+        self.budget = budget
+        self.remaining_budget = remaining_budget
+        self.operations = operations
+
+    def to_summary(self, **kwargs):
+        """Monthly_Summary of the sheet, e.g. to add it to a ledger or a search index without parsing the PDF again."""
+        from src.Monthly_Summary import Monthly_Summary
+
+        summary = Monthly_Summary(self.sheet, self.month, self.year, self.operations.copy(), **kwargs)
+        if self.start_date is not None and self.end_date is not None:
+            summary.start_date, summary.end_date = self.start_date, self.end_date
+        summary.fingerprints = operation_fingerprints(summary.operations)
+        if self.budget is not None:
+            summary.add_monthly_budget(self.budget)
+        return summary
+
+    def __str__(self):
+        return f"{self.sheet}: {len(self.operations)} operations, budget {self.budget}"
+
+
+def read_month_sheet(ws):
+    """Read a month sheet written by to_excel, streaming its rows.
+
+    The title (A1) gives the month and the dates, B2 and B3 the budget and remaining budget, the header of
+    the operations is on row 5 and the operations follow until the "Total" row. Only the columns of the
+    operations are read, the category totals and the charts on the side are ignored.
+
+    Parameters:
+    -----------
+    ws : Worksheet
+        The worksheet, preferably from a workbook opened with read_only=True and data_only=True.
+
+    Returns:
+    --------
+    month : Imported_Month or None
+        The month, None if the sheet does not have the to_excel layout.
+    """
+    rows = ws.iter_rows(min_row=1, max_col=len(OPERATION_COLUMNS), values_only=True)
+    head = [next(rows, ()) for _ in range(HEADER_ROW)]
+    title = head[0][0] if head[0] else None
+    match = _TITLE_REGEX.match(title) if isinstance(title, str) else None
+    headers = [h for h in head[HEADER_ROW - 1] if h is not None] if head[HEADER_ROW - 1] else []
+    if match is None or match.group(1) not in month_to_number or headers[:2] != OPERATION_COLUMNS[:2]:
+        return None
+
+    def number(row):
+        value = head[row - 1][1] if len(head[row - 1]) > 1 else None
+        return float(value) if isinstance(value, (int, float)) else None
+
+    data = []
+    width = len(headers)
+    for values in rows:
+        if len(values) > 1 and values[1] == "Total":
+            break
+        if all(v is None for v in values):
+            continue
+        data.append(values[:width])
+    operations = pd.DataFrame(data, columns=headers)
+    for column in ["Date", "Operation Date"]:
+        if column in operations.columns:
+            operations[column] = pd.to_datetime(operations[column])
+    for column in ["Debit (€)", "Credit (€)"]:
+        if column in operations.columns:
+            operations[column] = pd.to_numeric(operations[column], errors="coerce").fillna(0.0).astype(float)
+
+    start_date = pd.Timestamp(match.group(3)) if match.group(3) else None
+    end_date = pd.Timestamp(match.group(4)) if match.group(4) else None
+    return Imported_Month(ws.title, month_to_number[match.group(1)], int(match.group(2)), start_date, end_date,
+                          number(2), number(3), operations)
+
+def read_workbook(file, sheets = None):
+    """Read the month sheets of a workbook written by to_excel, in read-only mode (values only, rows streamed).
+
+    Parameters:
+    -----------
+    file : str
+        The path to the Excel workbook.
+
+    sheets : list, optional
+        The names of the sheets to read, default is all the month sheets. The other sheets (overview,
+        hidden template...) are skipped.
+
+    Returns:
+    --------
+    months : list
+        The Imported_Month of each month sheet, in chronological order.
+    """
+    from openpyxl import load_workbook
+
+    wb = load_workbook(file, read_only=True, data_only=True)
+    try:
+        months = []
+        for ws in wb.worksheets:
+            if (sheets is not None and ws.title not in sheets) or ws.sheet_state != "visible":
+                continue
+            month = read_month_sheet(ws)
+            if month is not None:
+                months.append(month)
+    finally:
+        wb.close()
+    return sorted(months, key=lambda m: (m.year, m.month))
+
+def workbook_operations(file, sheets = None):
+    """All the operations of the month sheets of a workbook, in one DataFrame with a "Sheet" column."""
+    months = read_workbook(file, sheets)
+    if not months:
+        return pd.DataFrame(columns=OPERATION_COLUMNS + ["Sheet"])
+    return pd.concat([m.operations.assign(Sheet=m.sheet) for m in months], ignore_index=True)
+
+
+def import_main(argv = None):
+    """Command line entry point: import the month sheets of generated workbooks into a ledger, a search index or a table."""
+    import glob
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="python -m src.Monthly_Summary import", description="Read back the month sheets of workbooks written by to_excel, without parsing the PDF files again")
+    parser.add_argument("workbooks", type=str, nargs="+", help="The Excel workbooks (files or glob patterns)")
+    parser.add_argument("--ledger", type=str, help="The SQLite ledger to write the operations to")
+    parser.add_argument("--index", type=str, help="The search index (.npz) to add the operations to")
+    parser.add_argument("--columnar", type=str, help="The .parquet/.feather/.csv file to write all the operations to")
+    args = parser.parse_args(argv)
+
+    files = sorted({f for pattern in args.workbooks for f in (glob.glob(pattern) or [pattern]) if not os.path.basename(f).startswith("~$")})
+    frames = []
+    ledger = index = None
+    if args.ledger is not None:
+        from src.ledger import Ledger
+        ledger = Ledger(args.ledger)
+    if args.index is not None:
+        from src.search import Search_Index
+        index = Search_Index.load(args.index)
+
+    for file in files:
+        months = read_workbook(file)
+        print(f"{file}: {len(months)} month(s), {sum(len(m.operations) for m in months)} operations")
+        for month in months:
+            fingerprints = operation_fingerprints(month.operations)
+            if ledger is not None:
+                ledger.add_operations(month.operations, fingerprints, source = f"{file}:{month.sheet}")
+            if index is not None:
+                index.add_operations(month.operations, fingerprints, source = f"{file}:{month.sheet}")
+            frames.append(month.operations.assign(Source=os.path.basename(file), Sheet=month.sheet))
+
+    if ledger is not None:
+        print(ledger)
+        ledger.close()
+    if index is not None:
+        index.save(args.index)
+        print(index)
+    if args.columnar is not None and frames:
+        table = pd.concat(frames, ignore_index=True)
+        if args.columnar.endswith(".feather"):
+            table.to_feather(args.columnar)
+        elif args.columnar.endswith(".csv"):
+            table.to_csv(args.columnar, index=False)
+        else:
+            table.to_parquet(args.columnar, index=False)
+        print(f"{len(table)} operations written to {args.columnar}")
+    return 0
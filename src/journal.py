@@ -0,0 +1,134 @@
+###########################################################################################
+
+################## This package has been written by JB LBT (c) 2024 #######################
+################## Under the GNU GPL v3.0 Licence                   #######################
+
+###########################################################################################
+
+# Importing the necessary libraries
+import os
+import json
+import threading
+from datetime import datetime
+import pandas as pd
+
+############################################################################################
+
+##################################### CHANGE JOURNAL #######################################
+
+############################################################################################
+
+
+class Change_Journal:
+    """
+        Change_Journal
+        ==============
+
+        Append-only journal of the manual corrections of the operations, one JSON line per change:
+        {"fp": operation fingerprint, "col": column, "val": new value, "t": timestamp}.
+        As the operations are identified by their fingerprint and not by their position, the journal can be
+        replayed onto the operations of a re-parsed statement, so the corrections survive re-ingestion.
+
+        Methods:
+        --------
+        - record: append a batch of changes
+        - read: read all the changes
+        - replay: apply the changes to a DataFrame of operations
+    """
+    def __init__(self, file):
+        """Initialize the journal.
+
+        Parameters:
+        -----------
+        file : str
+            The path to the journal file (JSON lines). It is created on the first record.
+        """
+        self.file = file
+        self._lock = threading.Lock()
+
+    def record(self, fingerprints, column, values):
+        """Append a batch of changes to the journal in a single write.
+
+        Parameters:
+        -----------
+        fingerprints : iterable of str
+            The fingerprints of the modified operations.
+
+        column : str
+            The modified column.
+
+        values : iterable or scalar
+            The new values, one per fingerprint, or a single value for all of them.
+
+        Returns:
+        --------
+        n : int
+            The number of changes recorded.
+        """
+        fingerprints = list(fingerprints)
+        if not isinstance(values, (list, tuple, pd.Series)):
+            values = [values] * len(fingerprints)
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        lines = []
+        for fingerprint, value in zip(fingerprints, values):
+            if isinstance(value, pd.Timestamp):
+                value = value.isoformat()
+            elif hasattr(value, "item"):
+                value = value.item()
+            lines.append(json.dumps({"fp": fingerprint, "col": column, "val": value, "t": now}, ensure_ascii=False) + "\n")
+
+        folder = os.path.dirname(self.file)
+        with self._lock:
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            with open(self.file, "a", encoding="utf-8") as f:
+                f.writelines(lines)
+        return len(lines)
+
+    def read(self):
+        """Read all the changes of the journal, in order, as a DataFrame with the "fp", "col", "val" and "t" columns."""
+        if not os.path.exists(self.file):
+            return pd.DataFrame(columns=["fp", "col", "val", "t"])
+        with open(self.file, "r", encoding="utf-8") as f:
+            changes = [json.loads(line) for line in f if line.strip()]
+        return pd.DataFrame(changes, columns=["fp", "col", "val", "t"])
+
+    def replay(self, operations, fingerprints):
+        """Apply the journal to operations, the last change of each (operation, column) wins.
+
+        Parameters:
+        -----------
+        operations : DataFrame
+            The operations to correct, modified in place.
+
+        fingerprints : Series
+            The fingerprints of the operations, with the same index.
+
+        Returns:
+        --------
+        n : int
+            The number of cells modified.
+        """
+        changes = self.read()
+        if len(changes) == 0 or len(operations) == 0:
+            return 0
+        changes = changes.drop_duplicates(subset=["fp", "col"], keep="last")
+        n = 0
+        for column, group in changes.groupby("col"):
+            if column not in operations.columns:
+                continue
+            values = fingerprints.map(dict(zip(group["fp"], group["val"])))
+            mask = values.notna()
+            if not mask.any():
+                continue
+            new_values = values[mask]
+            if column in ["Date", "Operation Date"]:
+                new_values = pd.to_datetime(new_values)
+            elif column in ["Debit (€)", "Credit (€)"]:
+                new_values = new_values.astype(float)
+            operations.loc[mask, column] = new_values
+            n += int(mask.sum())
+        return n
+
+    def __str__(self):
+        return f"Change journal {self.file}"
@@ -0,0 +1,295 @@
+###########################################################################################
+
+################## This package has been written by JB LBT (c) 2024 #######################
+################## Under the GNU GPL v3.0 Licence                   #######################
+
+###########################################################################################
+
+# Importing the necessary libraries
+import os
+import sqlite3
+import threading
+import pandas as pd
+from src.utils import *
+
+############################################################################################
+
+######################################### LEDGER ###########################################
+
+############################################################################################
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS operations (
+    fingerprint     TEXT PRIMARY KEY,
+    account         TEXT NOT NULL,
+    date            TEXT NOT NULL,
+    operation_date  TEXT,
+    description     TEXT NOT NULL,
+    norm_description TEXT NOT NULL,
+    debit           REAL NOT NULL DEFAULT 0,
+    credit          REAL NOT NULL DEFAULT 0,
+    category        TEXT,
+    month           INTEGER,
+    year            INTEGER,
+    source          TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_operations_date ON operations (date);
+CREATE INDEX IF NOT EXISTS idx_operations_category ON operations (category, date);
+CREATE INDEX IF NOT EXISTS idx_operations_norm_description ON operations (norm_description COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_operations_period ON operations (year, month);
+"""
+
+UPSERT = """
+INSERT INTO operations (fingerprint, account, date, operation_date, description, norm_description, debit, credit, category, month, year, source)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(fingerprint) DO UPDATE SET
+    date = excluded.date,
+    operation_date = excluded.operation_date,
+    description = excluded.description,
+    norm_description = excluded.norm_description,
+    debit = excluded.debit,
+    credit = excluded.credit,
+    category = excluded.category,
+    month = excluded.month,
+    year = excluded.year,
+    source = excluded.source
+"""
+
+def like_escape(text):
+    """Escape the LIKE wildcards of a text, for a pattern with ESCAPE '\\'."""
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class Ledger:
+    """
+        Ledger
+        ======
+
+        Embedded SQLite store of all the ingested operations, indexed on the date, the category and the
+        normalized description. Operations are keyed on their fingerprint, so ingesting the same statement
+        twice updates the rows (e.g. new categories, or dates and amounts edited with modify_operations, which
+        keep the fingerprints) instead of duplicating them. The rows of a source that are not in its new
+        operations (e.g. a statement parsed again in another mode, or after a parser fix) are deleted.
+
+        Methods:
+        --------
+        - add_operations: upsert the operations of a monthly summary (or a DataFrame), in bulk
+        - query: select operations by description, category, dates and amounts
+        - totals: total debit and credit grouped by category, month or year
+        - close: close the connection
+    """
+    def __init__(self, file = "ledger.db", account = ACCOUNT_ID):
+        """Open (and create if needed) the ledger.
+
+        Parameters:
+        -----------
+        file : str, optional
+            The path to the SQLite database, default is "ledger.db". ":memory:" gives an in-memory ledger.
+
+        account : str, optional
+            The account the operations belong to, default is ACCOUNT_ID.
+        """
+        self.file = file
+        self.account = account
+        folder = os.path.dirname(file)
+        if folder and file != ":memory:":
+            os.makedirs(folder, exist_ok=True)
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(file, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        self.connection.commit()
+
+    def add_operations(self, operations, fingerprints = None, source = None, replace = True):
+        """Upsert operations in the ledger with a single executemany in one transaction.
+
+        Parameters:
+        -----------
+        operations : DataFrame or Monthly_Summary
+            The operations to add, or a monthly summary (its operations and fingerprints are used).
+
+        fingerprints : Series, optional
+            The fingerprints of the operations. Computed if not provided.
+
+        source : str, optional
+            The source of the operations (e.g. the PDF file).
+
+        replace : bool, optional
+            Whether the operations are all the operations of the source, default is True. The rows of the
+            source whose fingerprint is not in the operations are then deleted in the same transaction. Set
+            to False to upsert only some operations of the source (e.g. the ones edited).
+
+        Returns:
+        --------
+        n : int
+            The number of operations written.
+        """
+        if hasattr(operations, "operations"):
+            summary = operations
+            operations = summary.operations
+            if fingerprints is None and len(getattr(summary, "fingerprints", [])) == len(operations):
+                fingerprints = summary.fingerprints
+            if source is None:
+                source = getattr(summary, "pdf", None)
+        if len(operations) == 0:
+            return 0
+        if fingerprints is None:
+            fingerprints = operation_fingerprints(operations)
+
+        dates = pd.to_datetime(operations["Date"])
+        operation_dates = pd.to_datetime(operations["Operation Date"])
+        categories = operations["Category"] if "Category" in operations.columns else pd.Series([None] * len(operations), index=operations.index)
+        rows = zip(fingerprints.values,
+                   [self.account] * len(operations),
+                   dates.dt.strftime("%Y-%m-%d").values,
+                   operation_dates.dt.strftime("%Y-%m-%d").values,
+                   operations["Description"].astype(str).values,
+                   normalize_descriptions(operations["Description"]).values,
+                   operations["Debit (€)"].astype(float).values.tolist(),
+                   operations["Credit (€)"].astype(float).values.tolist(),
+                   categories.values,
+                   dates.dt.month.values.tolist(),
+                   dates.dt.year.values.tolist(),
+                   [source] * len(operations))
+        with self._lock:
+            with self.connection:
+                self.connection.executemany(UPSERT, rows)
+                if replace and source is not None:
+                    # Rows left by a previous parse of the same source would be counted twice in the totals
+                    kept = set(fingerprints.values)
+                    stale = [(fingerprint, ) for (fingerprint, ) in self.connection.execute(
+                        "SELECT fingerprint FROM operations WHERE source = ? AND account = ?", (source, self.account))
+                        if fingerprint not in kept]
+                    self.connection.executemany("DELETE FROM operations WHERE fingerprint = ?", stale)
+        return len(operations)
+
+    def query(self, description = None, category = None, start = None, end = None, min_amount = None, max_amount = None, year = None, limit = None):
+        """Select operations from the ledger.
+
+        Parameters:
+        -----------
+        description : str, optional
+            A word or merchant to look for in the normalized description (e.g. "SNCF"). A prefix ("SNC*")
+            uses the index on the normalized description. A term without letters outside of references
+            ("X1234") is looked for in the raw description. Raises ValueError if the term is empty.
+
+        category : str, optional
+            The category of the operations.
+
+        start, end : str or datetime, optional
+            The date range (inclusive).
+
+        min_amount, max_amount : float, optional
+            The range of the amount of the operations (debit or credit).
+
+        year : int, optional
+            The year of the operations.
+
+        limit : int, optional
+            The maximum number of operations to return.
+
+        Returns:
+        --------
+        operations : DataFrame
+            The operations, sorted by date, with the usual columns plus "Fingerprint" and "Source".
+        """
+        clauses, params = [], []
+        if description is not None:
+            # "SNC*" is a prefix query (served by the index on the normalized description), otherwise a substring query
+            prefix = description.endswith("*")
+            term = description.rstrip("*").strip()
+            normalized = normalize_description(term)
+            if normalized:
+                clauses.append("norm_description LIKE ? ESCAPE '\\'")
+                params.append(f"{like_escape(normalized)}%" if prefix else f"%{like_escape(normalized)}%")
+            elif term:
+                # The normalization drops the tokens with digits ("X1234"), look for them in the raw description
+                clauses.append("(' ' || description) LIKE ? ESCAPE '\\'")
+                params.append(f"% {like_escape(term)}%" if prefix else f"%{like_escape(term)}%")
+            else:
+                raise ValueError(f"Empty description query {description!r}")
+        if category is not None:
+            clauses.append("category = ?")
+            params.append(category)
+        if start is not None:
+            clauses.append("date >= ?")
+            params.append(pd.Timestamp(start).strftime("%Y-%m-%d"))
+        if end is not None:
+            clauses.append("date <= ?")
+            params.append(pd.Timestamp(end).strftime("%Y-%m-%d"))
+        if year is not None:
+            clauses.append("date >= ? AND date <= ?")
+            params += [f"{int(year)}-01-01", f"{int(year)}-12-31"]
+        if min_amount is not None:
+            clauses.append("MAX(debit, credit) >= ?")
+            params.append(float(min_amount))
+        if max_amount is not None:
+            clauses.append("MAX(debit, credit) <= ?")
+            params.append(float(max_amount))
+
+        sql = "SELECT fingerprint, date, description, operation_date, debit, credit, category, source FROM operations WHERE account = ?"
+        params = [self.account] + params
+        if clauses:
+            sql += " AND " + " AND ".join(clauses)
+        sql += " ORDER BY date"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+
+        with self._lock:
+            rows = self.connection.execute(sql, params).fetchall()
+        operations = pd.DataFrame(rows, columns=["Fingerprint", "Date", "Description", "Operation Date", "Debit (€)", "Credit (€)", "Category", "Source"])
+        operations["Date"] = pd.to_datetime(operations["Date"])
+        operations["Operation Date"] = pd.to_datetime(operations["Operation Date"])
+        return operations
+
+    def totals(self, by = "category", **filters):
+        """Total debit and credit of the operations, grouped by "category", "month" or "year".
+
+        Parameters:
+        -----------
+        by : str, optional
+            The grouping: "category", "month" or "year".
+
+        **filters : dict
+            The filters of query (description, category, start, end, year...).
+
+        Returns:
+        --------
+        totals : DataFrame
+            The "Debit (€)" and "Credit (€)" totals.
+        """
+        operations = self.query(**filters)
+        if by == "month":
+            key = operations["Date"].dt.to_period("M")
+        elif by == "year":
+            key = operations["Date"].dt.year
+        else:
+            key = operations["Category"]
+        return operations.groupby(key)[["Debit (€)", "Credit (€)"]].sum()
+
+    def __len__(self):
+        with self._lock:
+            return self.connection.execute("SELECT COUNT(*) FROM operations WHERE account = ?", (self.account,)).fetchone()[0]
+
+    def close(self):
+        """Close the connection to the database."""
+        with self._lock:
+            self.connection.close()
+        return None
+
+    def __str__(self):
+        return f"Ledger {self.file} of account {self.account} with {len(self)} operations"
+
+
+_LEDGERS = {}
+_LEDGERS_LOCK = threading.Lock()
+
+def get_ledger(file, account = ACCOUNT_ID):
+    """Get the ledger stored in a file, opened once and shared by all the summaries of the process."""
+    with _LEDGERS_LOCK:
+        key = (os.path.abspath(file) if file != ":memory:" else file, account)
+        if key not in _LEDGERS:
+            _LEDGERS[key] = Ledger(file, account)
+        return _LEDGERS[key]
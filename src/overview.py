@@ -0,0 +1,169 @@
+###########################################################################################
+
+################## This package has been written by JB LBT (c) 2024 #######################
+################## Under the GNU GPL v3.0 Licence                   #######################
+
+###########################################################################################
+
+# Importing the necessary libraries
+import os
+from src.utils import *
+
+############################################################################################
+
+#################################### OVERVIEW SHEET ########################################
+
+############################################################################################
+
+
+OVERVIEW_SHEET = "Overview"
+OVERVIEW_CATEGORIES = CATEGORY_LIST + ["Other"]
+OVERVIEW_COLUMNS = ["Mois", "Début", "Fin"] + [f"Débit {c} (€)" for c in OVERVIEW_CATEGORIES] + ["Total débit (€)", "Total crédit (€)", "Solde (€)", "Budget (€)"]
+HEADER_ROW = 3
+
+month_to_number = {v: k for k, v in number_to_month.items()}
+
+
+def _sort_key(sheet_name):
+    """Chronological sort key of a month sheet name ("Juin_2024")."""
+    try:
+        month, year = sheet_name.rsplit("_", 1)
+        return int(year), month_to_number[month]
+    except (ValueError, KeyError):
+        return 9999, 99
+
+def overview_row(summary):
+    """Aggregated values of a monthly summary for the overview sheet, computed from its cached category totals.
+
+    Parameters:
+    -----------
+    summary : Monthly_Summary
+        The monthly summary, with its operations already added.
+
+    Returns:
+    --------
+    row : list
+        The values of the row, in the order of OVERVIEW_COLUMNS.
+    """
+    totals = summary.category_totals()
+    total_debit = float(totals["Debit (€)"].sum())
+    total_credit = float(totals["Credit (€)"].sum())
+    start_date = summary.start_date.date() if getattr(summary, "start_date", None) is not None else None
+    end_date = summary.end_date.date() if getattr(summary, "end_date", None) is not None else None
+    return ([f"{number_to_month[summary.month]}_{summary.year}", start_date, end_date]
+            + [float(totals.at[c, "Debit (€)"]) for c in OVERVIEW_CATEGORIES]
+            + [total_debit, total_credit, total_credit - total_debit, getattr(summary, "budget", None)])
+
+def _read_overview(ws):
+    """Read the rows of an existing overview sheet, as {month sheet name: row values}."""
+    rows = {}
+    headers = [c.value for c in ws[HEADER_ROW]]
+    if headers[:len(OVERVIEW_COLUMNS)] != OVERVIEW_COLUMNS:
+        return rows
+    for values in ws.iter_rows(min_row=HEADER_ROW + 1, max_col=len(OVERVIEW_COLUMNS), values_only=True):
+        if values[0] is None:
+            break
+        rows[values[0]] = list(values)
+    return rows
+
+def write_overview(file, summaries, sheet_name = OVERVIEW_SHEET, logger = None):
+    """Write (or update) the overview sheet of a workbook: one row per month with the debit of each category,
+    the totals and the budget, plus a stacked bar chart of the categories and a trend chart of the totals.
+
+    The values come from the cached aggregates of the summaries, no formula is written. The months already in
+    the overview sheet are kept, the months of the given summaries replace them.
+
+    Parameters:
+    -----------
+    file : str
+        The path to the Excel file, it must exist.
+
+    summaries : list
+        The Monthly_Summary objects to add to the overview. A month written by to_excel counts the operations of
+        its sheet, without the ones left out as already written in another month.
+
+    sheet_name : str, optional
+        The name of the overview sheet, default is "Overview".
+
+    logger : Logger, optional
+        The logger to report to.
+
+    Returns:
+    --------
+    None
+    """
+    from openpyxl import load_workbook
+    from openpyxl.chart import BarChart, LineChart, Reference
+    from openpyxl.styles import Font, PatternFill
+
+    wb = load_workbook(file)
+    rows = {}
+    if sheet_name in wb.sheetnames:
+        rows = _read_overview(wb[sheet_name])
+        del wb[sheet_name]
+    for summary in summaries:
+        if summary.month is None:
+            # A statement that could not be parsed has no sheet
+            continue
+        row = overview_row(getattr(summary, "excel_summary", summary))
+        rows[row[0]] = row
+    months = sorted(rows, key=_sort_key)
+
+    ws = wb.create_sheet(sheet_name, 0)
+    title_cell = ws.cell(row=1, column=1, value="Vue d'ensemble des comptes")
+    title_cell.font = Font(bold=True, size=20)
+    ws.row_dimensions[1].height = 30
+
+    header_font = Font(bold=True, color="FFFFFF")
+    header_fill = PatternFill(start_color="000000", end_color="000000", fill_type="solid")
+    for c_idx, value in enumerate(OVERVIEW_COLUMNS, start=1):
+        cell = ws.cell(row=HEADER_ROW, column=c_idx, value=value)
+        cell.font = header_font
+        cell.fill = header_fill
+        ws.column_dimensions[cell.column_letter].width = 16 if c_idx > 1 else 18
+
+    for r_idx, month in enumerate(months, start=HEADER_ROW + 1):
+        for c_idx, value in enumerate(rows[month], start=1):
+            cell = ws.cell(row=r_idx, column=c_idx, value=value)
+            if c_idx in [2, 3]:
+                cell.number_format = 'dd/mm/yyyy'
+            elif c_idx > 3:
+                cell.number_format = '#,##0.00'
+
+    if months:
+        first_row, last_row = HEADER_ROW + 1, HEADER_ROW + len(months)
+        labels = Reference(ws, min_col=1, min_row=first_row, max_row=last_row)
+        chart_row = last_row + 3
+
+        # Stacked bars of the debits by category, month by month
+        bar = BarChart()
+        bar.type = "col"
+        bar.grouping = "stacked"
+        bar.overlap = 100
+        bar.title = "Debit (€) by Category"
+        bar.add_data(Reference(ws, min_col=4, max_col=3 + len(OVERVIEW_CATEGORIES), min_row=HEADER_ROW, max_row=last_row), titles_from_data=True)
+        bar.set_categories(labels)
+        bar.width, bar.height = 24, 10
+        ws.add_chart(bar, f"A{chart_row}")
+
+        # Trend of the total debit, total credit and balance
+        total_col = 4 + len(OVERVIEW_CATEGORIES)
+        line = LineChart()
+        line.title = "Monthly totals (€)"
+        line.add_data(Reference(ws, min_col=total_col, max_col=total_col + 2, min_row=HEADER_ROW, max_row=last_row), titles_from_data=True)
+        line.set_categories(labels)
+        line.width, line.height = 24, 10
+        ws.add_chart(line, f"A{chart_row + 22}")
+
+    # Save to a temporary file renamed over the workbook, so an error never leaves it half-written
+    root, ext = os.path.splitext(file)
+    tmp_file = f"{root}.tmp{ext}"
+    try:
+        wb.save(tmp_file)
+        os.replace(tmp_file, file)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+    if logger:
+        logger.log(f"Overview sheet {sheet_name} of {file} updated with {len(summaries)} month(s), {len(months)} month(s) in total")
+    return None
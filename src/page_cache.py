@@ -0,0 +1,204 @@
+###########################################################################################
+
+################## This package has been written by JB LBT (c) 2024 #######################
+################## Under the GNU GPL v3.0 Licence                   #######################
+
+###########################################################################################
+
+# Importing the necessary libraries
+import os
+import json
+import time
+import mmap
+import zlib
+import struct
+
+############################################################################################
+
+###################################### PAGE CACHE ##########################################
+
+############################################################################################
+
+# Layout of a page cache file (little endian):
+#   header   : magic "BNPC", format version (u16), codec (u16), number of pages (u32), metadata length (u32)
+#   metadata : JSON (document, mode, creation time)
+#   index    : one (offset u64, compressed length u32, text length u32) entry per page
+#   blocks   : the compressed UTF-8 text of each page, one after the other
+MAGIC = b"BNPC"
+VERSION = 1
+CODEC_NONE, CODEC_ZLIB = 0, 1
+HEADER = struct.Struct("<4sHHII")
+ENTRY = struct.Struct("<QII")
+
+
+class Cache_Format_Error(ValueError):
+    """The file is not a page cache, or was written by another version of the format."""
+
+
+class Page:
+    """Page extracted from a statement: its text and minimal metadata, like a LlamaParse Document."""
+    __slots__ = ("text", "metadata")
+
+    def __init__(self, text, metadata = None):
+        self.text = text
+        self.metadata = metadata if metadata is not None else {}
+
+    def __repr__(self):
+        return f"Page({self.metadata.get('page')}, {len(self.text)} characters)"
+
+
+def write_pages(file, pages, document = None, mode = None, level = 6):
+    """Write the text of extracted pages to a page cache file, atomically.
+
+    Parameters:
+    -----------
+    file : str
+        The path to the cache file.
+
+    pages : list
+        The extracted pages (LlamaParse Documents, Page objects or strings).
+
+    document : str, optional
+        The path to the PDF file the pages come from.
+
+    mode : str, optional
+        The extraction mode, "markdown" or "text".
+
+    level : int, optional
+        The zlib compression level, 0 to store the pages uncompressed.
+
+    Returns:
+    --------
+    None
+    """
+    codec = CODEC_ZLIB if level > 0 else CODEC_NONE
+    blocks, entries = [], []
+    for page in pages:
+        raw = (page if isinstance(page, str) else page.text).encode("utf-8")
+        blocks.append(zlib.compress(raw, level) if codec == CODEC_ZLIB else raw)
+        entries.append((len(blocks[-1]), len(raw)))
+    metadata = json.dumps({"document": document, "mode": mode, "created": round(time.time(), 3)}).encode("utf-8")
+
+    offset = HEADER.size + len(metadata) + ENTRY.size * len(blocks)
+    tmp_file = f"{file}.tmp"
+    with open(tmp_file, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, codec, len(blocks), len(metadata)))
+        f.write(metadata)
+        for size, length in entries:
+            f.write(ENTRY.pack(offset, size, length))
+            offset += size
+        for block in blocks:
+            f.write(block)
+    os.replace(tmp_file, file)
+    return None
+
+
+class Page_Cache:
+    """
+        Page_Cache
+        ==========
+
+        Read-only, lazy sequence of the pages of a page cache file. The file is memory-mapped and only its
+        header and index are read when it is opened: the text of a page is decompressed when the page is
+        accessed, so iterating over a long statement keeps a single page in memory.
+
+        Attributes:
+        -----------
+        - file: str
+            The path to the cache file.
+        - metadata: dict
+            The document, mode and creation time of the cache.
+
+        Methods:
+        --------
+        - text: the text of a page
+        - close: unmap the file (it is mapped again on the next access)
+    """
+    def __init__(self, file):
+        """Open a page cache file. Raises Cache_Format_Error if the file is not a valid page cache."""
+        self.file = file
+        self._mmap = None
+        self._buffer = None
+        self._open()
+        try:
+            self._read_index()
+        except Exception:
+            self.close()
+            raise
+
+    def _open(self):
+        with open(self.file, "rb") as f:
+            if os.fstat(f.fileno()).st_size < HEADER.size:
+                raise Cache_Format_Error(f"{self.file} is too short to be a page cache")
+            # The mapping stays valid once the file is closed
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buffer = memoryview(self._mmap)
+        return None
+
+    def close(self):
+        """Unmap the cache file (e.g. before it is replaced). The pages can still be accessed, the file is mapped again."""
+        if self._buffer is not None:
+            self._buffer.release()
+            self._buffer = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def _read_index(self):
+        buffer = self._buffer
+        magic, version, codec, n_pages, meta_length = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise Cache_Format_Error(f"{self.file} is not a page cache")
+        if version != VERSION or codec not in (CODEC_NONE, CODEC_ZLIB):
+            raise Cache_Format_Error(f"{self.file} uses the page cache format {version} (codec {codec}), expected {VERSION}")
+        self.codec = codec
+        start = HEADER.size + meta_length
+        try:
+            self.metadata = json.loads(bytes(buffer[HEADER.size:start]).decode("utf-8"))
+            self._index = [ENTRY.unpack_from(buffer, start + i * ENTRY.size) for i in range(n_pages)]
+        except (ValueError, struct.error) as e:
+            raise Cache_Format_Error(f"{self.file} has a corrupted header: {e}")
+        if self._index and self._index[-1][0] + self._index[-1][1] > len(buffer):
+            raise Cache_Format_Error(f"{self.file} is truncated")
+        return None
+
+    def text(self, i):
+        """Decompress and return the text of page i."""
+        if self._buffer is None:
+            self._open()
+        offset, size, length = self._index[i]
+        block = self._buffer[offset:offset + size]
+        try:
+            raw = zlib.decompress(block) if self.codec == CODEC_ZLIB else bytes(block)
+        finally:
+            block.release()
+        if len(raw) != length:
+            raise Cache_Format_Error(f"Page {i} of {self.file} is corrupted")
+        return raw.decode("utf-8")
+
+    def __len__(self):
+        return len(self._index)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("page index out of range")
+        return Page(self.text(i), {"file_path": self.metadata.get("document"), "page": i})
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __str__(self):
+        return f"Page cache {self.file}: {len(self)} page(s) of {self.metadata.get('document')} ({self.metadata.get('mode')})"
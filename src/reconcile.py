@@ -0,0 +1,140 @@
+###########################################################################################
+
+################## This package has been written by JB LBT (c) 2024 #######################
+################## Under the GNU GPL v3.0 Licence                   #######################
+
+###########################################################################################
+
+# Importing the necessary libraries
+import numpy as np
+import pandas as pd
+
+############################################################################################
+
+################################## BALANCE RECONCILIATION ##################################
+
+############################################################################################
+
+
+class Reconciliation:
+    """Result of the reconciliation of the parsed operations with the balances printed on the statement.
+
+    Attributes:
+    -----------
+    - ok: bool
+        True if the opening balance plus the credits minus the debits gives the closing balance, the printed
+        intermediate balances and the "TOTAL DES OPERATIONS" line (if any) being matched as well.
+    - opening, closing: float or None
+        The opening and closing balances printed on the statement.
+    - expected_closing: float or None
+        The opening balance plus the parsed credits minus the parsed debits.
+    - difference: float or None
+        The printed closing balance minus the expected one.
+    - total_debit, total_credit: float
+        The sums of the parsed debits and credits.
+    - totals_difference: tuple or None
+        The parsed minus the printed (debit, credit) totals of the "TOTAL DES OPERATIONS" line.
+    - pages: DataFrame
+        Per page: the parsed debits and credits, the running balance at the end of the page, the balance
+        printed on the page (if any) and the discrepancy between the two.
+    - reason: str
+        Why the reconciliation failed, empty if it passed.
+    """
+    def __init__(self, ok, opening, closing, expected_closing, difference, total_debit, total_credit, totals_difference, pages, reason = ""):
+        self.ok = ok
+        self.opening = opening
+        self.closing = closing
+        self.expected_closing = expected_closing
+        self.difference = difference
+        self.total_debit = total_debit
+        self.total_credit = total_credit
+        self.totals_difference = totals_difference
+        self.pages = pages
+        self.reason = reason
+
+    def __bool__(self):
+        return self.ok
+
+    @property
+    def error(self):
+        """Absolute closing difference, used to compare two parses (infinite if the balances are unknown)."""
+        return abs(self.difference) if self.difference is not None else float("inf")
+
+    def __str__(self):
+        if self.ok:
+            return f"Reconciliation OK: {self.opening:.2f} + {self.total_credit:.2f} - {self.total_debit:.2f} = {self.closing:.2f}"
+        return f"Reconciliation FAILED: {self.reason}"
+
+
+def reconcile(operations, balances, totals = None, pages = None, tolerance = 0.005):
+    """Check that the parsed operations match the balances printed on the statement.
+
+    The first printed balance is the opening balance, the others are the balances after all the operations of
+    the page they are printed on (the last one being the closing balance). The running balance at the end of
+    each page is computed with a single bincount and cumsum over the operations.
+
+    Parameters:
+    -----------
+    operations : DataFrame
+        The parsed operations, with numeric "Debit (€)" and "Credit (€)" columns.
+
+    balances : list
+        The (page, signed amount) of the printed balances, in the order of the document. Amounts can be None
+        when they could not be read.
+
+    totals : tuple, optional
+        The (debit, credit) of the "TOTAL DES OPERATIONS" line.
+
+    pages : array-like, optional
+        The page of each operation. All the operations are on page 0 if not provided.
+
+    tolerance : float, optional
+        The maximum absolute difference accepted, in euros.
+
+    Returns:
+    --------
+    reconciliation : Reconciliation
+        The result of the check.
+    """
+    debit = pd.to_numeric(operations["Debit (€)"], errors="coerce").fillna(0.0).to_numpy(dtype=float) if len(operations) else np.zeros(0)
+    credit = pd.to_numeric(operations["Credit (€)"], errors="coerce").fillna(0.0).to_numpy(dtype=float) if len(operations) else np.zeros(0)
+    pages = np.zeros(len(debit), dtype=int) if pages is None else np.asarray(pages, dtype=int)
+    balances = [(page, amount) for page, amount in balances if amount is not None]
+
+    n_pages = max([int(pages.max()) + 1 if len(pages) else 0] + [page + 1 for page, _ in balances] + [1])
+    page_debit = np.bincount(pages, weights=debit, minlength=n_pages)
+    page_credit = np.bincount(pages, weights=credit, minlength=n_pages)
+    total_debit, total_credit = float(debit.sum()), float(credit.sum())
+
+    opening = balances[0][1] if balances else None
+    closing = balances[-1][1] if len(balances) > 1 else None
+    printed = np.full(n_pages, np.nan)
+    for page, amount in balances[1:]:
+        printed[page] = amount
+    running = (opening if opening is not None else 0.0) + np.cumsum(page_credit - page_debit)
+    discrepancy = np.round(printed - running, 2)
+    page_table = pd.DataFrame({"Page": np.arange(n_pages), "Debit (€)": page_debit, "Credit (€)": page_credit,
+                               "Balance (€)": running if opening is not None else np.nan,
+                               "Printed balance (€)": printed, "Discrepancy (€)": discrepancy if opening is not None else np.nan})
+
+    expected_closing = opening + total_credit - total_debit if opening is not None else None
+    difference = round(closing - expected_closing, 2) if closing is not None and expected_closing is not None else None
+    totals_difference = None
+    if totals is not None and None not in totals:
+        totals_difference = (round(total_debit - totals[0], 2), round(total_credit - totals[1], 2))
+
+    reasons = []
+    if opening is None:
+        reasons.append("no opening balance found")
+    if closing is None:
+        reasons.append("no closing balance found")
+    if difference is not None and abs(difference) > tolerance:
+        reasons.append(f"closing balance {closing:.2f} but {expected_closing:.2f} expected (difference {difference:+.2f})")
+    if totals_difference is not None and max(abs(d) for d in totals_difference) > tolerance:
+        reasons.append(f"parsed totals differ from the TOTAL DES OPERATIONS line by {totals_difference[0]:+.2f} (debit) and {totals_difference[1]:+.2f} (credit)")
+    bad_pages = page_table.loc[page_table["Discrepancy (€)"].abs() > tolerance, "Page"].tolist()
+    if bad_pages and opening is not None:
+        reasons.append(f"discrepancy on page(s) {', '.join(str(p) for p in bad_pages)}")
+
+    return Reconciliation(not reasons, opening, closing, expected_closing, difference, total_debit, total_credit,
+                          totals_difference, page_table, "; ".join(reasons))
@@ -0,0 +1,249 @@
+###########################################################################################
+
+################## This package has been written by JB LBT (c) 2024 #######################
+################## Under the GNU GPL v3.0 Licence                   #######################
+
+###########################################################################################
+
+# Importing the necessary libraries
+import numpy as np
+import pandas as pd
+from src.utils import *
+
+############################################################################################
+
+################################## RECURRING OPERATIONS ####################################
+
+############################################################################################
+
+
+# Periods recognized, in days
+PERIODS = {"weekly": 7.0, "monthly": 30.44, "quarterly": 91.31, "half-yearly": 182.62, "yearly": 365.25}
+
+# Kind of a recurrence, from its normalized description (the first match wins)
+RECURRING_KINDS = [
+    (r"\bPRET\b|\bECHEANCE\b|\bCREDIT IMMO", "Prêt"),
+    (r"\bLOYER\b|\bQUITTANCE\b", "Loyer"),
+    (r"\bPRLV SEPA\b|\bPRELEVEMENT\b", "Prélèvement"),
+    (r"\bVIR\b.*\b(?:SALAIRE|PAIE)\b|\b(?:SALAIRE|PAIE)\b", "Salaire"),
+    (r"\bVIR\b", "Virement"),
+    (r"\bCARTE\b", "Carte"),
+]
+
+RECURRING_COLUMNS = ["Description", "Kind", "Period", "Period (days)", "Count", "First", "Last", "Next expected",
+                     "Amount (€)", "Last amount (€)", "Previous amount (€)", "Regularity", "New", "Changed", "Missed", "Status"]
+
+
+def _kinds(descriptions):
+    """Kind of each recurrence, from its normalized description."""
+    kinds = pd.Series("Autre", index=descriptions.index, dtype=object)
+    found = pd.Series(False, index=descriptions.index)
+    for pattern, kind in RECURRING_KINDS:
+        match = descriptions.str.contains(pattern, regex=True) & ~found
+        kinds[match] = kind
+        found |= match
+    return kinds
+
+def _history(operations):
+    """Operations of a DataFrame, a Ledger or a list of Monthly_Summary objects, as one DataFrame."""
+    if isinstance(operations, pd.DataFrame):
+        return operations
+    if hasattr(operations, "query") and hasattr(operations, "totals"):
+        return operations.query()
+    return pd.concat([summary.operations for summary in operations], ignore_index=True)
+
+def detect_recurring(operations, as_of = None, min_occurrences = 3, band_tolerance = 0.25, change_tolerance = 0.01,
+                     min_regularity = 0.75, new_periods = 3):
+    """Detect the recurring operations (subscriptions, loan instalments, rent, salary...) of an operations history.
+
+    The operations are grouped by normalized description, sign and amount band (sorted by amount, a new band
+    starting when the amount is more than band_tolerance above the previous one), then sorted by date in each
+    group. The intervals between consecutive operations, their median and the share of intervals matching the
+    period are computed for all the groups at once, so the whole history is processed in a single pass.
+
+    Parameters:
+    -----------
+    operations : DataFrame, Ledger or list
+        The operations history, with the "Date", "Description", "Debit (€)" and "Credit (€)" columns. A Ledger
+        (all its operations) or a list of Monthly_Summary objects are accepted as well.
+
+    as_of : str or datetime, optional
+        The reference date for the new and missed recurrences, default is the last date of the history.
+
+    min_occurrences : int, optional
+        The minimum number of operations of a recurrence.
+
+    band_tolerance : float, optional
+        The relative gap between two amounts starting a new amount band.
+
+    change_tolerance : float, optional
+        The relative difference between two consecutive amounts flagging a change of amount (at least 3 times
+        the usual difference between consecutive amounts of the recurrence).
+
+    min_regularity : float, optional
+        The minimum share of the intervals matching the period (within a quarter of the period).
+
+    new_periods : int, optional
+        A recurrence whose first operation is less than new_periods periods old is new.
+
+    Returns:
+    --------
+    recurrences : DataFrame
+        One row per recurrence, in the order of RECURRING_COLUMNS, the missed ones first. "Missed" is the number
+        of expected operations not found since the last one. "Changed" is True if the amount changed in the last
+        new_periods periods ("Previous amount (€)" being the amount before the change). "Status" is "missed",
+        "changed", "new" or "active", or "ended" after 3 missed operations.
+    """
+    operations = _history(operations)
+    if len(operations) == 0:
+        return pd.DataFrame(columns=RECURRING_COLUMNS)
+
+    debit = pd.to_numeric(operations["Debit (€)"], errors="coerce").fillna(0.0).to_numpy(dtype=float)
+    credit = pd.to_numeric(operations["Credit (€)"], errors="coerce").fillna(0.0).to_numpy(dtype=float)
+    data = pd.DataFrame({"Date": pd.to_datetime(operations["Date"]).to_numpy(),
+                         "Key": normalize_descriptions(operations["Description"]).to_numpy(),
+                         "Amount": credit - debit})
+    data = data[(data["Amount"] != 0) & (data["Key"] != "")]
+    data["Sign"] = np.sign(data["Amount"])
+    data["Abs"] = data["Amount"].abs()
+    as_of = pd.Timestamp(as_of) if as_of is not None else data["Date"].max()
+
+    # Amount bands: sort by (description, sign, amount), a band starts at each new key or at each gap in the amounts
+    data = data.sort_values(["Key", "Sign", "Abs"], kind="mergesort")
+    key = data["Key"].to_numpy()
+    sign = data["Sign"].to_numpy()
+    amount = data["Abs"].to_numpy()
+    new_band = np.ones(len(data), dtype=bool)
+    new_band[1:] = (key[1:] != key[:-1]) | (sign[1:] != sign[:-1]) | (amount[1:] > amount[:-1] * (1 + band_tolerance))
+    data["Band"] = np.cumsum(new_band)
+
+    # Intervals between the consecutive operations of each band, and last change of amount in each band
+    data = data.sort_values(["Band", "Date"], kind="mergesort")
+    band = data["Band"].to_numpy()
+    dates = data["Date"].to_numpy()
+    days = dates.astype("datetime64[D]").astype(np.int64)
+    amounts = data["Amount"].to_numpy()
+    same = np.zeros(len(data), dtype=bool)
+    same[1:] = band[1:] == band[:-1]
+    interval = np.where(same, np.diff(days, prepend=days[:1]), 0).astype(float)
+    data["Interval"] = np.where(interval > 0, interval, np.nan)
+    before = np.concatenate([amounts[:1], amounts[:-1]])
+    # An amount varying from one operation to the next (e.g. a salary) only changes beyond 3 times its usual variation
+    step = np.where(same, np.abs(amounts - before), np.nan)
+    noise = pd.Series(step).groupby(band).transform("median").fillna(0.0).to_numpy()
+    change = same & (step > np.maximum(change_tolerance * np.abs(before), 3 * noise))
+    changes = pd.DataFrame({"Changed_on": dates[change], "Previous": before[change]}, index=band[change]).groupby(level=0).last()
+
+    stats = data.groupby("Band", sort=False).agg(Key=("Key", "first"), Sign=("Sign", "first"), Count=("Date", "size"),
+                                                 First=("Date", "min"), Last=("Date", "max"), Interval=("Interval", "median"),
+                                                 Amount=("Amount", "median"), Last_amount=("Amount", "last"))
+    stats = stats[(stats["Count"] >= min_occurrences) & stats["Interval"].notna()].join(changes)
+    if len(stats) == 0:
+        return pd.DataFrame(columns=RECURRING_COLUMNS)
+
+    # Nearest known period of each band, and share of its intervals matching it
+    names = np.array(list(PERIODS))
+    lengths = np.array(list(PERIODS.values()))
+    nearest = np.abs(np.log(stats["Interval"].to_numpy()[:, None] / lengths[None, :])).argmin(axis=1)
+    stats["Period"] = names[nearest]
+    stats["Period (days)"] = lengths[nearest]
+    stats = stats[np.abs(stats["Interval"] - stats["Period (days)"]) <= 0.25 * stats["Period (days)"]].copy()
+    period = data["Band"].map(stats["Period (days)"])
+    matching = (data["Interval"] - period).abs() <= 0.25 * period
+    stats["Regularity"] = matching[data["Interval"].notna()].groupby(data["Band"]).mean().reindex(stats.index)
+    stats = stats[stats["Regularity"] >= min_regularity]
+    if len(stats) == 0:
+        return pd.DataFrame(columns=RECURRING_COLUMNS)
+
+    # A band starting when the previous band of the same description and period stops is the same recurrence
+    # with a new amount (e.g. a price increase larger than band_tolerance): the bands are chained
+    stats = stats.sort_values(["Key", "Sign", "Period", "First"], kind="mergesort")
+    key, sign, names = stats["Key"].to_numpy(), stats["Sign"].to_numpy(), stats["Period"].to_numpy()
+    gap = (stats["First"].to_numpy()[1:] - stats["Last"].to_numpy()[:-1]) / np.timedelta64(1, "D")
+    length = stats["Period (days)"].to_numpy()[1:]
+    linked = np.zeros(len(stats), dtype=bool)
+    linked[1:] = (key[1:] == key[:-1]) & (sign[1:] == sign[:-1]) & (names[1:] == names[:-1]) & (gap > -0.5 * length) & (gap <= 1.5 * length)
+    relinked = linked & ~(stats["Changed_on"] > stats["First"]).to_numpy()
+    stats["Changed_on"] = stats["Changed_on"].mask(relinked, stats["First"])
+    stats["Previous"] = stats["Previous"].mask(relinked, stats["Last_amount"].shift(1))
+    stats["Weight"] = stats["Regularity"] * stats["Count"]
+    chains = stats.groupby(np.cumsum(~linked), sort=False)
+    stats = chains.last().assign(First=chains["First"].min(), Count=chains["Count"].sum())
+    stats["Regularity"] = chains["Weight"].sum().to_numpy() / stats["Count"]
+
+    period_days = pd.to_timedelta(stats["Period (days)"], unit="D")
+    grace = np.maximum(0.25 * stats["Period (days)"], 3.0)
+    overdue = ((as_of - stats["Last"]).dt.days - grace) / stats["Period (days)"]
+    recent = as_of - new_periods * period_days
+
+    stats["Next expected"] = (stats["Last"] + period_days).dt.normalize()
+    stats["Missed"] = np.floor(np.maximum(overdue, 0.0)).astype(int)
+    stats["Changed"] = stats["Changed_on"].notna() & (stats["Changed_on"] >= recent)
+    stats["New"] = stats["First"] >= recent
+    stats["Status"] = np.select([stats["Missed"] >= 3, stats["Missed"] > 0, stats["Changed"], stats["New"]],
+                                ["ended", "missed", "changed", "new"], default="active")
+    stats["Description"] = stats["Key"]
+    stats["Kind"] = _kinds(stats["Key"])
+    stats["Amount (€)"] = stats["Amount"].round(2)
+    stats["Last amount (€)"] = stats["Last_amount"].round(2)
+    stats["Previous amount (€)"] = stats["Previous"].where(stats["Changed"]).round(2)
+    stats["Regularity"] = stats["Regularity"].round(2)
+    stats["Period (days)"] = stats["Interval"].round(1)
+
+    order = stats["Status"].map({"missed": 0, "changed": 1, "new": 2, "active": 3, "ended": 4})
+    stats = stats.assign(_order=order).sort_values(["_order", "Amount (€)"], kind="mergesort")
+    return stats[RECURRING_COLUMNS].reset_index(drop=True)
+
+def recurring_operations(operations, recurrences, band_tolerance = 0.25):
+    """Mask of the operations belonging to one of the recurrences detected by detect_recurring.
+
+    Parameters:
+    -----------
+    operations : DataFrame
+        The operations, with the "Description", "Debit (€)" and "Credit (€)" columns.
+
+    recurrences : DataFrame
+        The recurrences returned by detect_recurring.
+
+    band_tolerance : float, optional
+        The relative difference of amount accepted, as in detect_recurring.
+
+    Returns:
+    --------
+    mask : Series
+        True for the recurring operations, with the index of the operations.
+    """
+    if len(operations) == 0 or len(recurrences) == 0:
+        return pd.Series(False, index=operations.index)
+    amount = (pd.to_numeric(operations["Credit (€)"], errors="coerce").fillna(0.0)
+              - pd.to_numeric(operations["Debit (€)"], errors="coerce").fillna(0.0))
+    candidates = pd.DataFrame({"Key": normalize_descriptions(operations["Description"]), "Amount": amount, "Row": np.arange(len(operations))})
+    merged = candidates.merge(recurrences[["Description", "Amount (€)"]], left_on="Key", right_on="Description")
+    ratio = merged["Amount"] / merged["Amount (€)"]
+    rows = merged.loc[(ratio > 1 / (1 + band_tolerance)) & (ratio < 1 + band_tolerance), "Row"].unique()
+    mask = np.zeros(len(operations), dtype=bool)
+    mask[rows] = True
+    return pd.Series(mask, index=operations.index)
+
+
+def recurring_main(argv = None):
+    """Command line entry point: list the recurring operations of a ledger."""
+    import argparse
+    from src.ledger import Ledger
+
+    parser = argparse.ArgumentParser(prog="python -m src.Monthly_Summary recurring", description="Detect the recurring operations (subscriptions, loans, rent...) stored in a ledger")
+    parser.add_argument("ledger", type=str, help="The SQLite ledger (see --ledger of batch and watch)")
+    parser.add_argument("--start", type=str, help="Only use the operations from this date")
+    parser.add_argument("--as_of", type=str, help="The reference date for the new and missed recurrences, default is the last operation")
+    parser.add_argument("--min_occurrences", type=int, default=3, help="The minimum number of operations of a recurrence")
+    parser.add_argument("--csv", type=str, help="Write the recurrences to this CSV file")
+    args = parser.parse_args(argv)
+
+    ledger = Ledger(args.ledger)
+    recurrences = detect_recurring(ledger.query(start=args.start), as_of=args.as_of, min_occurrences=args.min_occurrences)
+    ledger.close()
+    with pd.option_context("display.max_rows", None, "display.width", 200):
+        print(recurrences.drop(columns=["First", "Regularity"]).to_string(index=False))
+    if args.csv is not None:
+        recurrences.to_csv(args.csv, index=False)
+    return 0
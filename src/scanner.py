@@ -0,0 +1,526 @@
+###########################################################################################
+
+################## This package has been written by JB LBT (c) 2024 #######################
+################## Under the GNU GPL v3.0 Licence                   #######################
+
+###########################################################################################
+
+# Importing the necessary libraries
+import re
+import atexit
+import threading
+
+############################################################################################
+
+##################################### PAGE SCANNERS #######################################
+
+############################################################################################
+
+
+OPERATION_KEYS = ["Date", "Description", "Operation Date", "Debit (€)", "Credit (€)"]
+
+DATE_RE = re.compile(r"^\d{2}\.\d{2}(?:\.\d{2,4})?$")
+BALANCE_RE = re.compile(r"SOLDE\s+(CREDITEUR|DEBITEUR)\s+AU\s*:?\s*(\d{2}\.\d{2}\.\d{4})")
+AMOUNT_RE = re.compile(r"\d{1,3}(?:[  .]\d{3})*,\d{2}|\d+,\d{2}")
+YEAR_RE = re.compile(r"du\s+.*?(\d{4})\s+au")
+
+
+MARKERS = {
+    "releve": "RELEVE DE COMPTE",
+    "balance": "SOLDE CREDITEUR AU",
+    "total": "TOTAL DES OPERATIONS",
+    "rib": "RIB",
+    "currency": "Monnaie du compte",
+    "footer": "BNP PARIBAS SA",
+}
+
+
+class Page_Index:
+    """Page tokenized into lines once, with the positions of its marker lines.
+
+    Attributes:
+    -----------
+    - text: str
+        The raw text of the page.
+    - lines: list
+        The lines of the page.
+    - markers: dict
+        For each name of MARKERS, the sorted list of the indices of the lines containing the marker.
+    - blanks: list
+        The indices of the empty lines.
+    """
+    def __init__(self, text):
+        self.text = text
+        self.lines = text.split("\n")
+        self.markers = {name: [] for name in MARKERS}
+        self.blanks = []
+        for i, line in enumerate(self.lines):
+            if not line:
+                self.blanks.append(i)
+                continue
+            for name, marker in MARKERS.items():
+                if marker in line:
+                    self.markers[name].append(i)
+
+    def has(self, name):
+        """True if the page contains the marker."""
+        return len(self.markers[name]) > 0
+
+    def first(self, name, start = 0, end = None):
+        """Index of the first line containing the marker in lines[start:end], or None."""
+        for i in self.markers[name]:
+            if i >= start and (end is None or i < end):
+                return i
+        return None
+
+    def last(self, name, start = 0, end = None):
+        """Index of the last line containing the marker in lines[start:end], or None."""
+        for i in reversed(self.markers[name]):
+            if i >= start and (end is None or i < end):
+                return i
+        return None
+
+    def blocks(self):
+        """Line ranges (start, end) of the chunks of page.split("\\n\\n"), computed from the empty lines."""
+        blocks = []
+        start = 0
+        last = len(self.lines) - 1
+        for b in self.blanks:
+            # A "\\n\\n" separator ends the line before an empty line that is not the last line
+            if b <= start or b >= last:
+                continue
+            blocks.append((start, b))
+            start = b + 1
+        blocks.append((start, len(self.lines)))
+        return blocks
+
+
+def parse_amount(value):
+    """Convert a french formatted amount ("1 234,56") to a float, empty values give 0.0."""
+    value = value.replace(" ", "").replace(" ", "").strip()
+    if not value:
+        return 0.0
+    if "," in value:
+        value = value.replace(".", "").replace(",", ".")
+    return float(value)
+
+
+def _find_amount(text):
+    """Return the last amount found in a text, or None."""
+    amounts = AMOUNT_RE.findall(text)
+    if not amounts:
+        return None
+    return parse_amount(amounts[-1])
+
+
+def read_balance(line):
+    """Read a "SOLDE CREDITEUR/DEBITEUR AU dd.mm.yyyy" line.
+
+    Returns:
+    --------
+    balance : tuple or None
+        The (date string, signed amount) of the balance, the amount being None if it is not written on the line.
+    """
+    match = BALANCE_RE.search(line)
+    if not match:
+        return None
+    amount = _find_amount(line[match.end():])
+    if amount is not None and match.group(1) == "DEBITEUR":
+        amount = -amount
+    return match.group(2), amount
+
+
+class Page_Scan:
+    """Result of the scan of one page: typed operations, balances, totals and start year.
+
+    Attributes:
+    -----------
+    - rows: list
+        The operations found on the page, as dicts with the OPERATION_KEYS keys and float amounts.
+    - balances: list
+        The (date string, signed amount) tuples of the "SOLDE CREDITEUR/DEBITEUR AU" lines, in page order.
+    - totals: tuple or None
+        The (debit, credit) totals of the "TOTAL DES OPERATIONS" line if found on the page.
+    - year: int or None
+        The start year read on the "RELEVE DE COMPTE" header of the first page, if found.
+    - tables: int
+        The number of operation tables found on the page.
+    """
+    def __init__(self):
+        self.rows = []
+        self.balances = []
+        self.totals = None
+        self.year = None
+        self.tables = 0
+
+    @property
+    def closed(self):
+        """True if the end of the operations ("TOTAL DES OPERATIONS") was reached on this page."""
+        return self.totals is not None
+
+
+def _split_row(line):
+    cells = line.strip().split("|")
+    # A markdown row starts and ends with a pipe, drop the empty outer cells
+    if cells and cells[0].strip() == "":
+        cells = cells[1:]
+    if cells and cells[-1].strip() == "":
+        cells = cells[:-1]
+    return [c.strip() for c in cells]
+
+
+def _column_layout(header):
+    """Map the operation keys to the column positions of a table header, or None if the table is not an operation table."""
+    if header is None:
+        return None
+    names = [h.lower() for h in header]
+    layout = {}
+    for i, name in enumerate(names):
+        if "date" in name and "Date" not in layout:
+            layout["Date"] = i
+        elif ("nature" in name or "opération" in name) and "Description" not in layout:
+            layout["Description"] = i
+        elif "valeur" in name:
+            layout["Operation Date"] = i
+        elif "débit" in name or "debit" in name:
+            layout["Debit (€)"] = i
+        elif "crédit" in name or "credit" in name:
+            layout["Credit (€)"] = i
+    if "Debit (€)" in layout and "Credit (€)" in layout:
+        for pos, key in enumerate(OPERATION_KEYS):
+            layout.setdefault(key, pos)
+        return layout
+    if len(header) == 5:
+        return {key: pos for pos, key in enumerate(OPERATION_KEYS)}
+    return None
+
+
+def scan_markdown_page(text, rows = None, read_rows = True, first = False):
+    """Scan a markdown page in a single pass and extract its operations, balances and totals.
+
+    Parameters:
+    -----------
+    text : str
+        The markdown text of the page.
+
+    rows : list, optional
+        The list the operations are appended to. Passing the list of the previous pages allows the
+        continuation lines at the top of a page to be merged into the last operation of the previous page.
+
+    read_rows : bool, optional
+        If False, only the balances, totals and year are read (used once the end of the operations was reached).
+
+    first : bool, optional
+        True for the first page of the statement. The year is only read on its header, before the "Monnaie du
+        compte" line and the first table, so a description containing "du ... 2024 au" cannot set it.
+
+    Returns:
+    --------
+    scan : Page_Scan
+        The result of the scan. scan.rows contains only the operations started on this page.
+    """
+    scan = Page_Scan()
+    if rows is None:
+        rows = []
+    first_row = len(rows)
+
+    previous = None         # previous table row, used as header when a separator is found
+    layout = None           # column layout of the current operation table
+    in_table = False
+    header = first          # True until the end of the header of the first page
+
+    for line in text.split("\n"):
+        stripped = line.strip()
+
+        if header and (MARKERS["currency"] in line or stripped.startswith("|")):
+            header = False
+        if header and scan.year is None and ("RELEVE DE COMPTE" in line or " au " in line):
+            match = YEAR_RE.search(line)
+            if match:
+                scan.year = int(match.group(1))
+
+        if not stripped.startswith("|"):
+            # Balance lines can also be written outside of the tables
+            if "SOLDE" in line:
+                balance = read_balance(line)
+                if balance:
+                    scan.balances.append(balance)
+            if "TOTAL DES OPERATIONS" in line and scan.totals is None:
+                amounts = [parse_amount(a) for a in AMOUNT_RE.findall(line)]
+                scan.totals = tuple(amounts[-2:]) if len(amounts) >= 2 else (None, None)
+                read_rows = False
+            in_table = False
+            layout = None
+            previous = None
+            continue
+
+        cells = _split_row(stripped)
+
+        if cells and all(set(c) <= set("-: ") and c for c in cells):
+            # Separator row: the previous row is the header of a new table
+            layout = _column_layout(previous)
+            in_table = layout is not None
+            if in_table:
+                scan.tables += 1
+            previous = None
+            continue
+
+        previous = cells
+        if not in_table:
+            continue
+
+        joined = " ".join(cells)
+        if "SOLDE" in joined:
+            balance = read_balance(joined)
+            if balance:
+                scan.balances.append(balance)
+                continue
+        if "TOTAL DES OPERATIONS" in joined:
+            if scan.totals is None:
+                debit = cells[layout["Debit (€)"]] if layout["Debit (€)"] < len(cells) else ""
+                credit = cells[layout["Credit (€)"]] if layout["Credit (€)"] < len(cells) else ""
+                try:
+                    scan.totals = (parse_amount(debit), parse_amount(credit))
+                except ValueError:
+                    # Merged cells: fall back on the last two amounts of the row
+                    amounts = [parse_amount(a) for a in AMOUNT_RE.findall(joined)]
+                    scan.totals = tuple(amounts[-2:]) if len(amounts) >= 2 else (None, None)
+            read_rows = False
+            continue
+        if not read_rows:
+            continue
+
+        values = {key: cells[pos] if pos < len(cells) else "" for key, pos in layout.items()}
+        if DATE_RE.match(values["Date"]):
+            try:
+                values["Debit (€)"] = parse_amount(values["Debit (€)"])
+                values["Credit (€)"] = parse_amount(values["Credit (€)"])
+            except ValueError:
+                continue
+            rows.append({key: values[key] for key in OPERATION_KEYS})
+        elif values["Date"] == "" and values["Description"] and not values["Debit (€)"] and not values["Credit (€)"]:
+            # Continuation of the description of the previous operation
+            if rows:
+                rows[-1]["Description"] += " " + values["Description"]
+
+    scan.rows = rows[first_row:]
+    return scan
+
+
+class Text_Page_Scan:
+    """Result of the scan of one page in text mode.
+
+    Attributes:
+    -----------
+    - rows: list
+        The operations started on the page, as [date, description, value date, debit, credit] strings.
+    - continuation: list
+        The description lines at the top of the page continuing the last operation of the previous page.
+    - balances: list
+        The signed amounts of the balances printed on the page, in order.
+    - totals: tuple or None
+        The (debit, credit) of the "TOTAL DES OPERATIONS" line.
+    - year: int or None
+        The start year read on the "RELEVE DE COMPTE" line (first page only).
+    - start_date, end_date: str or None
+        The opening (first page) and closing balance dates, as dd.mm.yyyy.
+    - has_operations: bool
+        True if the page contains an operations table.
+    - errors: list
+        The messages of the errors met while scanning the page.
+    """
+    def __init__(self):
+        self.rows = []
+        self.continuation = []
+        self.balances = []
+        self.totals = None
+        self.year = None
+        self.start_date = None
+        self.end_date = None
+        self.has_operations = False
+        self.errors = []
+
+    @property
+    def closed(self):
+        """True if the end of the operations ("TOTAL DES OPERATIONS") was reached on this page."""
+        return self.totals is not None or self.end_date is not None
+
+
+def _balance_date(line):
+    """Date (dd.mm.yyyy) of a "SOLDE CREDITEUR AU" line."""
+    return line.split("AU")[1].strip()[:15].strip()
+
+
+def _operation_lines(page, scan, first):
+    """Operation lines of a page (Page_Index), reading the year and the opening and closing dates on the way."""
+    end = None
+    if page.has("total"):
+        end = page.first("total")
+        i = page.last("balance", start = 1)
+        if i is None:
+            scan.errors.append("Error while getting the end date: No closing \"SOLDE CREDITEUR AU\" line found")
+        else:
+            scan.end_date = _balance_date(page.lines[i])
+
+    if first:
+        # The year is read on the header, before the "Monnaie du compte" line, never in the operations
+        i = page.first("releve", end = page.first("currency"))
+        try:
+            if i is None:
+                raise ValueError("No \"RELEVE DE COMPTE\" line found")
+            scan.year = int(page.lines[i].split("du")[1].split("au")[0].strip()[-4:])
+        except (ValueError, IndexError) as e:
+            scan.errors.append(f"Error while getting the start year: {e}")
+        i = page.first("balance")
+        if i is None:
+            scan.errors.append("Error while getting the start date: No opening \"SOLDE CREDITEUR AU\" line found")
+        else:
+            scan.start_date = _balance_date(page.lines[i])
+
+        if end is None:
+            end = page.first("footer")
+            if end is None:
+                end = len(page.lines)
+        start = page.first("currency", end = end)
+        if start is None:
+            raise ValueError("No \"Monnaie du compte\" line found on the first page")
+        start += 1
+    else:
+        if end is not None:
+            start = 0
+        else:
+            start, end = page.blocks()[-2]
+        rib = page.first("rib", start = start, end = end)
+        if rib is not None:
+            start = rib + 1
+
+    return [line for line in page.lines[start:end] if line]
+
+
+def scan_text_page(text, first = False):
+    """Scan a page extracted in text mode: operations, balances, totals and dates.
+
+    The function is pure (it only depends on the text of the page), so the pages of a document can be
+    scanned in parallel and merged in page order afterwards.
+
+    Parameters:
+    -----------
+    text : str
+        The text of the page.
+
+    first : bool, optional
+        True for the first page of the statement (it holds the year and the opening balance).
+
+    Returns:
+    --------
+    scan : Text_Page_Scan
+        The result of the scan.
+    """
+    scan = Text_Page_Scan()
+    page = Page_Index(text)
+    for line in page.lines:
+        if "SOLDE" in line:
+            balance = read_balance(line)
+            if balance:
+                scan.balances.append(balance[1])
+    i = page.first("total")
+    if i is not None:
+        amounts = AMOUNT_RE.findall(page.lines[i])
+        if len(amounts) >= 2:
+            scan.totals = (parse_amount(amounts[-2]), parse_amount(amounts[-1]))
+
+    scan.has_operations = "Crédit" in text and "Débit" in text
+    if not scan.has_operations:
+        return scan
+
+    lines = _operation_lines(page, scan, first)
+    try:
+        headers = lines[0]
+        desc_index = headers.index("Nature des opérations")
+        valeur_index = headers.index("Valeur")
+        headers.index("Débit")
+        credit_index = headers.index("Crédit")
+    except (IndexError, ValueError) as e:
+        scan.errors.append(f"Error while parsing the headers of the operations: {e}")
+        return scan
+
+    for line in lines[1:]:
+        if "SOLDE CREDITEUR" in line:
+            continue
+        if len(line) <= valeur_index:
+            # Description continued on the next line, possibly at the top of the next page
+            if scan.rows:
+                # Joined without a space, as the fingerprints of the operations already stored were computed
+                scan.rows[-1][1] += line.strip()
+            else:
+                scan.continuation.append(line.strip())
+            continue
+
+        date = line[:desc_index-2].strip()
+        description = line[desc_index-2:valeur_index-2].strip()
+        valeur = line[valeur_index-2:valeur_index+10].strip()
+        if len(line) < credit_index-4:
+            debit = line[valeur_index+10:].strip().replace(" ", "")
+            credit = "0.0"
+        else:
+            debit = "0.0"
+            credit = line[valeur_index+10:].strip().replace(" ", "")
+        scan.rows.append([date, description, valeur, debit, credit])
+    return scan
+
+
+def scan_text_pages(texts, first = False):
+    """Scan a chunk of consecutive pages in text mode (one task of a page worker).
+
+    Parameters:
+    -----------
+    texts : list
+        The texts of the pages.
+
+    first : bool, optional
+        True if the chunk starts with the first page of the statement.
+
+    Returns:
+    --------
+    scans : list
+        The Text_Page_Scan of each page, in order.
+    """
+    return [scan_text_page(text, first and i == 0) for i, text in enumerate(texts)]
+
+
+_PAGE_POOLS = {}
+_PAGE_POOLS_LOCK = threading.Lock()
+
+def get_page_pool(workers):
+    """Get the pool of page workers shared by the whole process, creating it on the first call.
+
+    Starting the worker processes costs more than scanning the pages of a usual statement, so the pool is
+    kept for the following documents instead of being started for each of them.
+
+    Parameters:
+    -----------
+    workers : int
+        The number of worker processes.
+
+    Returns:
+    --------
+    pool : ProcessPoolExecutor
+        The shared pool with this number of workers.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    with _PAGE_POOLS_LOCK:
+        if workers not in _PAGE_POOLS:
+            if not _PAGE_POOLS:
+                atexit.register(close_page_pools)
+            _PAGE_POOLS[workers] = ProcessPoolExecutor(max_workers=workers)
+        return _PAGE_POOLS[workers]
+
+def close_page_pools():
+    """Shut down the pools of page workers, e.g. at the end of a batch. They are started again when needed."""
+    with _PAGE_POOLS_LOCK:
+        pools = list(_PAGE_POOLS.values())
+        _PAGE_POOLS.clear()
+    for pool in pools:
+        pool.shutdown(wait=True)
+    return None
@@ -0,0 +1,409 @@
+###########################################################################################
+
+################## This package has been written by JB LBT (c) 2024 #######################
+################## Under the GNU GPL v3.0 Licence                   #######################
+
+###########################################################################################
+
+# Importing the necessary libraries
+import os
+import atexit
+import threading
+import numpy as np
+import pandas as pd
+from src.utils import *
+
+############################################################################################
+
+###################################### SEARCH INDEX ########################################
+
+############################################################################################
+
+
+# Version of the tokenization, an index saved by another version is tokenized again when it is loaded
+INDEX_VERSION = 2
+
+
+def description_terms(description):
+    """Terms indexed for a description: the words of its normalized form and its raw upper-cased words, so the
+    card numbers, dates and references removed by the normalization can still be searched.
+
+    Example: "CARTE X1234 25/06 RATP" -> {"CARTE", "RATP", "X1234", "25/06"}
+    """
+    description = str(description)
+    return set(normalize_description(description).split()) | set(description.upper().split())
+
+def query_terms(text):
+    """Terms of a search query: the words of its normalized form, a trailing "*" making a word a prefix. A word
+    removed by the normalization (card number, date, reference) is looked up as a raw word.
+
+    Example: "sncf pari*" -> [("SNCF", False), ("PARI", True)], "x1234" -> [("X1234", False)]
+    """
+    terms = []
+    for word in str(text).split():
+        prefix = word.endswith("*")
+        word = word.rstrip("*")
+        words = normalize_description(word).split() or word.upper().split()
+        for term in words:
+            terms.append((term, False))
+        if prefix and words:
+            terms[-1] = (terms[-1][0], True)
+    return terms
+
+
+class Search_Index:
+    """
+        Search_Index
+        ============
+
+        Inverted index of the words of the normalized operation descriptions: each word points to the sorted
+        list of the operations containing it (posting list). The operations are identified by their fingerprint,
+        their date, debit, credit, description and category being stored in side columns to filter and display
+        the results without reading the statements again. The source of each operation (e.g. the PDF file) is
+        stored too: indexing a statement again replaces all its operations, so the ones that changed fingerprint
+        (e.g. a description parsed differently) are not returned twice.
+
+        The words indexed are the words of the normalized descriptions and the raw words of the descriptions
+        (card numbers, dates, references). The posting lists are stored in CSR form (sorted vocabulary, offsets,
+        operation ids) and the operations added since the last save are kept in a small in-memory buffer, merged
+        with a single sort when the index is saved. A prefix query is a range of the sorted vocabulary (two
+        binary searches).
+
+        The shared indexes (get_search_index) are saved at the end of a batch with save_search_indexes, and when
+        the process exits, not after each statement.
+
+        Methods:
+        --------
+        - add_operations: add (or update) the operations of a monthly summary or a DataFrame
+        - search: operations matching words or prefixes, with date, amount and category filters
+        - save: merge the buffer and save the index to a .npz file
+        - flush: save the index to the file it was loaded from, if operations were added since
+        - load: class method, load an index from a .npz file
+    """
+    def __init__(self):
+        """Initialize an empty index."""
+        self.terms = np.array([], dtype=str)                # sorted vocabulary
+        self.offsets = np.zeros(1, dtype=np.int64)          # postings of terms[i]: postings[offsets[i]:offsets[i + 1]]
+        self.postings = np.array([], dtype=np.int32)        # operation ids
+        self.pending = {}                                   # term -> operation ids added since the last merge
+        self.ids = {}                                       # fingerprint -> operation id
+        self.fingerprints = np.array([], dtype=str)
+        self.dates = np.array([], dtype="datetime64[D]")
+        self.debits = np.array([], dtype=float)
+        self.credits = np.array([], dtype=float)
+        self.descriptions = np.array([], dtype=str)
+        self.categories = np.array([], dtype=str)
+        self.sources = np.array([], dtype=str)              # "" if the source of the operation is unknown
+        self.alive = np.array([], dtype=bool)               # False for the replaced versions of an operation
+        self.file = None                                    # file the index was loaded from, saved by flush
+        self.dirty = False                                  # True if operations were added since the last save
+        self._lock = threading.Lock()
+
+    def add_operations(self, operations, fingerprints = None, source = None, replace = True):
+        """Add operations to the index. An operation already indexed (same fingerprint) is replaced, e.g. after a
+        change of its category, date or amounts. The fingerprint depends on the normalized description, so an
+        operation whose description changed is only replaced through its source (see replace).
+
+        Parameters:
+        -----------
+        operations : DataFrame or Monthly_Summary
+            The operations to add, or a monthly summary (its operations and fingerprints are used).
+
+        fingerprints : Series, optional
+            The fingerprints of the operations. Computed if not provided.
+
+        source : str, optional
+            The source of the operations (e.g. the PDF file).
+
+        replace : bool, optional
+            Whether the operations are all the operations of the source, default is True. The operations of the
+            source indexed before whose fingerprint is not in the operations are then dropped. Set to False to
+            add only some operations of the source (e.g. the ones edited).
+
+        Returns:
+        --------
+        n : int
+            The number of operations indexed.
+        """
+        if hasattr(operations, "operations"):
+            summary = operations
+            operations = summary.operations
+            if fingerprints is None and len(getattr(summary, "fingerprints", [])) == len(operations):
+                fingerprints = summary.fingerprints
+            if source is None:
+                source = getattr(summary, "pdf", None)
+        if len(operations) == 0:
+            return 0
+        if fingerprints is None:
+            fingerprints = operation_fingerprints(operations)
+
+        fingerprints = fingerprints.astype(str).to_numpy()
+        source = "" if source is None else str(source)
+        # The terms of each distinct description are computed once
+        codes, uniques = pd.factorize(operations["Description"].astype(str), use_na_sentinel=False)
+        unique_terms = [description_terms(d) for d in uniques]
+        words = [unique_terms[c] for c in codes]
+        categories = operations["Category"].fillna("").astype(str).to_numpy() if "Category" in operations.columns else np.full(len(operations), "", dtype=object)
+        with self._lock:
+            # Replaced operations are dropped from the results, their postings are purged at the next merge
+            old = [self.ids[fp] for fp in fingerprints if fp in self.ids]
+            self.alive[old] = False
+            if replace and source:
+                # Operations of a previous indexing of the source that are not in the new one
+                self.alive[(self.sources == source) & ~np.isin(self.fingerprints, fingerprints)] = False
+            first = len(self.fingerprints)
+            new_ids = np.arange(first, first + len(operations), dtype=np.int32)
+            self.ids.update(zip(fingerprints, new_ids.tolist()))
+            for op_id, tokens in zip(new_ids.tolist(), words):
+                for term in tokens:
+                    self.pending.setdefault(term, []).append(op_id)
+
+            self.fingerprints = np.concatenate([self.fingerprints, fingerprints.astype(str)])
+            self.dates = np.concatenate([self.dates, pd.to_datetime(operations["Date"]).to_numpy().astype("datetime64[D]")])
+            self.debits = np.concatenate([self.debits, pd.to_numeric(operations["Debit (€)"], errors="coerce").fillna(0.0).to_numpy(dtype=float)])
+            self.credits = np.concatenate([self.credits, pd.to_numeric(operations["Credit (€)"], errors="coerce").fillna(0.0).to_numpy(dtype=float)])
+            self.descriptions = np.concatenate([self.descriptions, operations["Description"].astype(str).to_numpy().astype(str)])
+            self.categories = np.concatenate([self.categories, categories.astype(str)])
+            self.sources = np.concatenate([self.sources, np.full(len(operations), source)])
+            self.alive = np.concatenate([self.alive, np.ones(len(operations), dtype=bool)])
+            self.dirty = True
+        return len(operations)
+
+    def _merge(self):
+        """Merge the buffer into the CSR posting lists, dropping the replaced operations, with a single sort."""
+        if not self.pending and self.alive.all():
+            return None
+        counts = np.diff(self.offsets)
+        pending_terms = list(self.pending)
+        pending_counts = [len(self.pending[t]) for t in pending_terms]
+        terms = np.concatenate([np.repeat(self.terms, counts), np.repeat(np.array(pending_terms, dtype=str), pending_counts)])
+        ids = np.concatenate([self.postings, np.array([i for t in pending_terms for i in self.pending[t]], dtype=np.int32)])
+
+        # Renumber the live operations, so the replaced ones disappear from the side columns too
+        keep = self.alive
+        new_ids = np.cumsum(keep, dtype=np.int64) - 1
+        live = keep[ids] if len(ids) else np.zeros(0, dtype=bool)
+        terms, ids = terms[live], new_ids[ids[live]].astype(np.int32)
+        for name in ["fingerprints", "dates", "debits", "credits", "descriptions", "categories", "sources"]:
+            setattr(self, name, getattr(self, name)[keep])
+        self.alive = np.ones(len(self.fingerprints), dtype=bool)
+        self.ids = {fp: i for i, fp in enumerate(self.fingerprints.tolist())}
+
+        order = np.lexsort((ids, terms))
+        terms, ids = terms[order], ids[order]
+        self.terms, starts = np.unique(terms, return_index=True)
+        self.offsets = np.append(starts, len(ids)).astype(np.int64)
+        self.postings = ids
+        self.pending = {}
+        return None
+
+    def _postings(self, term, prefix = False):
+        """Sorted ids of the operations containing a term (or a word starting with it)."""
+        if prefix:
+            lo = np.searchsorted(self.terms, term, side="left")
+            hi = np.searchsorted(self.terms, term + "\uffff", side="left")
+            parts = [self.postings[self.offsets[lo]:self.offsets[hi]]]
+            parts += [np.array(ids, dtype=np.int32) for t, ids in self.pending.items() if t.startswith(term)]
+            return np.unique(np.concatenate(parts))
+        i = np.searchsorted(self.terms, term)
+        parts = []
+        if i < len(self.terms) and self.terms[i] == term:
+            parts.append(self.postings[self.offsets[i]:self.offsets[i + 1]])
+        if term in self.pending:
+            parts.append(np.array(self.pending[term], dtype=np.int32))
+        if not parts:
+            return np.array([], dtype=np.int32)
+        return np.unique(np.concatenate(parts)) if len(parts) > 1 else parts[0]
+
+    def search(self, text = None, start = None, end = None, min_amount = None, max_amount = None, category = None, match = "all", limit = None):
+        """Search the operations.
+
+        Parameters:
+        -----------
+        text : str, optional
+            The words to look for in the descriptions, e.g. "SNCF PARIS". A word ending with "*" is a prefix
+            ("SNC*"). All the operations are returned if not provided.
+
+        start, end : str or datetime, optional
+            The date range (inclusive).
+
+        min_amount, max_amount : float, optional
+            The range of the amount of the operations (debit or credit).
+
+        category : str, optional
+            The category of the operations.
+
+        match : str, optional
+            "all" for the operations containing all the words, "any" for at least one of them.
+
+        limit : int, optional
+            The maximum number of operations to return (the most recent ones).
+
+        Returns:
+        --------
+        operations : DataFrame
+            The matching operations sorted by date, with the "Fingerprint", "Date", "Description", "Debit (€)",
+            "Credit (€)" and "Category" columns.
+        """
+        with self._lock:
+            terms = query_terms(text) if text is not None else []
+            if text is not None and not terms:
+                ids = np.array([], dtype=np.int32)
+            elif terms:
+                lists = [self._postings(term, prefix) for term, prefix in terms]
+                ids = lists[0]
+                for other in lists[1:]:
+                    ids = np.intersect1d(ids, other, assume_unique=True) if match == "all" else np.union1d(ids, other)
+            else:
+                ids = np.arange(len(self.fingerprints), dtype=np.int32)
+
+            # Filters on the side columns, for the candidate operations only
+            keep = self.alive[ids]
+            if start is not None:
+                keep &= self.dates[ids] >= np.datetime64(pd.Timestamp(start).date(), "D")
+            if end is not None:
+                keep &= self.dates[ids] <= np.datetime64(pd.Timestamp(end).date(), "D")
+            if min_amount is not None or max_amount is not None:
+                amounts = np.maximum(self.debits[ids], self.credits[ids])
+                if min_amount is not None:
+                    keep &= amounts >= min_amount
+                if max_amount is not None:
+                    keep &= amounts <= max_amount
+            if category is not None:
+                keep &= self.categories[ids] == category
+            ids = ids[keep]
+            ids = ids[np.argsort(self.dates[ids], kind="stable")]
+            if limit is not None:
+                ids = ids[-int(limit):] if limit > 0 else ids[:0]
+
+            return pd.DataFrame({"Fingerprint": self.fingerprints[ids],
+                                 "Date": pd.to_datetime(self.dates[ids]),
+                                 "Description": self.descriptions[ids],
+                                 "Debit (€)": self.debits[ids],
+                                 "Credit (€)": self.credits[ids],
+                                 "Category": self.categories[ids]})
+
+    def save(self, file):
+        """Merge the buffer and save the index to a .npz file (no pickle)."""
+        folder = os.path.dirname(file)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with self._lock:
+            self._merge()
+            tmp_file = f"{file}.tmp.npz"
+            np.savez_compressed(tmp_file,
+                                terms=self.terms,
+                                offsets=self.offsets,
+                                postings=self.postings,
+                                fingerprints=self.fingerprints,
+                                dates=self.dates,
+                                debits=self.debits,
+                                credits=self.credits,
+                                descriptions=self.descriptions,
+                                categories=self.categories,
+                                sources=self.sources,
+                                version=np.array(INDEX_VERSION))
+            os.replace(tmp_file, file)
+            if self.file is None or os.path.abspath(file) == os.path.abspath(self.file):
+                self.dirty = False
+        return None
+
+    def flush(self):
+        """Save the index to the file it was loaded from, if operations were added since the last save.
+
+        Returns:
+        --------
+        saved : bool
+            True if the index was saved.
+        """
+        if not self.dirty or self.file is None:
+            return False
+        self.save(self.file)
+        return True
+
+    @classmethod
+    def load(cls, file):
+        """Load an index saved with save. Returns an empty index if the file does not exist."""
+        index = cls()
+        index.file = file
+        if not os.path.exists(file):
+            return index
+        with np.load(file, allow_pickle=False) as data:
+            for name in ["terms", "offsets", "postings", "fingerprints", "dates", "debits", "credits", "descriptions", "categories"]:
+                setattr(index, name, data[name])
+            # Indexes saved before the sources were stored
+            index.sources = data["sources"] if "sources" in data.files else np.full(len(index.fingerprints), "", dtype=str)
+            version = int(data["version"]) if "version" in data.files else 1
+        index.alive = np.ones(len(index.fingerprints), dtype=bool)
+        index.ids = {fp: i for i, fp in enumerate(index.fingerprints.tolist())}
+        if version != INDEX_VERSION:
+            # Tokenized by another version: the postings are rebuilt from the stored descriptions
+            operations = pd.DataFrame({"Date": pd.to_datetime(index.dates), "Description": index.descriptions,
+                                       "Debit (€)": index.debits, "Credit (€)": index.credits, "Category": index.categories})
+            fingerprints = pd.Series(index.fingerprints)
+            sources = index.sources
+            index = cls()
+            index.file = file
+            index.add_operations(operations, fingerprints)
+            index.sources = sources
+        return index
+
+    def __len__(self):
+        return int(self.alive.sum())
+
+    def __str__(self):
+        return f"Search index with {len(self)} operations and {len(self.terms) + len(self.pending)} words"
+
+
+_INDEXES = {}
+_INDEXES_LOCK = threading.Lock()
+
+def get_search_index(file):
+    """Get the search index saved in a file, loaded once and shared by all the summaries of the process.
+
+    The operations added to the index are saved by save_search_indexes, at the end of a batch or when the process exits.
+    """
+    with _INDEXES_LOCK:
+        key = os.path.abspath(file)
+        if key not in _INDEXES:
+            if not _INDEXES:
+                atexit.register(save_search_indexes)
+            _INDEXES[key] = Search_Index.load(file)
+        return _INDEXES[key]
+
+def save_search_indexes():
+    """Save the shared search indexes that have operations added since their last save.
+
+    Returns:
+    --------
+    n : int
+        The number of indexes saved.
+    """
+    with _INDEXES_LOCK:
+        indexes = list(_INDEXES.values())
+    return sum(index.flush() for index in indexes)
+
+
+def search_main(argv = None):
+    """Command line entry point: search the operations of a search index."""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="python -m src.Monthly_Summary search", description="Search the operations of a search index (see --index of batch and watch)")
+    parser.add_argument("index", type=str, help="The search index (.npz)")
+    parser.add_argument("text", type=str, nargs="?", help="The words to look for, a word ending with * being a prefix (e.g. \"SNC* PARIS\")")
+    parser.add_argument("--start", type=str, help="The first date")
+    parser.add_argument("--end", type=str, help="The last date")
+    parser.add_argument("--min_amount", type=float, help="The minimum amount")
+    parser.add_argument("--max_amount", type=float, help="The maximum amount")
+    parser.add_argument("--category", type=str, help="The category of the operations")
+    parser.add_argument("--any", action="store_true", help="Match the operations containing any of the words instead of all")
+    parser.add_argument("--limit", type=int, help="The maximum number of operations (the most recent ones)")
+    args = parser.parse_args(argv)
+
+    results = Search_Index.load(args.index).search(args.text, start=args.start, end=args.end, min_amount=args.min_amount,
+                                                  max_amount=args.max_amount, category=args.category,
+                                                  match="any" if args.any else "all", limit=args.limit)
+    with pd.option_context("display.max_rows", None, "display.width", 200):
+        print(results.drop(columns=["Fingerprint"]).to_string(index=False))
+    print(f"{len(results)} operation(s)")
+    return 0
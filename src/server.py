@@ -0,0 +1,593 @@
+###########################################################################################
+
+################## This package has been written by JB LBT (c) 2024 #######################
+################## Under the GNU GPL v3.0 Licence                   #######################
+
+###########################################################################################
+
+# Importing the necessary libraries
+import os
+import re
+import json
+import time
+import uuid
+import queue
+import sqlite3
+import hashlib
+import threading
+from collections import deque
+from datetime import datetime
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+from src.utils import *
+from src.search import save_search_indexes
+
+############################################################################################
+
+##################################### HTTP JOB SERVICE #####################################
+
+############################################################################################
+
+
+JOB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          TEXT PRIMARY KEY,
+    key         TEXT NOT NULL,
+    name        TEXT,
+    mode        TEXT,
+    budget      REAL,
+    status      TEXT NOT NULL,
+    stage       TEXT,
+    cached      INTEGER NOT NULL DEFAULT 0,
+    source      TEXT,
+    created     REAL NOT NULL,
+    started     REAL,
+    finished    REAL,
+    operations  INTEGER,
+    month       INTEGER,
+    year        INTEGER,
+    error       TEXT,
+    timings     TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_key ON jobs (key, created);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status);
+"""
+JOB_FIELDS = ["id", "key", "name", "mode", "budget", "status", "stage", "cached", "source", "created", "started", "finished", "operations", "month", "year", "error", "timings"]
+JOB_STATUSES = ["queued", "running", "done", "failed"]
+OUTPUT_TYPES = {"xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "csv": "text/csv; charset=utf-8"}
+MAX_UPLOAD = 20 * 1024 * 1024
+
+
+class Job_Store:
+    """
+        Job_Store
+        =========
+
+        SQLite table of the jobs of the service: their status, current stage, result and stage timings.
+        ":memory:" keeps the jobs for the life of the process, a file keeps them across restarts.
+
+        Methods:
+        --------
+        - create: add a queued job
+        - update: update fields of a job
+        - get: a job by id
+        - find: the latest job of a content key that did not fail
+        - delete: remove a job
+        - unfinished: the jobs queued or running, to queue them again after a restart
+        - counts: the number of jobs by status
+    """
+    def __init__(self, file = ":memory:"):
+        self.file = file
+        folder = os.path.dirname(file)
+        if folder and file != ":memory:":
+            os.makedirs(folder, exist_ok=True)
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(file, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        if file != ":memory:":
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(JOB_SCHEMA)
+        self.connection.commit()
+
+    @staticmethod
+    def _job(row):
+        if row is None:
+            return None
+        job = dict(row)
+        job["cached"] = bool(job["cached"])
+        job["timings"] = json.loads(job["timings"]) if job["timings"] else {}
+        return job
+
+    def create(self, key, name = None, mode = "text", budget = None, status = "queued", **fields):
+        """Add a job and return its id."""
+        job_id = uuid.uuid4().hex[:16]
+        values = {"id": job_id, "key": key, "name": name, "mode": mode, "budget": budget, "status": status, "created": time.time(), **fields}
+        if isinstance(values.get("timings"), dict):
+            values["timings"] = json.dumps(values["timings"])
+        columns = ", ".join(values)
+        with self._lock:
+            with self.connection:
+                self.connection.execute(f"INSERT INTO jobs ({columns}) VALUES ({', '.join('?' * len(values))})", list(values.values()))
+        return job_id
+
+    def update(self, job_id, **fields):
+        """Update fields of a job (the timings are given as a dict)."""
+        unknown = set(fields) - set(JOB_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown job fields {sorted(unknown)}")
+        if isinstance(fields.get("timings"), dict):
+            fields["timings"] = json.dumps(fields["timings"])
+        with self._lock:
+            with self.connection:
+                self.connection.execute(f"UPDATE jobs SET {', '.join(f'{k} = ?' for k in fields)} WHERE id = ?", list(fields.values()) + [job_id])
+        return None
+
+    def get(self, job_id):
+        with self._lock:
+            return self._job(self.connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def find(self, key):
+        with self._lock:
+            return self._job(self.connection.execute("SELECT * FROM jobs WHERE key = ? AND status != 'failed' ORDER BY created DESC LIMIT 1", (key,)).fetchone())
+
+    def delete(self, job_id):
+        with self._lock:
+            with self.connection:
+                self.connection.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        return None
+
+    def unfinished(self):
+        with self._lock:
+            return [self._job(row) for row in self.connection.execute("SELECT * FROM jobs WHERE status IN ('queued', 'running') ORDER BY created")]
+
+    def counts(self):
+        # A job sharing the result of another one has the status of its source job, even before it is read
+        with self._lock:
+            counts = dict(self.connection.execute("SELECT COALESCE(s.status, j.status), COUNT(*) FROM jobs j "
+                                                  "LEFT JOIN jobs s ON s.id = j.source GROUP BY 1").fetchall())
+        return {status: counts.get(status, 0) for status in JOB_STATUSES}
+
+    def close(self):
+        with self._lock:
+            self.connection.close()
+        return None
+
+
+class Stage_Metrics:
+    """Latency of each stage of the jobs: the count and total over the whole run, the percentiles over the last samples."""
+    def __init__(self, window = 1000):
+        self.window = window
+        self.samples = {}
+        self.counts = {}
+        self.totals = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self.samples.setdefault(stage, deque(maxlen=self.window)).append(seconds)
+            self.counts[stage] = self.counts.get(stage, 0) + 1
+            self.totals[stage] = self.totals.get(stage, 0.0) + seconds
+        return None
+
+    def summary(self):
+        """The count, mean, median, 95th percentile and maximum latency of each stage, in seconds."""
+        with self._lock:
+            samples = {stage: np.array(values) for stage, values in self.samples.items()}
+            counts, totals = dict(self.counts), dict(self.totals)
+        return {stage: {"count": counts[stage],
+                        "mean": round(totals[stage] / counts[stage], 4),
+                        "p50": round(float(np.percentile(values, 50)), 4),
+                        "p95": round(float(np.percentile(values, 95)), 4),
+                        "max": round(float(values.max()), 4)} for stage, values in samples.items()}
+
+
+class Statement_Service:
+    """
+        Statement_Service
+        =================
+
+        Processing side of the HTTP service. The uploaded statements are stored under the hash of their
+        content, queued in a bounded queue and processed by a pool of worker threads (extraction, parsing and
+        categorization, then the Excel and CSV outputs of the month).
+
+        The results are cached by content: uploading a statement already processed (or being processed) with
+        the same options returns a job sharing its outputs, without any extraction call. When the queue is
+        full, submit raises queue.Full and the request is refused (backpressure). The latency of each stage is
+        recorded for the metrics.
+
+        Methods:
+        --------
+        - submit: store an uploaded statement and queue its job
+        - job: the status of a job
+        - output: the path of an output of a finished job
+        - metrics: the queue, the jobs by status and the stage latencies
+        - start, stop: start and stop the workers
+    """
+    def __init__(self, folder = "Output/jobs", workers = 2, max_queue = 16, jobs_file = ":memory:", mode = "text", logger = None, **kwargs):
+        """Initialize the service.
+
+        Parameters:
+        -----------
+        folder : str, optional
+            The folder of the uploaded statements and of their outputs, named by content hash.
+
+        workers : int, optional
+            The number of statements processed in parallel.
+
+        max_queue : int, optional
+            The maximum number of jobs waiting for a worker.
+
+        jobs_file : str, optional
+            The SQLite file of the jobs, default is ":memory:".
+
+        mode : str, optional
+            The default parsing mode, "text", "markdown" or "auto".
+
+        logger : Logger, optional
+            The logger to report to.
+
+        **kwargs : dict
+            Additional keyword arguments to pass to the Monthly_Summary class.
+        """
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+        self.workers = max(1, workers)
+        self.mode = mode
+        self.kwargs = kwargs
+        if logger is None:
+            logger = Logger(f"{LOG_FOLDER}/server_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.log", do_log = kwargs.get("do_log", True), verbose = 3 if kwargs.get("verbose") else 1)
+        self.logger = logger
+        self.store = Job_Store(jobs_file)
+        self.metrics_ = Stage_Metrics()
+        self.jobs = queue.Queue(maxsize=max_queue)
+        self.in_flight = 0
+        self.started = time.time()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._resume()
+
+    @staticmethod
+    def content_key(content, mode = "text", budget = None):
+        """Key of the result of a statement: the hash of its content and of the options changing the result."""
+        digest = hashlib.sha256(content).hexdigest()
+        options = hashlib.sha256(json.dumps([mode, budget]).encode("utf-8")).hexdigest()[:8]
+        return f"{digest[:32]}_{mode}_{options}"
+
+    def path(self, key, ext):
+        return os.path.join(self.folder, f"{key}.{ext}")
+
+    def submit(self, content, name = None, mode = None, budget = None):
+        """Store an uploaded statement and queue its job, or reuse the result of the same statement.
+
+        Parameters:
+        -----------
+        content : bytes
+            The PDF file.
+
+        name : str, optional
+            The name of the uploaded file, for display only.
+
+        mode : str, optional
+            The parsing mode, default is the mode of the service.
+
+        budget : float, optional
+            The monthly budget. If not provided, the automatic budget is used.
+
+        Returns:
+        --------
+        job : dict
+            The job, with its "id" and "status".
+
+        Raises:
+        -------
+        queue.Full
+            If the queue is full.
+        """
+        mode = mode or self.mode
+        key = self.content_key(content, mode, budget)
+        # The lookup and the creation of the job are atomic, two uploads of the same statement are never both processed
+        with self._lock:
+            previous = self.store.find(key)
+            if previous is not None and (previous["status"] != "done" or all(os.path.exists(self.path(key, ext)) for ext in OUTPUT_TYPES)):
+                # Same statement and options: share the result (or the job in progress) instead of processing it again
+                source = previous["source"] or previous["id"]
+                job_id = self.store.create(key, name, mode, budget, status = previous["status"], cached = 1, source = source)
+                self.metrics_.record("cache_hit", 0.0)
+                self.logger.log(f"Job {job_id} ({name}) shares the result of job {source}")
+                return self.job(job_id)
+
+            pdf = self.path(key, "pdf")
+            if not os.path.exists(pdf):
+                tmp_file = f"{pdf}.tmp"
+                with open(tmp_file, "wb") as f:
+                    f.write(content)
+                os.replace(tmp_file, pdf)
+            job_id = self.store.create(key, name, mode, budget)
+            try:
+                self.jobs.put_nowait((job_id, key))
+            except queue.Full:
+                self.store.delete(job_id)
+                raise
+        self.logger.log(f"Job {job_id} ({name}) queued")
+        return self.job(job_id)
+
+    def _process(self, job_id, key):
+        """Run the stages of a job, recording their latency."""
+        from src.Monthly_Summary import Monthly_Summary
+        from src.extraction import get_engine
+
+        job = self.store.get(job_id)
+        pdf = self.path(key, "pdf")
+        timings = {"queue": time.time() - job["created"]}
+        self.metrics_.record("queue", timings["queue"])
+        self.store.update(job_id, status = "running", started = time.time())
+
+        def stage(name, function):
+            self.store.update(job_id, stage = name)
+            start = time.perf_counter()
+            result = function()
+            timings[name] = time.perf_counter() - start
+            self.metrics_.record(name, timings[name])
+            return result
+
+        # A job writes a workbook of its own month, there is nothing to deduplicate against
+        ms = Monthly_Summary(pdf, **{"handle_errors": False, **self.kwargs, "dedup": False})
+        def extract():
+            pages = get_engine().load(pdf, job["mode"], logger = ms.logger, handle_errors = False)
+            if hasattr(pages, "close"):
+                pages.close()
+            return None
+
+        # The extraction is timed on its own, the parse then reads the pages from the page cache
+        if job["mode"] in ["text", "markdown"]:
+            stage("extract", extract)
+        stage("parse", lambda: ms.add_operations(mode = job["mode"]))
+        if len(ms.operations) == 0:
+            raise ValueError("No operations found")
+        ms.add_monthly_budget(job["budget"])
+        stage("excel", lambda: self._write(ms, self.path(key, "xlsx"), "to_excel"))
+        stage("csv", lambda: self._write(ms, self.path(key, "csv"), "to_csv"))
+        return ms, timings
+
+    @staticmethod
+    def _write(ms, file, method):
+        """Write an output of a job to a temporary file first, so a download never gets a partial file."""
+        tmp_file = f"{file}.part.{os.path.splitext(file)[1][1:]}"
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        getattr(ms, method)(tmp_file)
+        os.replace(tmp_file, file)
+        return None
+
+    def _worker(self):
+        while not self._stop.is_set():
+            try:
+                job_id, key = self.jobs.get(timeout=0.5)
+            except queue.Empty:
+                # The queue is drained: the operations added to the search index are saved
+                save_search_indexes()
+                continue
+            with self._lock:
+                self.in_flight += 1
+            start = time.perf_counter()
+            try:
+                ms, timings = self._process(job_id, key)
+                timings["total"] = time.perf_counter() - start
+                self.metrics_.record("total", timings["total"])
+                self.store.update(job_id, status = "done", stage = None, finished = time.time(), operations = len(ms.operations),
+                                  month = int(ms.month), year = int(ms.year), timings = timings)
+                self.logger.log(f"Job {job_id} done: {len(ms.operations)} operations in {timings['total']:.1f}s")
+            except Exception as e:
+                self.metrics_.record("failed", time.perf_counter() - start)
+                self.store.update(job_id, status = "failed", finished = time.time(), error = f"{type(e).__name__}: {e}")
+                self.logger.error(f"Job {job_id} failed: {e}", title = "Job error")
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+                self.jobs.task_done()
+        return None
+
+    def job(self, job_id):
+        """The job with its status, None if it does not exist."""
+        job = self.store.get(job_id)
+        if job is None:
+            return None
+        if job["source"] is not None and job["status"] in ["queued", "running"]:
+            # A job sharing the result of another one follows it until it is finished
+            source = self.store.get(job["source"])
+            fields = {k: source[k] for k in ["status", "stage", "started", "finished", "operations", "month", "year", "error", "timings"]}
+            if source["status"] in ["done", "failed"]:
+                self.store.update(job_id, **fields)
+            job.update(fields)
+        job["outputs"] = [ext for ext in OUTPUT_TYPES if job["status"] == "done"]
+        return job
+
+    def output(self, job_id, ext):
+        """The path of an output ("xlsx" or "csv") of a finished job, None if the job is not finished."""
+        job = self.job(job_id)
+        if job is None or job["status"] != "done" or ext not in OUTPUT_TYPES:
+            return None
+        path = self.path(job["key"], ext)
+        return path if os.path.exists(path) else None
+
+    def metrics(self):
+        """The queue depth, the jobs by status and the latencies of the stages."""
+        with self._lock:
+            in_flight = self.in_flight
+        return {"uptime": round(time.time() - self.started, 1),
+                "workers": self.workers,
+                "queue_depth": self.jobs.qsize(),
+                "queue_size": self.jobs.maxsize,
+                "in_flight": in_flight,
+                "jobs": self.store.counts(),
+                "stages": self.metrics_.summary()}
+
+    def _resume(self):
+        """Queue again the jobs left unfinished by a previous run of the service (with a jobs file)."""
+        for job in self.store.unfinished():
+            if job["source"] is not None:
+                # Follows its source job, see job
+                continue
+            try:
+                if not os.path.exists(self.path(job["key"], "pdf")):
+                    raise FileNotFoundError(job["key"])
+                self.jobs.put_nowait((job["id"], job["key"]))
+                self.store.update(job["id"], status = "queued", stage = None)
+            except (FileNotFoundError, queue.Full):
+                self.store.update(job["id"], status = "failed", error = "Interrupted")
+        return None
+
+    def start(self):
+        """Start the workers."""
+        self._stop.clear()
+        self._threads = [threading.Thread(target=self._worker, name=f"server-worker-{i}", daemon=True) for i in range(self.workers)]
+        for t in self._threads:
+            t.start()
+        return None
+
+    def stop(self):
+        """Stop the workers after their current job."""
+        self._stop.set()
+        for t in self._threads:
+            t.join()
+        self._threads = []
+        save_search_indexes()
+        return None
+
+
+def download_name(name, default):
+    """Name of a downloaded output, from the name given at upload: the base name without extension, restricted to
+    safe characters so it can not break (or inject) a response header."""
+    name = os.path.splitext(os.path.basename((name or "").replace("\\", "/")))[0]
+    name = re.sub(r"[^A-Za-z0-9._ -]", "_", name).strip(" .")[:100]
+    return name or default
+
+
+class Statement_Handler(BaseHTTPRequestHandler):
+    """Routes of the service:
+
+    - POST /jobs?name=<file name>&mode=<mode>&budget=<budget>, with the PDF file as body: 202 and the job
+    - GET /jobs/<id>: the job and its status ("queued", "running", "done" or "failed")
+    - GET /jobs/<id>/xlsx, GET /jobs/<id>/csv: the outputs of a finished job
+    - GET /metrics: the queue, the jobs by status and the stage latencies
+    """
+    server_version = "BNPStatementService/1.0"
+
+    def _send(self, code, body, content_type = "application/json", headers = None):
+        if not isinstance(body, bytes):
+            body = json.dumps(body, default=str).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+        return None
+
+    def _error(self, code, message):
+        return self._send(code, {"error": message})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path.rstrip("/") != "/jobs":
+            return self._error(404, "Not found")
+        length = self.headers.get("Content-Length")
+        if length is None:
+            return self._error(411, "Content-Length required")
+        try:
+            length = int(length)
+        except ValueError:
+            return self._error(400, f"Invalid Content-Length {length}")
+        if length < 0:
+            return self._error(400, f"Invalid Content-Length {length}")
+        if length > MAX_UPLOAD:
+            return self._error(413, f"The file is larger than {MAX_UPLOAD} bytes")
+        content = self.rfile.read(length)
+        if not content.startswith(b"%PDF"):
+            return self._error(400, "The body is not a PDF file")
+
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        mode = params.get("mode")
+        if mode is not None and mode not in ["text", "markdown", "auto"]:
+            return self._error(400, f"Unknown mode {mode}")
+        try:
+            budget = float(params["budget"]) if "budget" in params else None
+        except ValueError:
+            return self._error(400, f"Invalid budget {params['budget']}")
+        try:
+            job = self.server.service.submit(content, name = params.get("name"), mode = mode, budget = budget)
+        except queue.Full:
+            return self._error(503, "Too many jobs waiting, retry later")
+        return self._send(202, job, headers = {"Location": f"/jobs/{job['id']}"})
+
+    def do_GET(self):
+        service = self.server.service
+        parts = [p for p in urlparse(self.path).path.split("/") if p]
+        if parts == ["metrics"]:
+            return self._send(200, service.metrics())
+        if len(parts) in [2, 3] and parts[0] == "jobs":
+            job = service.job(parts[1])
+            if job is None:
+                return self._error(404, f"Unknown job {parts[1]}")
+            if len(parts) == 2:
+                return self._send(200, job)
+            ext = parts[2]
+            if ext not in OUTPUT_TYPES:
+                return self._error(404, f"Unknown output {ext}, expected one of {list(OUTPUT_TYPES)}")
+            path = service.output(parts[1], ext)
+            if path is None:
+                return self._error(409, f"Job {parts[1]} is {job['status']}")
+            with open(path, "rb") as f:
+                data = f.read()
+            name = download_name(job["name"], parts[1])
+            return self._send(200, data, OUTPUT_TYPES[ext], {"Content-Disposition": f'attachment; filename="{name}.{ext}"'})
+        return self._error(404, "Not found")
+
+    def log_message(self, format, *args):
+        self.server.service.logger.log(f"{self.address_string()} {format % args}")
+
+
+def make_server(service, host = "127.0.0.1", port = 8000):
+    """HTTP server of a service, one thread per connection."""
+    server = ThreadingHTTPServer((host, port), Statement_Handler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def serve_main(argv = None):
+    """Command line entry point of the service mode: python -m src.Monthly_Summary serve [options]."""
+    import argparse
+    parser = argparse.ArgumentParser(prog="serve", description="Local HTTP service: upload PDF bank statements, poll their jobs and download the Excel and CSV outputs")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="The address to listen on")
+    parser.add_argument("--port", type=int, default=8000, help="The port to listen on")
+    parser.add_argument("--folder", type=str, default="Output/jobs", help="The folder of the uploaded statements and of their outputs")
+    parser.add_argument("--workers", type=int, default=2, help="The number of statements processed in parallel")
+    parser.add_argument("--max_queue", type=int, default=16, help="The maximum number of jobs waiting for a worker")
+    parser.add_argument("--jobs", type=str, default=":memory:", help="The SQLite file of the jobs, kept across restarts (default: in memory)")
+    parser.add_argument("--mode", type=str, default="text", choices=["text", "markdown", "auto"], help="The default parsing mode")
+    parser.add_argument("--rules", type=str, help="The file containing the rules to categorize the operations")
+    parser.add_argument("--ledger", type=str, help="The SQLite ledger to write the operations to")
+    parser.add_argument("--index", type=str, help="The search index (.npz) to add the operations to")
+    parser.add_argument("--verbose", action="store_true", help="Print verbose messages")
+    parser.add_argument("--do_log", action="store_true", help="Log the messages")
+    args = parser.parse_args(argv)
+
+    service = Statement_Service(args.folder, workers = args.workers, max_queue = args.max_queue, jobs_file = args.jobs, mode = args.mode,
+                                rules_file = args.rules, ledger_file = args.ledger, index_file = args.index, verbose = args.verbose, do_log = args.do_log)
+    server = make_server(service, args.host, args.port)
+    service.start()
+    print(f"Serving on http://{args.host}:{server.server_address[1]} with {service.workers} worker(s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopping")
+    finally:
+        server.server_close()
+        service.stop()
+        service.store.close()
+    return 0
@@ -0,0 +1,275 @@
+###########################################################################################
+
+################## This package has been written by JB LBT (c) 2024 #######################
+################## Under the GNU GPL v3.0 Licence                   #######################
+
+###########################################################################################
+
+# Importing the necessary libraries
+import os
+import threading
+import numpy as np
+import pandas as pd
+from src.utils import *
+
+############################################################################################
+
+################################### CATEGORY SUGGESTER #####################################
+
+############################################################################################
+
+
+def tokenize(description):
+    """Tokens of a description: the words of its normalized form and their bigrams."""
+    words = normalize_description(description).split()
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class Category_Suggester:
+    """
+        Category_Suggester
+        ==================
+
+        Multinomial naive Bayes over the words and bigrams of the normalized descriptions, trained on the
+        operations that were already categorized. It is used to suggest a category for the operations that
+        no rule matched, instead of "Other".
+
+        The tokens are weighted by their inverse document frequency, so the generic ones (CARTE, PRLV, SEPA...)
+        barely count, and the confidence is normalized over the categories and a background class (the token
+        distribution of all the operations): a description whose tokens are as likely anywhere gets a low
+        confidence. The operations are learnt once per fingerprint, a later category replaces the learnt one.
+
+        Methods:
+        --------
+        - update: add categorized operations to the model (incremental training)
+        - predict: rank the categories of a batch of descriptions
+        - save: save the model to a .npz file
+        - load: class method, load a model from a .npz file
+    """
+    def __init__(self, alpha = 0.5):
+        """Initialize an empty model.
+
+        Parameters:
+        -----------
+        alpha : float, optional
+            The additive (Laplace) smoothing of the token counts.
+        """
+        self.alpha = alpha
+        self.vocab = {}                         # token -> column
+        self.categories = []                    # row -> category
+        self.counts = np.zeros((0, 0))          # (categories, tokens) token counts
+        self.class_counts = np.zeros(0)         # number of operations per category
+        self.learnt = {}                        # fingerprint -> category row of the operations learnt
+        self._log_probs = None
+        self._lock = threading.Lock()
+
+    def _grow(self, n_categories, n_tokens):
+        """Extend the count matrices to the new number of categories and tokens."""
+        rows, cols = self.counts.shape
+        if n_categories > rows or n_tokens > cols:
+            counts = np.zeros((max(rows, n_categories), max(cols, n_tokens)))
+            counts[:rows, :cols] = self.counts
+            self.counts = counts
+            class_counts = np.zeros(max(rows, n_categories))
+            class_counts[:rows] = self.class_counts
+            self.class_counts = class_counts
+
+    def update(self, descriptions, categories, fingerprints = None):
+        """Add categorized operations to the model.
+
+        Parameters:
+        -----------
+        descriptions : iterable of str
+            The descriptions of the operations.
+
+        categories : iterable of str
+            Their categories. The "Other" operations are not learnt.
+
+        fingerprints : iterable of str, optional
+            The fingerprints of the operations. An operation already learnt is not counted again, and if its
+            category changed (e.g. a correction) it is moved to the new category ("Other" forgets it).
+            Without fingerprints, every operation is counted.
+
+        Returns:
+        --------
+        n : int
+            The number of operations learnt or moved.
+        """
+        if fingerprints is None:
+            fingerprints = [None] * len(descriptions)
+        rows, cols, signs = [], [], []
+        class_rows, class_signs = [], []
+        n = 0
+        with self._lock:
+            for description, category, fingerprint in zip(descriptions, categories, fingerprints):
+                other = category == "Other" or pd.isna(category)
+                if not other and category not in self.categories:
+                    self.categories.append(category)
+                row = -1 if other else self.categories.index(category)
+                old = self.learnt.get(fingerprint, -1) if fingerprint is not None else -1
+                if fingerprint is not None and fingerprint in self.learnt and old == row:
+                    continue
+                moves = [(old, -1)] if old >= 0 else []
+                if row >= 0:
+                    moves.append((row, 1))
+                if not moves:
+                    continue
+                tokens = [self.vocab.setdefault(token, len(self.vocab)) for token in tokenize(description)]
+                for r, sign in moves:
+                    class_rows.append(r)
+                    class_signs.append(sign)
+                    rows.extend([r] * len(tokens))
+                    cols.extend(tokens)
+                    signs.extend([sign] * len(tokens))
+                if fingerprint is not None:
+                    if row >= 0:
+                        self.learnt[fingerprint] = row
+                    else:
+                        self.learnt.pop(fingerprint, None)
+                n += 1
+
+            if not class_rows:
+                return 0
+            self._grow(len(self.categories), len(self.vocab))
+            np.add.at(self.counts, (np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64)), np.array(signs, dtype=float))
+            np.add.at(self.class_counts, np.array(class_rows, dtype=np.int64), np.array(class_signs, dtype=float))
+            self._log_probs = None
+        return n
+
+    def _get_log_probs(self):
+        """Log priors of the categories, log probabilities of the tokens in each category and in the background
+        (all the operations), and inverse document frequency of the tokens, cached until the next update."""
+        if self._log_probs is None:
+            smoothed = self.counts + self.alpha
+            token_log_probs = np.log(smoothed) - np.log(smoothed.sum(axis=1, keepdims=True))
+            log_priors = np.log(self.class_counts + 1) - np.log(self.class_counts.sum() + len(self.class_counts))
+            background = self.counts.sum(axis=0) + self.alpha
+            background_log_probs = np.log(background) - np.log(background.sum())
+            # Number of operations containing each token (tokens rarely repeat within a description)
+            frequencies = np.maximum(self.counts.sum(axis=0), 0)
+            idf = np.log((self.class_counts.sum() + 1) / (frequencies + 1))
+            self._log_probs = (log_priors, token_log_probs, background_log_probs, idf)
+        return self._log_probs
+
+    def predict(self, descriptions, top = 3, max_share = 0.5):
+        """Rank the categories of a batch of descriptions.
+
+        The score of a category is its log prior plus the log probabilities of the known tokens, each weighted
+        by its inverse document frequency. The probabilities are normalized over the categories and a
+        background class (the token distribution of all the operations, with the prior of an average
+        category), so the generic tokens alone do not give a confident suggestion.
+
+        Parameters:
+        -----------
+        descriptions : iterable of str
+            The descriptions to categorize.
+
+        top : int, optional
+            The number of ranked suggestions to return for each description.
+
+        max_share : float, optional
+            The maximum share of the operations learnt containing a token for it to be informative. The
+            evidence of a suggestion is the number of informative tokens of the description already seen in
+            its category.
+
+        Returns:
+        --------
+        suggestions : DataFrame
+            One row per description with the columns "Suggestion" (best category, None if no known token),
+            "Confidence" (its posterior probability), "Evidence" (number of informative tokens shared with the
+            suggested category) and "Ranking" (list of the top (category, probability)).
+        """
+        descriptions = list(descriptions)
+        empty = pd.DataFrame({"Suggestion": [None] * len(descriptions), "Confidence": [0.0] * len(descriptions),
+                              "Evidence": [0] * len(descriptions), "Ranking": [[] for _ in descriptions]})
+        if len(self.categories) == 0 or len(descriptions) == 0 or self.class_counts.sum() <= 0:
+            return empty
+
+        # Sparse (CSR-like) representation of the batch: the known token columns of every row, concatenated
+        cols, lengths = [], []
+        for description in descriptions:
+            known = list({self.vocab[t] for t in tokenize(description) if t in self.vocab})
+            cols.extend(known)
+            lengths.append(len(known))
+        lengths = np.array(lengths)
+        has_tokens = lengths > 0
+        if not has_tokens.any():
+            return empty
+
+        log_priors, token_log_probs, background_log_probs, idf = self._get_log_probs()
+        cols = np.array(cols, dtype=np.int64)
+        weights = idf[cols]
+        offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))[has_tokens]
+        scores = np.add.reduceat(token_log_probs[:, cols] * weights, offsets, axis=1) + log_priors[:, None]
+        background = np.add.reduceat(background_log_probs[cols] * weights, offsets) + log_priors.mean()
+
+        # Posterior probabilities (softmax over the categories and the background)
+        scores = np.vstack([scores, background[None, :]])
+        scores = np.exp(scores - scores.max(axis=0, keepdims=True))
+        probs = (scores / scores.sum(axis=0, keepdims=True))[:-1]
+        order = np.argsort(-probs, axis=0)[:top]
+
+        # Evidence: informative tokens of the description already seen in the suggested category
+        best = order[0]
+        informative = self.counts.sum(axis=0) <= max_share * self.class_counts.sum()
+        seen = (self.counts[np.repeat(best, lengths[has_tokens]), cols] > 0) & informative[cols]
+        evidence = np.add.reduceat(seen.astype(int), offsets)
+
+        suggestions = empty
+        categories = np.array(self.categories, dtype=object)
+        rows = np.flatnonzero(has_tokens)
+        suggestions.loc[rows, "Suggestion"] = categories[best]
+        suggestions.loc[rows, "Confidence"] = probs[best, np.arange(len(rows))]
+        suggestions.loc[rows, "Evidence"] = evidence
+        rankings = [[(categories[order[k, j]], float(probs[order[k, j], j])) for k in range(order.shape[0])] for j in range(len(rows))]
+        suggestions.loc[rows, "Ranking"] = pd.Series(rankings, index=rows, dtype=object)
+        return suggestions
+
+    def save(self, file):
+        """Save the model to a .npz file (no pickle)."""
+        folder = os.path.dirname(file)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with self._lock:
+            tokens = sorted(self.vocab, key=self.vocab.get)
+            tmp_file = f"{file}.tmp.npz"
+            np.savez_compressed(tmp_file,
+                                counts=self.counts,
+                                class_counts=self.class_counts,
+                                vocab=np.array(tokens, dtype=str),
+                                categories=np.array(self.categories, dtype=str),
+                                alpha=np.array(self.alpha),
+                                fingerprints=np.array(list(self.learnt), dtype=str),
+                                learnt=np.array(list(self.learnt.values()), dtype=np.int64))
+            os.replace(tmp_file, file)
+        return None
+
+    @classmethod
+    def load(cls, file):
+        """Load a model saved with save. Returns an empty model if the file does not exist."""
+        if not os.path.exists(file):
+            return cls()
+        with np.load(file, allow_pickle=False) as data:
+            suggester = cls(alpha=float(data["alpha"]))
+            suggester.counts = data["counts"]
+            suggester.class_counts = data["class_counts"]
+            suggester.vocab = {t: i for i, t in enumerate(data["vocab"].tolist())}
+            suggester.categories = data["categories"].tolist()
+            if "fingerprints" in data.files:
+                suggester.learnt = dict(zip(data["fingerprints"].tolist(), data["learnt"].tolist()))
+        return suggester
+
+    def __str__(self):
+        return f"Category suggester with {len(self.categories)} categories, {len(self.vocab)} tokens and {int(self.class_counts.sum())} operations learnt"
+
+
+_SUGGESTERS = {}
+_SUGGESTERS_LOCK = threading.Lock()
+
+def get_suggester(file):
+    """Get the suggester saved in a file, loaded once and shared by all the summaries of the process."""
+    with _SUGGESTERS_LOCK:
+        key = os.path.abspath(file)
+        if key not in _SUGGESTERS:
+            _SUGGESTERS[key] = Category_Suggester.load(file)
+        return _SUGGESTERS[key]
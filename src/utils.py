@@ -7,7 +7,10 @@
 
 # Importing the necessary libraries
 import os
+import re
+import hashlib
 import nest_asyncio
+import pandas as pd
 from functools import wraps
 from datetime import datetime
 #from dotenv import load_dotenv
@@ -26,12 +29,74 @@ months_mapping = {"janvier":1, "février":2, "mars":3, "avril":4, "mai":5, "juin
 #ACCOUNT_ID = os.getenv("ACCOUNT_ID")
 ACCOUNT_ID = "JB_courant"
 CATEGORY_LIST = ["Transports", "Vie quotidienne", "Logement", "Loisirs", "Santé", "Impôts", "Banque", "Salaire", "Epargne", "Autre"]
+CACHE_FOLDER = "cache"
+LOG_FOLDER = "logs"
+number_to_month = {1: "Janvier", 2: "Février", 3: "Mars", 4: "Avril", 5: "Mai", 6: "Juin", 7: "Juillet", 8: "Août", 9: "Septembre", 10: "Octobre", 11: "Novembre", 12: "Décembre"}
+
+# Card numbers (X1234), dates (25/06, 25.06.24) and any token containing a digit (references, IDs, amounts)
+_NORMALIZE_PATTERNS = [
+    (r"\bX\d{4}\b", " "),
+    (r"\b\d{1,2}[/.]\d{1,2}(?:[/.]\d{2,4})?\b", " "),
+    (r"\S*\d\S*", " "),
+    (r"[^\w&' ]", " "),
+    (r"\s+", " "),
+]
+_NORMALIZE_REGEXES = [(re.compile(p), r) for p, r in _NORMALIZE_PATTERNS]
 
 
 def match_date(date):
     day, month, year = date.split(" ")
     return datetime(int(year), months_mapping[month], int(day))
 
+def normalize_description(description):
+    """Normalize an operation description so that the operations of the same merchant share the same key.
+
+    The card numbers, dates and reference IDs are removed, the text is upper-cased and the blanks are collapsed.
+    Example: "CARTE X1234 25/06 RATP" -> "CARTE RATP"
+    """
+    description = str(description).upper()
+    for regex, repl in _NORMALIZE_REGEXES:
+        description = regex.sub(repl, description)
+    return description.strip()
+
+def normalize_descriptions(descriptions):
+    """Vectorized version of normalize_description for a pandas Series of descriptions.
+
+    Only the distinct descriptions are normalized, a long history repeating the same labels costs one regex pass per label.
+    """
+    codes, uniques = pd.factorize(descriptions.astype(str), use_na_sentinel=False)
+    uniques = pd.Series(uniques, dtype=object).str.upper()
+    for pattern, repl in _NORMALIZE_PATTERNS:
+        uniques = uniques.str.replace(pattern, repl, regex=True)
+    return pd.Series(uniques.str.strip().to_numpy()[codes], index=descriptions.index, dtype=object)
+
+def operation_fingerprints(operations):
+    """Stable fingerprint of each operation, independent of its position and of later edits of its category.
+
+    The fingerprint hashes the dates, the normalized description, the amounts and the occurrence ordinal
+    of the operation among the identical ones (so two identical operations on the same day stay distinct).
+
+    Parameters:
+    -----------
+    operations : DataFrame
+        The operations, with the "Date", "Operation Date", "Description", "Debit (€)" and "Credit (€)" columns.
+
+    Returns:
+    --------
+    fingerprints : Series
+        The 16 hex characters fingerprints, with the index of the operations.
+    """
+    if len(operations) == 0:
+        return pd.Series([], index=operations.index, dtype=object)
+    keys = (pd.to_datetime(operations["Date"]).dt.strftime("%Y-%m-%d") + "|"
+            + pd.to_datetime(operations["Operation Date"]).dt.strftime("%Y-%m-%d") + "|"
+            + normalize_descriptions(operations["Description"]) + "|"
+            + operations["Debit (€)"].astype(float).map("{:.2f}".format) + "|"
+            + operations["Credit (€)"].astype(float).map("{:.2f}".format))
+    ordinals = keys.groupby(keys.values).cumcount().astype(str)
+    keys = keys + "|" + ordinals
+    return keys.map(lambda k: hashlib.sha1(k.encode("utf-8")).hexdigest()[:16])
+
 def timeit(func):
     """Decorator to measure the time of a function.
 
@@ -0,0 +1,332 @@
+###########################################################################################
+
+################## This package has been written by JB LBT (c) 2024 #######################
+################## Under the GNU GPL v3.0 Licence                   #######################
+
+###########################################################################################
+
+# Importing the necessary libraries
+import os
+import json
+import time
+import queue
+import threading
+from datetime import datetime
+from src.utils import *
+from src.batch import process_one
+from src.search import save_search_indexes
+
+############################################################################################
+
+##################################### FOLDER WATCHER #######################################
+
+############################################################################################
+
+
+class Folder_Watcher:
+    """
+        Folder_Watcher
+        ==============
+
+        Long-running watcher of a folder of PDF statements. New or changed PDFs are detected by polling,
+        debounced until their size and modification time are stable, then extracted, parsed and categorized
+        on a bounded pool of workers, and finally appended to the workbook by a single writer.
+
+        The queue between the poller and the workers is bounded: when it is full, the detected files stay
+        pending and are queued again on the next polls (backpressure). The state of the processed files is
+        kept in a JSON file so a restart does not reprocess them, and a status file reports the queue depth,
+        the number of files in flight and the processing latency.
+
+        Methods:
+        --------
+        - scan: poll the folder once and queue the stable new or changed files
+        - run: run the watcher until stop is called (or for a number of polls)
+        - stop: ask the watcher to stop
+        - write_status: write the status file
+    """
+    def __init__(self, folder = "Data", dest_file = None, workers = 2, poll_interval = 5.0, debounce = 2.0,
+                 max_queue = 8, state_file = None, status_file = None, mode = "text", overview = False, logger = None, **kwargs):
+        """Initialize the watcher.
+
+        Parameters:
+        -----------
+        folder : str, optional
+            The folder to watch, default is "Data".
+
+        dest_file : str, optional
+            The Excel workbook the new months are appended to. If not provided, the default name of to_excel is used.
+
+        workers : int, optional
+            The number of files processed in parallel.
+
+        poll_interval : float, optional
+            The number of seconds between two polls of the folder.
+
+        debounce : float, optional
+            The number of seconds a file must keep the same size and modification time before being processed.
+
+        max_queue : int, optional
+            The maximum number of files waiting for a worker.
+
+        state_file : str, optional
+            The JSON file recording the processed files. Default is ".watcher_state.json" in the watched folder.
+
+        status_file : str, optional
+            The JSON status file. Default is ".watcher_status.json" in the watched folder.
+
+        mode : str, optional
+            The parsing mode, "text", "markdown" or "auto".
+
+        overview : bool, optional
+            If True, the overview sheet of the workbook is updated after each new month.
+
+        logger : Logger, optional
+            The logger to report to.
+
+        **kwargs : dict
+            Additional keyword arguments to pass to the Monthly_Summary class.
+        """
+        self.folder = folder
+        self.dest_file = dest_file
+        self.workers = max(1, workers)
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.mode = mode
+        self.overview = overview
+        self.kwargs = kwargs
+        self.state_file = state_file if state_file is not None else os.path.join(folder, ".watcher_state.json")
+        self.status_file = status_file if status_file is not None else os.path.join(folder, ".watcher_status.json")
+        if logger is None:
+            logger = Logger(f"{LOG_FOLDER}/watcher_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.log", do_log = kwargs.get("do_log", True), verbose = 3 if kwargs.get("verbose") else 1)
+        self.logger = logger
+
+        self.jobs = queue.Queue(maxsize=max_queue)
+        self.results = queue.Queue()
+        self.pending = {}           # path -> (signature, first time the signature was seen)
+        self.queued = set()         # paths queued or being processed
+        self.in_flight = 0
+        self.processed = {}         # path -> signature of the processed version
+        self.failed = {}            # path -> signature of the version that failed
+        self.stats = {"processed": 0, "failed": 0, "last_latency": None, "mean_latency": None, "last_file": None, "last_error": None}
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._load_state()
+
+    def _load_state(self):
+        if os.path.exists(self.state_file):
+            try:
+                with open(self.state_file, "r", encoding="utf-8") as f:
+                    self.processed = {k: tuple(v) for k, v in json.load(f).items()}
+            except (OSError, ValueError) as e:
+                self.logger.warning(f"Could not read the watcher state {self.state_file}: {e}", title = "Watcher warning")
+        return None
+
+    def _save_state(self):
+        tmp_file = f"{self.state_file}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(self.processed, f)
+        os.replace(tmp_file, self.state_file)
+        return None
+
+    @staticmethod
+    def _signature(entry):
+        stat = entry.stat()
+        return (stat.st_mtime, stat.st_size)
+
+    def scan(self):
+        """Poll the folder once, and queue the new or changed PDF files whose signature is stable.
+
+        Returns:
+        --------
+        n : int
+            The number of files queued.
+        """
+        now = time.monotonic()
+        n = 0
+        try:
+            entries = [e for e in os.scandir(self.folder) if e.is_file() and e.name.lower().endswith(".pdf")]
+        except OSError as e:
+            self.logger.error(f"Could not scan the folder {self.folder}: {e}", title = "Watcher error")
+            return 0
+
+        for entry in entries:
+            path = entry.path
+            try:
+                signature = self._signature(entry)
+            except OSError:
+                continue
+            if path in self.queued or self.processed.get(path) == signature or self.failed.get(path) == signature:
+                self.pending.pop(path, None)
+                continue
+
+            previous = self.pending.get(path)
+            if previous is None or previous[0] != signature:
+                # New or still being written: wait until the signature is stable for the debounce delay
+                self.pending[path] = (signature, now)
+                continue
+            if now - previous[1] < self.debounce:
+                continue
+
+            try:
+                self.jobs.put_nowait((path, signature, time.monotonic()))
+            except queue.Full:
+                # Backpressure: keep the file pending, it will be queued on a next poll
+                break
+            del self.pending[path]
+            with self._lock:
+                self.queued.add(path)
+            n += 1
+            self.logger.log(f"File {path} queued for processing")
+        return n
+
+    def _worker(self):
+        while not self._stop.is_set():
+            try:
+                path, signature, queued_at = self.jobs.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            with self._lock:
+                self.in_flight += 1
+            result = process_one(path, mode = self.mode, **self.kwargs)
+            self.results.put((result, signature, queued_at))
+            with self._lock:
+                self.in_flight -= 1
+            self.jobs.task_done()
+        return None
+
+    def _write_results(self):
+        """Append the processed files to the workbook, from the watcher thread only."""
+        written = 0
+        while True:
+            try:
+                result, signature, queued_at = self.results.get_nowait()
+            except queue.Empty:
+                break
+            error = result.error
+            if result.ok:
+                try:
+                    result.summary.handle_errors = False
+                    result.summary.to_excel(self.dest_file)
+                    if self.overview and self.dest_file is not None:
+                        from src.overview import write_overview
+                        write_overview(self.dest_file, [result.summary], logger = self.logger)
+                except Exception as e:
+                    error = f"{type(e).__name__}: {e}"
+
+            latency = time.monotonic() - queued_at
+            with self._lock:
+                self.queued.discard(result.file)
+            if error is None:
+                self.processed[result.file] = signature
+                self._save_state()
+                self.stats["processed"] += 1
+                n = self.stats["processed"]
+                mean = self.stats["mean_latency"] or 0.0
+                self.stats["mean_latency"] = mean + (latency - mean) / n
+                self.logger.log(f"File {result.file} added to {self.dest_file} in {latency:.1f}s")
+            else:
+                # The failure is not saved in the state file: the file is retried when it changes or at the next start
+                self.failed[result.file] = signature
+                self.stats["failed"] += 1
+                self.stats["last_error"] = f"{result.file}: {error}"
+                self.logger.error(f"Error while processing {result.file}: {error}", title = "Watcher error")
+            self.stats["last_latency"] = latency
+            self.stats["last_file"] = result.file
+            written += 1
+        if written:
+            save_search_indexes()
+        return written
+
+    def write_status(self):
+        """Write the status file: queue depth, files in flight and pending, counters and latencies."""
+        with self._lock:
+            status = dict(self.stats)
+            status.update({
+                "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "folder": self.folder,
+                "queue_depth": self.jobs.qsize(),
+                "queue_size": self.jobs.maxsize,
+                "in_flight": self.in_flight,
+                "pending": len(self.pending),
+                "waiting_write": self.results.qsize(),
+            })
+        tmp_file = f"{self.status_file}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(status, f, indent=2)
+        os.replace(tmp_file, self.status_file)
+        return status
+
+    def run(self, max_polls = None):
+        """Run the watcher until stop is called, a KeyboardInterrupt is received or max_polls polls were done.
+
+        Parameters:
+        -----------
+        max_polls : int, optional
+            The number of polls to do before stopping (mainly for scripts and tests). If None, run forever.
+
+        Returns:
+        --------
+        None
+        """
+        self._stop.clear()
+        self._threads = [threading.Thread(target=self._worker, name=f"watcher-worker-{i}", daemon=True) for i in range(self.workers)]
+        for t in self._threads:
+            t.start()
+        self.logger.log(f"Watching {self.folder} with {self.workers} worker(s), polling every {self.poll_interval}s")
+
+        polls = 0
+        try:
+            while not self._stop.is_set():
+                self.scan()
+                self._write_results()
+                self.write_status()
+                polls += 1
+                if max_polls is not None and polls >= max_polls:
+                    break
+                self._stop.wait(self.poll_interval)
+        except KeyboardInterrupt:
+            self.logger.log("Watcher interrupted")
+        finally:
+            # A bounded run processes all the queued files, then the workers finish the files they have started
+            if max_polls is not None:
+                self.jobs.join()
+            self._stop.set()
+            for t in self._threads:
+                t.join()
+            self._write_results()
+            self.write_status()
+        return None
+
+    def stop(self):
+        """Ask the watcher to stop after the current poll."""
+        self._stop.set()
+        return None
+
+
+def watcher_main(argv = None):
+    """Command line entry point of the watch mode: python -m src.Monthly_Summary watch [folder] [options]."""
+    import argparse
+    parser = argparse.ArgumentParser(prog="watch", description="Watch a folder and add the new PDF bank statements to a workbook as they land")
+    parser.add_argument("folder", nargs="?", default="Data", help="The folder to watch")
+    parser.add_argument("--excel", type=str, help="The Excel workbook to add the months to")
+    parser.add_argument("--workers", type=int, default=2, help="The number of files processed in parallel")
+    parser.add_argument("--poll", type=float, default=5.0, help="The number of seconds between two polls")
+    parser.add_argument("--debounce", type=float, default=2.0, help="The number of seconds a file must be stable before being processed")
+    parser.add_argument("--max_queue", type=int, default=8, help="The maximum number of files waiting for a worker")
+    parser.add_argument("--status_file", type=str, help="The JSON status file")
+    parser.add_argument("--mode", type=str, default="text", choices=["text", "markdown", "auto"], help="The parsing mode (auto: text, then markdown if the balances do not reconcile)")
+    parser.add_argument("--overview", action="store_true", help="Update the overview sheet of the workbook")
+    parser.add_argument("--rules", type=str, help="The file containing the rules to categorize the operations")
+    parser.add_argument("--ledger", type=str, help="The SQLite ledger to write the operations to")
+    parser.add_argument("--index", type=str, help="The search index (.npz) to add the operations to")
+    parser.add_argument("--verbose", action="store_true", help="Print verbose messages")
+    parser.add_argument("--do_log", action="store_true", help="Log the messages")
+    args = parser.parse_args(argv)
+
+    watcher = Folder_Watcher(args.folder, dest_file = args.excel, workers = args.workers, poll_interval = args.poll,
+                             debounce = args.debounce, max_queue = args.max_queue, status_file = args.status_file,
+                             mode = args.mode, overview = args.overview, rules_file = args.rules, ledger_file = args.ledger, index_file = args.index,
+                             verbose = args.verbose, do_log = args.do_log)
+    watcher.run()
+    return 0